@@ -21,6 +21,9 @@ client.login(
     os.getenv("PLAYGROUND_DOCKER_LOGIN"),
     os.getenv("PLAYGROUND_DOCKER_PASSWORD"))
 
+# Keeps the agent containers warm from one battle to the next.
+container_pool = pommerman.agents.ContainerPool(client)
+
 game_directory = os.path.expanduser('~/battles')
 json_directory = os.path.join(game_directory, 'json')
 png_directory = os.path.join(game_directory, 'png')
@@ -112,9 +115,14 @@ class Battle(object):
         # At this point, we can assume that the containers have been pulled.
         # We now start the game, which notifies those containers to start the
         # agents and let us know they're ready.
-        agents = [
-            "docker::%s" % agent['docker_image'] for agent in self._agents
-        ]
+        images = [agent['docker_image'] for agent in self._agents]
+        # Have the containers started and pinged before the agents are made,
+        # those of an image all at once rather than one agent after another.
+        env_vars = pommerman.agents.DockerAgent.container_env_vars()
+        for docker_image in set(images):
+            container_pool.prewarm(docker_image, images.count(docker_image),
+                                   env_vars)
+        agents = ["docker::%s" % docker_image for docker_image in images]
         agents = ",".join(agents)
         args = Args(
             agents,
@@ -127,7 +135,8 @@ class Battle(object):
             do_sleep=False)
 
         seed = os.getenv("PLAYGROUND_GAME_SEED")
-        infos = pommerman.cli.run_battle.run(args, num_times=1, seed=seed)
+        infos = pommerman.cli.run_battle.run(
+            args, num_times=1, seed=seed, container_pool=container_pool)
         return infos[0]
 
     # TODO: Add logging in case the post fails.
@@ -328,6 +337,11 @@ class Args(object):
         self.config = config
         self.record_pngs_dir = record_pngs_dir
         self.record_json_dir = record_json_dir
+        # The games served to the website are in the legacy format.
+        self.legacy_json = True
+        self.record_replay_dir = None
+        self.board_analysis = False
+        self.concurrent_act = True
         self.agent_env_vars = agent_env_vars
         self.game_state_file = game_state_file
         self.render = render
@@ -2,12 +2,23 @@
 import gym
 import inspect
 from . import agents
+from . import batched_forward_model
+from . import board_analysis
+from . import board_pool
 from . import configs
 from . import constants
+from . import dataset
 from . import forward_model
+from . import game_state
 from . import helpers
+from . import observation_codec
+from . import recorder
+from . import replay
+from . import replay_archive
 from . import utility
 from . import network
+from . import vec_env
+from . import zobrist
 
 gym.logger.set_level(40)
 REGISTRY = None
@@ -49,4 +60,29 @@ def make(config_id, agent_list, game_state_file=None, render_mode='human'):
     return env
 
 
+def make_vec(config_id,
+             num_envs,
+             agent_factory,
+             render_mode='human',
+             num_workers=None):
+    '''Makes num_envs pommerman envs and steps them together in a VecEnv
+
+    Args:
+      config_id: The env_id of one of the configs in configs.py.
+      num_envs: How many envs to make.
+      agent_factory: A callable that returns a fresh agent_list for each env.
+      render_mode: The render mode of every env.
+      num_workers: If set, shard the envs over this many worker processes
+        with a SubprocVecEnv instead.
+    '''
+    if num_workers:
+        return vec_env.SubprocVecEnv(
+            config_id, num_envs, agent_factory, num_workers=num_workers)
+    envs = [
+        make(config_id, agent_factory(), render_mode=render_mode)
+        for _ in range(num_envs)
+    ]
+    return vec_env.VecEnv(envs)
+
+
 from . import cli
@@ -1,5 +1,6 @@
 '''Entry point into the agents module set'''
 from .base_agent import BaseAgent
+from .container_pool import ContainerPool
 from .docker_agent import DockerAgent
 from .http_agent import HttpAgent
 from .player_agent import PlayerAgent
@@ -31,5 +31,10 @@ class BaseAgent:
     def has_user_input():
         return False
 
+    @staticmethod
+    def is_remote():
+        '''Whether act waits on another process, e.g. over the network'''
+        return False
+
     def shutdown(self):
         pass
@@ -0,0 +1,211 @@
+'''A pool of warm agent containers for DockerAgent.
+
+Starting a DockerAgent's container and waiting for its /ping to answer takes
+seconds, and used to be paid by every agent of every battle. A ContainerPool
+keeps started and pinged containers around, per image and environment, and
+hands them to DockerAgents. When an agent shuts down, its container goes
+back to the pool instead of being removed. The next agent to get it resets
+it through the runner's /init_agent, as every agent does at the start of a
+game anyway. prewarm starts containers ahead of the agents that will get
+them, all at the same time rather than one agent after the other.
+
+Idle containers are removed once they have been idle for longer than ttl
+seconds, and the least recently used ones are removed when there are more
+than max_idle of them.
+'''
+from collections import OrderedDict
+from concurrent import futures
+import os
+import threading
+import time
+
+import docker
+import requests
+
+
+class WarmContainer(object):
+    """A started container serving an agent on a local port."""
+
+    def __init__(self, key, container, port):
+        self.key = key
+        self.container = container
+        self.port = port
+        self.last_used = time.time()
+
+    @property
+    def docker_image(self):
+        return self.key[0]
+
+
+class ContainerPool(object):
+    """Started and pinged agent containers, ready to be handed out.
+
+    Args:
+      docker_client: The docker client to start the containers with.
+        Defaults to docker.from_env().
+      ports: The local ports to give the containers. Defaults to 1000 ports
+        from 11000.
+      max_idle: The most idle containers to keep, over all images.
+      ttl: How many seconds a container may stay idle before it's removed.
+      ping_timeout: How many seconds to wait for a new container's /ping.
+    """
+
+    def __init__(self,
+                 docker_client=None,
+                 ports=None,
+                 max_idle=16,
+                 ttl=600,
+                 ping_timeout=32):
+        if docker_client is None:
+            docker_client = docker.from_env()
+            docker_client.login(
+                os.getenv("PLAYGROUND_DOCKER_LOGIN"),
+                os.getenv("PLAYGROUND_DOCKER_PASSWORD"))
+        self._docker_client = docker_client
+        self._free_ports = list(ports if ports is not None else range(
+            11000, 12000))
+        self.max_idle = max_idle
+        self.ttl = ttl
+        self.ping_timeout = ping_timeout
+        # The idle containers, least recently used first.
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(docker_image, env_vars):
+        return (docker_image, tuple(sorted((env_vars or {}).items())))
+
+    def _start(self, key):
+        '''Starts a container and waits for it to answer /ping'''
+        with self._lock:
+            if not self._free_ports:
+                raise RuntimeError("The container pool is out of ports")
+            port = self._free_ports.pop()
+        docker_image, env_vars = key
+        try:
+            container = self._docker_client.containers.run(
+                docker_image,
+                detach=True,
+                auto_remove=True,
+                ports={10080: port},
+                environment=dict(env_vars))
+        except docker.errors.APIError:
+            with self._lock:
+                self._free_ports.append(port)
+            raise
+
+        warm = WarmContainer(key, container, port)
+        if not self._ping(port):
+            self._remove(warm)
+            raise RuntimeError("Timed out - container of %s on port %d" %
+                               (docker_image, port))
+        return warm
+
+    def _ping(self, port):
+        '''Waits for /ping to answer. Returns whether it did in time'''
+        end = time.time() + self.ping_timeout
+        backoff = .25
+        request_url = 'http://localhost:%d/ping' % port
+        while time.time() < end:
+            try:
+                requests.get(request_url, timeout=1)
+                return True
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                backoff = min(16, backoff * 2)
+                time.sleep(min(backoff, max(0, end - time.time())))
+        return False
+
+    def _remove(self, warm):
+        '''Removes a container and frees its port'''
+        try:
+            warm.container.remove(force=True)
+        except docker.errors.APIError:
+            pass
+        with self._lock:
+            self._free_ports.append(warm.port)
+
+    def acquire(self, docker_image, env_vars=None):
+        """Returns a WarmContainer of the image, started if none is idle.
+
+        Args:
+          docker_image: The image to run.
+          env_vars: Dict of the environment variables of the container.
+        """
+        self.evict()
+        key = self._key(docker_image, env_vars)
+        with self._lock:
+            warm = None
+            for candidate in self._idle:
+                if candidate.key == key:
+                    warm = candidate
+                    break
+            if warm is not None:
+                del self._idle[warm]
+
+        if warm is not None and not self._ping(warm.port):
+            self._remove(warm)
+            warm = None
+        if warm is None:
+            warm = self._start(key)
+        warm.last_used = time.time()
+        return warm
+
+    def release(self, warm):
+        '''Puts a container back in the pool for the next agent'''
+        warm.last_used = time.time()
+        with self._lock:
+            self._idle[warm] = None
+        self.evict()
+
+    def prewarm(self, docker_image, count, env_vars=None):
+        """Starts containers until count of the image are idle.
+
+        The missing containers are started at the same time. If any of them
+        fails to start, the others are still pooled and the error is raised.
+
+        Args:
+          docker_image: The image to run.
+          count: How many idle containers of the image to have.
+          env_vars: Dict of the environment variables of the containers, as
+            the DockerAgents that will acquire them pass it.
+        """
+        key = self._key(docker_image, env_vars)
+        with self._lock:
+            idle = sum(1 for warm in self._idle if warm.key == key)
+        if count <= idle:
+            return
+        with futures.ThreadPoolExecutor(max_workers=count - idle) as executor:
+            started = [
+                executor.submit(self._start, key)
+                for _ in range(count - idle)
+            ]
+        error = None
+        for future in started:
+            try:
+                self.release(future.result())
+            except (docker.errors.APIError, RuntimeError) as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def evict(self):
+        '''Removes the containers idle for too long, or too many of them'''
+        now = time.time()
+        evicted = []
+        with self._lock:
+            for warm in list(self._idle):
+                if now - warm.last_used > self.ttl or \
+                   len(self._idle) > self.max_idle:
+                    del self._idle[warm]
+                    evicted.append(warm)
+        for warm in evicted:
+            self._remove(warm)
+
+    def close(self):
+        '''Removes all the idle containers'''
+        with self._lock:
+            evicted = list(self._idle)
+            self._idle.clear()
+        for warm in evicted:
+            self._remove(warm)
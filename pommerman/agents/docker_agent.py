@@ -7,8 +7,9 @@ import requests
 import docker
 
 from . import BaseAgent
-from .. import utility
 from .. import characters
+from .. import observation_codec
+from .. import utility
 
 
 class DockerAgent(BaseAgent):
@@ -20,12 +21,15 @@ class DockerAgent(BaseAgent):
                  server='http://localhost',
                  character=characters.Bomber,
                  docker_client=None,
-                 env_vars=None):
+                 env_vars=None,
+                 container_pool=None):
         super(DockerAgent, self).__init__(character)
 
         self._docker_image = docker_image
         self._docker_client = docker_client
-        if not self._docker_client:
+        self._container_pool = container_pool
+        self._warm_container = None
+        if not self._docker_client and not container_pool:
             self._docker_client = docker.from_env()
             self._docker_client.login(
                 os.getenv("PLAYGROUND_DOCKER_LOGIN"),
@@ -36,17 +40,23 @@ class DockerAgent(BaseAgent):
         self._port = port
         self._timeout = 32
         self._container = None
-        self._env_vars = env_vars or {}
-        # Pass env variables starting with DOCKER_AGENT to the container.
-        for key, value in os.environ.items():
-            if not key.startswith("DOCKER_AGENT_"):
-                continue
-            env_key = key.replace("DOCKER_AGENT_", "")
-            self._env_vars[env_key] = value
+        # One keep-alive connection for all the requests to the container.
+        self._session = requests.Session()
+        # Upgraded to 'binary' if the container's /ping says it takes it.
+        self._encoding = 'json'
+        self._env_vars = self.container_env_vars(env_vars)
 
         # Start the docker agent if it is on this computer. Otherwise, it's far
         # away and we need to tell that server to start it.
-        if 'localhost' in server:
+        if container_pool is not None:
+            assert 'localhost' in server
+            # A container that is already up, on a port the pool picked.
+            self._warm_container = container_pool.acquire(
+                docker_image, self._env_vars)
+            self._container = self._warm_container.container
+            self._port = self._warm_container.port
+            self._wait_for_docker()
+        elif 'localhost' in server:
             container_thread = threading.Thread(
                 target=self._run_container, daemon=True)
             container_thread.start()
@@ -93,7 +103,8 @@ class DockerAgent(BaseAgent):
                     raise
 
                 request_url = '%s:%s/ping' % (self._server, self._port)
-                req = requests.get(request_url)
+                req = self._session.get(request_url)
+                self._encoding = observation_codec.negotiate(req)
                 self._acknowledged = True
                 return True
             except requests.exceptions.ConnectionError as e:
@@ -112,7 +123,7 @@ class DockerAgent(BaseAgent):
         super(DockerAgent, self).init_agent(id, game_type)
         request_url = "http://localhost:{}/init_agent".format(self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -122,19 +133,34 @@ class DockerAgent(BaseAgent):
         except requests.exceptions.Timeout as e:
             print('Timeout in init_agent()!')
 
+    @staticmethod
+    def container_env_vars(env_vars=None):
+        '''Returns the environment of the container given env_vars'''
+        env_vars = dict(env_vars or {})
+        # Pass env variables starting with DOCKER_AGENT to the container.
+        for key, value in os.environ.items():
+            if not key.startswith("DOCKER_AGENT_"):
+                continue
+            env_key = key.replace("DOCKER_AGENT_", "")
+            env_vars[env_key] = value
+        return env_vars
+
+    @staticmethod
+    def is_remote():
+        return True
+
     def act(self, obs, action_space):
-        obs_serialized = json.dumps(obs, cls=utility.PommermanJSONEncoder)
+        # The shared BoardAnalysis and its danger map are local caches, not
+        # part of the observation that is sent.
+        obs = {
+            k: v
+            for k, v in obs.items()
+            if k not in observation_codec.LOCAL_ONLY_KEYS
+        }
         request_url = "http://localhost:{}/action".format(self._port)
         try:
-            req = requests.post(
-                request_url,
-                timeout=0.15,
-                json={
-                    "obs":
-                    obs_serialized,
-                    "action_space":
-                    json.dumps(action_space, cls=utility.PommermanJSONEncoder)
-                })
+            req = observation_codec.post(self._session, request_url, obs,
+                                         action_space, self._encoding)
             action = req.json()['action']
         except requests.exceptions.Timeout as e:
             print('Timeout!')
@@ -149,7 +175,7 @@ class DockerAgent(BaseAgent):
     def episode_end(self, reward):
         request_url = "http://localhost:{}/episode_end".format(self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -159,15 +185,26 @@ class DockerAgent(BaseAgent):
             print('Timeout in episode_end()!')
 
     def shutdown(self):
+        if self._warm_container is not None:
+            # Hand the container back. The next agent to get it resets it
+            # through init_agent.
+            self._session.close()
+            self._container_pool.release(self._warm_container)
+            self._warm_container = None
+            self._container = None
+            return True
+
         request_url = "http://localhost:{}/shutdown".format(self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={ })
         except requests.exceptions.Timeout as e:
             print('Timeout in shutdown()!')
 
+        self._session.close()
+
         print("Stopping container..")
         if self._container:
             try:
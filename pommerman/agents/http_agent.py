@@ -7,8 +7,9 @@ import threading
 import requests
 
 from . import BaseAgent
-from .. import utility
 from .. import characters
+from .. import observation_codec
+from .. import utility
 
 
 class HttpAgent(BaseAgent):
@@ -24,6 +25,10 @@ class HttpAgent(BaseAgent):
         self._port = port
         self._host = host
         self._timeout = timeout
+        # One keep-alive connection for all the requests to the remote agent.
+        self._session = requests.Session()
+        # Upgraded to 'binary' if the remote's /ping says it takes it.
+        self._encoding = 'json'
         super(HttpAgent, self).__init__(character)
         self._wait_for_remote()
 
@@ -45,7 +50,8 @@ class HttpAgent(BaseAgent):
                     raise
 
                 request_url = 'http://%s:%s/ping' % (self._host, self._port)
-                req = requests.get(request_url)
+                req = self._session.get(request_url)
+                self._encoding = observation_codec.negotiate(req)
                 self._acknowledged = True
                 return True
             except requests.exceptions.ConnectionError as e:
@@ -61,7 +67,7 @@ class HttpAgent(BaseAgent):
         super(HttpAgent, self).init_agent(id, game_type)
         request_url = "http://{}:{}/init_agent".format(self._host, self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -71,19 +77,22 @@ class HttpAgent(BaseAgent):
         except requests.exceptions.Timeout as e:
             print('Timeout in init_agent()!')
 
+    @staticmethod
+    def is_remote():
+        return True
+
     def act(self, obs, action_space):
-        obs_serialized = json.dumps(obs, cls=utility.PommermanJSONEncoder)
+        # The shared BoardAnalysis and its danger map are local caches, not
+        # part of the observation that is sent.
+        obs = {
+            k: v
+            for k, v in obs.items()
+            if k not in observation_codec.LOCAL_ONLY_KEYS
+        }
         request_url = "http://{}:{}/action".format(self._host, self._port)
         try:
-            req = requests.post(
-                request_url,
-                timeout=0.15,
-                json={
-                    "obs":
-                    obs_serialized,
-                    "action_space":
-                    json.dumps(action_space, cls=utility.PommermanJSONEncoder)
-                })
+            req = observation_codec.post(self._session, request_url, obs,
+                                         action_space, self._encoding)
             action = req.json()['action']
         except requests.exceptions.Timeout as e:
             print('Timeout!')
@@ -98,7 +107,7 @@ class HttpAgent(BaseAgent):
     def episode_end(self, reward):
         request_url = "http://{}:{}/episode_end".format(self._host, self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={
@@ -110,9 +119,10 @@ class HttpAgent(BaseAgent):
     def shutdown(self):
         request_url = "http://{}:{}/shutdown".format(self._host, self._port)
         try:
-            req = requests.post(
+            req = self._session.post(
                 request_url,
                 timeout=0.5,
                 json={ })
         except requests.exceptions.Timeout as e:
             print('Timeout in shutdown()!')
+        self._session.close()
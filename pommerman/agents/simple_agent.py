@@ -8,7 +8,9 @@ import random
 import numpy as np
 
 from . import BaseAgent
+from .. import board_analysis
 from .. import constants
+from .. import distance_field
 from .. import utility
 
 
@@ -28,25 +30,15 @@ class SimpleAgent(BaseAgent):
         self._prev_direction = None
 
     def act(self, obs, action_space):
-        def convert_bombs(bomb_map):
-            '''Flatten outs the bomb array'''
-            ret = []
-            locations = np.where(bomb_map > 0)
-            for r, c in zip(locations[0], locations[1]):
-                ret.append({
-                    'position': (r, c),
-                    'blast_strength': int(bomb_map[(r, c)])
-                })
-            return ret
-
+        analysis = board_analysis.BoardAnalysis.get(obs)
         my_position = tuple(obs['position'])
         board = np.array(obs['board'])
-        bombs = convert_bombs(np.array(obs['bomb_blast_strength']))
+        bombs = analysis.bombs
         enemies = [constants.Item(e) for e in obs['enemies']]
         ammo = int(obs['ammo'])
         blast_strength = int(obs['blast_strength'])
         items, dist, prev = self._djikstra(
-            board, my_position, bombs, enemies, depth=10)
+            board, my_position, bombs, enemies, depth=10, analysis=analysis)
 
         # Move if we are in an unsafe place.
         unsafe_directions = self._directions_in_range_of_bomb(
@@ -83,8 +75,8 @@ class SimpleAgent(BaseAgent):
         # Move towards a wooden wall if there is one within two reachable spaces and you have a bomb.
         direction = self._near_wood(my_position, items, dist, prev, 2)
         if direction is not None:
-            directions = self._filter_unsafe_directions(board, my_position,
-                                                        [direction], bombs)
+            directions = self._filter_unsafe_directions(
+                board, my_position, [direction], bombs, analysis)
             if directions:
                 return directions[0].value
 
@@ -94,9 +86,9 @@ class SimpleAgent(BaseAgent):
             constants.Action.Right, constants.Action.Up, constants.Action.Down
         ]
         valid_directions = self._filter_invalid_directions(
-            board, my_position, directions, enemies)
-        directions = self._filter_unsafe_directions(board, my_position,
-                                                    valid_directions, bombs)
+            board, my_position, directions, enemies, analysis)
+        directions = self._filter_unsafe_directions(
+            board, my_position, valid_directions, bombs, analysis)
         directions = self._filter_recently_visited(
             directions, my_position, self._recently_visited_positions)
         if len(directions) > 1:
@@ -112,7 +104,25 @@ class SimpleAgent(BaseAgent):
         return random.choice(directions).value
 
     @staticmethod
-    def _djikstra(board, my_position, bombs, enemies, depth=None, exclude=None):
+    def _djikstra(board,
+                  my_position,
+                  bombs,
+                  enemies,
+                  depth=None,
+                  exclude=None,
+                  analysis=None):
+        """Runs a BFS from my_position over the cells within depth.
+
+        The passable cells and the item positions come from analysis, a
+        BoardAnalysis of board, which is made if not given.
+
+        Returns:
+          items: Dict of Item to the positions within depth holding it.
+          dist: (size, size) array of distances from my_position. It is inf
+            for unreachable cells within depth and nan for cells outside it.
+          prev: (size, size) array of the flat index of each cell's
+            predecessor on a shortest path, see distance_field.
+        """
         assert (depth is not None)
 
         if exclude is None:
@@ -120,62 +130,33 @@ class SimpleAgent(BaseAgent):
                 constants.Item.Fog, constants.Item.Rigid, constants.Item.Flames
             ]
 
-        def out_of_range(p_1, p_2):
-            '''Determines if two points are out of rang of each other'''
-            x_1, y_1 = p_1
-            x_2, y_2 = p_2
-            return abs(y_2 - y_1) + abs(x_2 - x_1) > depth
-
-        items = defaultdict(list)
-        dist = {}
-        prev = {}
-        Q = queue.Queue()
-
+        # The cells within depth steps, minus the excluded ones. The range
+        # end is exclusive, so row and column my_x + depth are left out.
+        size = len(board)
         my_x, my_y = my_position
-        for r in range(max(0, my_x - depth), min(len(board), my_x + depth)):
-            for c in range(max(0, my_y - depth), min(len(board), my_y + depth)):
-                position = (r, c)
-                if any([
-                        out_of_range(my_position, position),
-                        utility.position_in_items(board, position, exclude),
-                ]):
-                    continue
-
-                prev[position] = None
-                item = constants.Item(board[position])
-                items[item].append(position)
-                
-                if position == my_position:
-                    Q.put(position)
-                    dist[position] = 0
-                else:
-                    dist[position] = np.inf
-
+        rows, cols = np.ogrid[:size, :size]
+        in_range = (rows >= max(0, my_x - depth)) & \
+            (rows < min(size, my_x + depth)) & \
+            (cols >= max(0, my_y - depth)) & \
+            (cols < min(size, my_y + depth)) & \
+            (abs(rows - my_x) + abs(cols - my_y) <= depth) & \
+            ~np.isin(board, [item.value for item in exclude])
+
+        if analysis is None:
+            analysis = board_analysis.BoardAnalysis(board, np.zeros_like(board),
+                                                    np.zeros_like(board))
+        items = analysis.items(in_range)
 
         for bomb in bombs:
             if bomb['position'] == my_position:
                 items[constants.Item.Bomb].append(my_position)
 
-        while not Q.empty():
-            position = Q.get()
-
-            if utility.position_is_passable(board, position, enemies):
-                x, y = position
-                val = dist[(x, y)] + 1
-                for row, col in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    new_position = (row + x, col + y)
-                    if new_position not in dist:
-                        continue
-
-                    if val < dist[new_position]:
-                        dist[new_position] = val
-                        prev[new_position] = position
-                        Q.put(new_position)
-                    elif (val == dist[new_position] and random.random() < .5):
-                        dist[new_position] = val
-                        prev[new_position] = position   
-
-
+        dist, prev = distance_field.distance_field(
+            analysis.passable(enemies),
+            my_position,
+            reachable=in_range,
+            tie_break=lambda: random.random() < .5)
+        dist[~in_range] = np.nan
         return items, dist, prev
 
     def _directions_in_range_of_bomb(self, board, my_position, bombs, dist):
@@ -184,8 +165,8 @@ class SimpleAgent(BaseAgent):
         x, y = my_position
         for bomb in bombs:
             position = bomb['position']
-            distance = dist.get(position)
-            if distance is None:
+            distance = dist[position]
+            if np.isnan(distance):
                 continue
 
             bomb_range = bomb['blast_strength']
@@ -360,7 +341,7 @@ class SimpleAgent(BaseAgent):
     @staticmethod
     def _nearest_position(dist, objs, items, radius):
         nearest = None
-        dist_to = max(dist.values())
+        dist_to = np.nanmax(dist)
 
         for obj in objs:
             for position in items.get(obj, []):
@@ -376,11 +357,7 @@ class SimpleAgent(BaseAgent):
         if not position:
             return None
 
-        next_position = position
-        while prev[next_position] != my_position:
-            next_position = prev[next_position]
-
-        return utility.get_direction(my_position, next_position)
+        return distance_field.path_direction(prev, my_position, position)
 
     @classmethod
     def _near_enemy(cls, my_position, items, dist, prev, enemies, radius):
@@ -407,21 +384,38 @@ class SimpleAgent(BaseAgent):
                                                    nearest_item_position, prev)
 
     @staticmethod
-    def _filter_invalid_directions(board, my_position, directions, enemies):
+    def _filter_invalid_directions(board,
+                                   my_position,
+                                   directions,
+                                   enemies,
+                                   analysis=None):
+        if analysis is not None:
+            passable = analysis.passable(enemies)
+        else:
+            passable = utility.passable_mask(board, enemies)
         ret = []
         for direction in directions:
             position = utility.get_next_position(my_position, direction)
-            if utility.position_on_board(
-                    board, position) and utility.position_is_passable(
-                        board, position, enemies):
+            if utility.position_on_board(board, position) and \
+               passable[position]:
                 ret.append(direction)
         return ret
 
     @staticmethod
-    def _filter_unsafe_directions(board, my_position, directions, bombs):
+    def _filter_unsafe_directions(board,
+                                  my_position,
+                                  directions,
+                                  bombs,
+                                  analysis=None):
         ret = []
         for direction in directions:
-            x, y = utility.get_next_position(my_position, direction)
+            position = utility.get_next_position(my_position, direction)
+            if analysis is not None:
+                if not analysis.in_bomb_range(position):
+                    ret.append(direction)
+                continue
+
+            x, y = position
             is_bad = False
             for bomb in bombs:
                 bomb_x, bomb_y = bomb['position']
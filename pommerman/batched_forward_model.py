@@ -0,0 +1,588 @@
+'''Module to advance many games at once with array-backed state.
+
+The BatchedForwardModel mirrors ForwardModel.step, but instead of walking
+lists of Bomber, Bomb and Flame objects for a single game it holds N games as
+stacked NumPy arrays and advances all of them with one call. The rules are
+applied entity by entity in the same order as ForwardModel.step so that the
+collision, crossing, kick and bounce-back resolution give identical results,
+but every operation is vectorized across the batch dimension.
+'''
+import numpy as np
+
+from . import constants
+from . import game_state
+from . import utility
+
+# Lookup tables indexed by board value.
+_IS_WALL = np.zeros(256, dtype=bool)
+_IS_WALL[[constants.Item.Rigid.value, constants.Item.Wood.value]] = True
+_IS_POWERUP = np.zeros(256, dtype=bool)
+_IS_POWERUP[[
+    constants.Item.ExtraBomb.value, constants.Item.IncrRange.value,
+    constants.Item.Kick.value
+]] = True
+
+# The life a new flame starts with. Flames are stored as a bitmask per cell
+# where bit k is set if a flame with life k covers that cell. This is needed
+# because several flames of different ages can share a cell.
+_NEW_FLAME_BIT = 1 << 2
+
+
+class BatchedForwardModel(object):
+    """Holds N games as arrays and steps all of them in a single call.
+
+    Board state:
+      board: (N, size, size) uint8 array of Item values.
+      items: (N, size, size) uint8 array of the powerups hidden under wood
+        (0 when there is none).
+      flames: (N, size, size) uint8 bitmask of the flame lives on each cell.
+      step_count: (N,) array with the number of steps taken in each game.
+
+    Agent table, indexed by game and agent_id:
+      agent_position: (N, num_agents, 2), agent_alive, agent_ammo,
+        agent_blast_strength and agent_can_kick.
+
+    Bomb table, indexed by game and slot. Slots [0, bomb_count) hold the live
+    bombs in the same order as the bomb list of ForwardModel:
+      bomb_count, bomb_position: (N, max_bombs, 2), bomb_life,
+      bomb_blast_strength, bomb_bomber (agent_id) and bomb_moving_direction
+      (an Action value, 0 when the bomb is not moving).
+    """
+
+    def __init__(self,
+                 num_games,
+                 board_size,
+                 num_agents=4,
+                 max_blast_strength=10,
+                 max_bombs=None):
+        self.num_games = num_games
+        self.board_size = board_size
+        self.num_agents = num_agents
+        self.max_blast_strength = max_blast_strength
+        # There can never be more than one bomb per cell.
+        self.max_bombs = max_bombs or board_size**2
+
+        shape = (num_games, board_size, board_size)
+        self.board = np.zeros(shape, dtype=np.uint8)
+        self.items = np.zeros(shape, dtype=np.uint8)
+        self.flames = np.zeros(shape, dtype=np.uint8)
+        self.step_count = np.zeros(num_games, dtype=np.int64)
+
+        agents = (num_games, num_agents)
+        self.agent_position = np.zeros(agents + (2,), dtype=np.int64)
+        self.agent_alive = np.zeros(agents, dtype=bool)
+        self.agent_ammo = np.zeros(agents, dtype=np.int64)
+        self.agent_blast_strength = np.zeros(agents, dtype=np.int64)
+        self.agent_can_kick = np.zeros(agents, dtype=bool)
+
+        bombs = (num_games, self.max_bombs)
+        self.bomb_count = np.zeros(num_games, dtype=np.int64)
+        self.bomb_position = np.zeros(bombs + (2,), dtype=np.int64)
+        self.bomb_life = np.zeros(bombs, dtype=np.int64)
+        self.bomb_blast_strength = np.zeros(bombs, dtype=np.int64)
+        self.bomb_bomber = np.zeros(bombs, dtype=np.int64)
+        self.bomb_moving_direction = np.zeros(bombs, dtype=np.int64)
+
+    def set_state(self, index, state):
+        """Loads games from a GameState with the same dimensions.
+
+        Args:
+          index: Which of the N games to overwrite. Anything that indexes the
+            batch dimension works, e.g. a slice to load the state into many
+            games at once.
+          state: The GameState to load.
+        """
+        assert state.board_size == self.board_size
+        assert state.num_agents == self.num_agents
+        assert state.max_bombs == self.max_bombs
+        for name in game_state.FIELDS:
+            getattr(self, name)[index] = getattr(state, name)
+
+    def get_state(self, index):
+        '''Returns one game as a new GameState'''
+        return self.get_states([index])[0]
+
+    def get_states(self, indices=None):
+        """Returns games as new GameStates.
+
+        Args:
+          indices: Which games to return. Defaults to all of them.
+
+        Returns:
+          A list of GameStates. They are backed by one shared array so that
+          this takes a single copy per field rather than per game.
+        """
+        if indices is None:
+            indices = np.arange(self.num_games)
+        records = np.zeros(
+            len(indices),
+            dtype=game_state.state_dtype(self.board_size, self.num_agents,
+                                         self.max_bombs))
+        for name in game_state.FIELDS:
+            records[name] = getattr(self, name)[indices]
+        return [
+            game_state.GameState(self.board_size, self.num_agents,
+                                 self.max_bombs, records[num, ...])
+            for num in range(len(indices))
+        ]
+
+    def set_game(self, index, board, agents, bombs, items, flames,
+                 step_count=0):
+        """Loads one game from the object representation used by ForwardModel.
+
+        Args:
+          index: Which of the N games to overwrite.
+          board: The board array.
+          agents: The list of agents, ordered by agent_id.
+          bombs: The list of Bomb objects.
+          items: Dict of position to the Item value hidden there.
+          flames: The list of Flame objects.
+          step_count: The number of steps taken so far in this game.
+        """
+        assert len(agents) == self.num_agents
+        self.set_state(
+            index,
+            game_state.GameState.from_game(board, agents, bombs, items, flames,
+                                           step_count, self.max_bombs))
+
+    def get_game(self, index, agents):
+        """Writes one game back into the object representation.
+
+        Args:
+          index: Which of the N games to read.
+          agents: The agents to write the agent state into, ordered by
+            agent_id. They are also used as the bombers of the bombs.
+
+        Returns:
+          The same (board, agents, bombs, items, flames) tuple that
+          ForwardModel.step returns.
+        """
+        return self.get_state(index).to_game(agents)
+
+    def _next_position(self, position, direction):
+        '''Returns the flat next position and whether it is on the board.'''
+        size = self.board_size
+        row = position // size + utility.ACTION_DELTAS[direction, 0]
+        col = position % size + utility.ACTION_DELTAS[direction, 1]
+        on_board = (row >= 0) & (row < size) & (col >= 0) & (col < size)
+        return np.where(on_board, row * size + col, position), on_board
+
+    @staticmethod
+    def _crossing(current, desired, size):
+        '''Returns an id for the border crossed moving current -> desired.'''
+        current_x, current_y = current // size, current % size
+        desired_x, desired_y = desired // size, desired % size
+        return np.where(current_x != desired_x,
+                        np.minimum(current_x, desired_x) * size + current_y,
+                        size * size + current_x * size +
+                        np.minimum(current_y, desired_y))
+
+    def step(self, actions):
+        """Advances every game by one step in place.
+
+        Args:
+          actions: (N, num_agents) array of Action values. Actions of dead
+            agents are ignored.
+        """
+        num_games, size = self.num_games, self.board_size
+        num_agents = self.num_agents
+        actions = np.asarray(actions, dtype=np.int64).reshape(
+            num_games, num_agents)
+        if np.any((actions < 0) | (actions >= len(constants.Action))):
+            raise constants.InvalidAction(
+                "We did not receive a valid action: ", actions)
+
+        games = np.arange(num_games)
+        board = self.board.reshape(num_games, -1)
+        items = self.items.reshape(num_games, -1)
+        flames = self.flames.reshape(num_games, -1)
+        passage = constants.Item.Passage.value
+        flames_value = constants.Item.Flames.value
+
+        # Tick the flames. Replace any dead ones with passages. If there is an
+        # item there, then reveal that item.
+        dying = (flames & 1).astype(bool)
+        board[dying] = np.where(items[dying] != 0, items[dying], passage)
+        items[dying] = 0
+        flames >>= 1
+
+        # Redraw all current flames.
+        board[flames != 0] = flames_value
+
+        # Figure out desired next position for alive agents.
+        alive = self.agent_alive
+        agent_position = self.agent_position[..., 0] * size + \
+                         self.agent_position[..., 1]
+        agent_desired = agent_position.copy()
+        alive_games, alive_agents = np.nonzero(alive)
+        board[alive_games, agent_position[alive]] = passage
+
+        bomb_slots = np.arange(self.max_bombs)
+        bomb_active = bomb_slots < self.bomb_count[:, None]
+        bomb_position = self.bomb_position[..., 0] * size + \
+                        self.bomb_position[..., 1]
+        is_on_bomb = ((bomb_position[:, :, None] == agent_position[:, None, :])
+                      & bomb_active[:, :, None]).any(axis=1)
+
+        lays_bomb = alive & (actions == constants.Action.Bomb.value) & \
+                    ~is_on_bomb & (self.agent_ammo > 0)
+        for agent_id in range(num_agents):
+            lay = np.nonzero(lays_bomb[:, agent_id])[0]
+            if not len(lay):
+                continue
+            slot = self.bomb_count[lay]
+            assert np.all(slot < self.max_bombs)
+            self.agent_ammo[lay, agent_id] -= 1
+            bomb_position[lay, slot] = agent_position[lay, agent_id]
+            self.bomb_life[lay, slot] = constants.DEFAULT_BOMB_LIFE + 1
+            self.bomb_blast_strength[lay, slot] = \
+                self.agent_blast_strength[lay, agent_id]
+            self.bomb_bomber[lay, slot] = agent_id
+            self.bomb_moving_direction[lay, slot] = 0
+            self.bomb_count[lay] += 1
+
+        moves = alive & (actions >= constants.Action.Up.value) & \
+                (actions <= constants.Action.Right.value)
+        next_position, on_board = self._next_position(agent_position, actions)
+        valid = moves & on_board & \
+                ~_IS_WALL[board[games[:, None], next_position]]
+        agent_desired[valid] = next_position[valid]
+
+        # Gather desired next positions for moving bombs. Handle kicks later.
+        bomb_active = bomb_slots < self.bomb_count[:, None]
+        num_bomb_slots = int(self.bomb_count.max()) if num_games else 0
+        bomb_games, _ = np.nonzero(bomb_active)
+        board[bomb_games, bomb_position[bomb_active]] = passage
+
+        bomb_direction = self.bomb_moving_direction
+        bomb_desired = bomb_position.copy()
+        next_position, on_board = self._next_position(bomb_position,
+                                                      bomb_direction)
+        next_value = board[games[:, None], next_position]
+        valid = bomb_active & (bomb_direction != 0) & on_board & \
+                ~_IS_POWERUP[next_value] & ~_IS_WALL[next_value]
+        bomb_desired[valid] = next_position[valid]
+
+        # Position switches:
+        # Agent <-> Agent => revert both to previous position.
+        # Bomb <-> Bomb => revert both to previous position.
+        # Agent <-> Bomb => revert Bomb to previous position.
+        # Crossings are stored as the agent_id, or num_agents + bomb slot.
+        crossings = np.full((num_games, 2 * size * size), -1, dtype=np.int64)
+        for agent_id in range(num_agents):
+            desired = agent_desired[:, agent_id]
+            current = agent_position[:, agent_id]
+            border = self._crossing(current, desired, size)
+            crossing = crossings[games, border]
+            moving = alive[:, agent_id] & (desired != current)
+            # Crossed another agent - revert both to prior positions.
+            crossed = np.nonzero(moving & (crossing >= 0))[0]
+            other = crossing[crossed]
+            agent_desired[crossed, agent_id] = current[crossed]
+            agent_desired[crossed, other] = agent_position[crossed, other]
+            free = moving & (crossing < 0)
+            crossings[games[free], border[free]] = agent_id
+
+        for slot in range(num_bomb_slots):
+            desired = bomb_desired[:, slot]
+            current = bomb_position[:, slot]
+            border = self._crossing(current, desired, size)
+            crossing = crossings[games, border]
+            moving = bomb_active[:, slot] & (desired != current)
+            # Crossed - revert to prior position.
+            crossed = np.nonzero(moving & (crossing >= 0))[0]
+            bomb_desired[crossed, slot] = current[crossed]
+            # Crossed bomb - revert that to prior position as well.
+            other = crossing[crossed] - num_agents
+            crossed, other = crossed[other >= 0], other[other >= 0]
+            bomb_desired[crossed, other] = bomb_position[crossed, other]
+            free = moving & (crossing < 0)
+            crossings[games[free], border[free]] = num_agents + slot
+
+        # Deal with multiple agents or multiple bomb collisions on desired next
+        # position by resetting desired position to current position for
+        # everyone involved in the collision.
+        agent_occupancy = np.zeros((num_games, size * size), dtype=np.int64)
+        bomb_occupancy = np.zeros((num_games, size * size), dtype=np.int64)
+        np.add.at(agent_occupancy, (alive_games, agent_desired[alive]), 1)
+        np.add.at(bomb_occupancy, (bomb_games, bomb_desired[bomb_active]), 1)
+
+        # Resolve >=2 agents or >=2 bombs trying to occupy the same space.
+        change = np.ones(num_games, dtype=bool)
+        while change.any():
+            changed = np.zeros(num_games, dtype=bool)
+            for agent_id in range(num_agents):
+                desired = agent_desired[:, agent_id]
+                current = agent_position[:, agent_id]
+                revert = change & alive[:, agent_id] & (desired != current) & (
+                    (agent_occupancy[games, desired] > 1) |
+                    (bomb_occupancy[games, desired] > 1))
+                reverted = np.nonzero(revert)[0]
+                agent_desired[reverted, agent_id] = current[reverted]
+                agent_occupancy[reverted, current[reverted]] += 1
+                changed |= revert
+
+            for slot in range(num_bomb_slots):
+                desired = bomb_desired[:, slot]
+                current = bomb_position[:, slot]
+                revert = change & bomb_active[:, slot] & (desired != current) & (
+                    (bomb_occupancy[games, desired] > 1) |
+                    (agent_occupancy[games, desired] > 1))
+                reverted = np.nonzero(revert)[0]
+                bomb_desired[reverted, slot] = current[reverted]
+                bomb_occupancy[reverted, current[reverted]] += 1
+                changed |= revert
+            change = changed
+
+        # Handle kicks. The delayed updates hold the position to move back to
+        # or -1 when there is none.
+        agent_indexed_by_kicked_bomb = np.full(
+            (num_games, self.max_bombs), -1, dtype=np.int64)
+        kicked_bomb_indexed_by_agent = np.full(
+            (num_games, num_agents), -1, dtype=np.int64)
+        delayed_bomb_updates = np.full(
+            (num_games, self.max_bombs), -1, dtype=np.int64)
+        delayed_agent_updates = np.full(
+            (num_games, num_agents), -1, dtype=np.int64)
+
+        # Loop through all bombs to see if they need a good kicking or cause
+        # collisions with an agent.
+        for slot in range(num_bomb_slots):
+            desired = bomb_desired[:, slot]
+            current = bomb_position[:, slot]
+            agent_list = alive & (agent_desired == desired[:, None])
+            has_agent = bomb_active[:, slot] & \
+                        (agent_occupancy[games, desired] != 0) & \
+                        agent_list.any(axis=1)
+            agent_id = agent_list.argmax(axis=1)
+            agent_current = agent_position[games, agent_id]
+
+            # Agent did not move, but the bomb did. Revert and stop the bomb.
+            still = has_agent & (desired == agent_current)
+            bounce = still & (desired != current)
+            delayed_bomb_updates[bounce, slot] = current[bounce]
+
+            moved = has_agent & (desired != agent_current)
+            can_kick = self.agent_can_kick[games, agent_id]
+            direction = actions[games, agent_id]
+            target, on_board = self._next_position(desired, direction)
+            target_value = board[games, target]
+            kicked = moved & can_kick & on_board & \
+                     (agent_occupancy[games, target] == 0) & \
+                     (bomb_occupancy[games, target] == 0) & \
+                     ~_IS_POWERUP[target_value] & ~_IS_WALL[target_value]
+            blocked = moved & ~kicked
+            delayed_bomb_updates[blocked, slot] = current[blocked]
+            delayed_agent_updates[games[blocked], agent_id[blocked]] = \
+                agent_current[blocked]
+
+            kicked = np.nonzero(kicked)[0]
+            bomb_occupancy[kicked, desired[kicked]] = 0
+            delayed_bomb_updates[kicked, slot] = target[kicked]
+            agent_indexed_by_kicked_bomb[kicked, slot] = agent_id[kicked]
+            kicked_bomb_indexed_by_agent[kicked, agent_id[kicked]] = slot
+            bomb_direction[kicked, slot] = direction[kicked]
+
+        delayed = delayed_bomb_updates >= 0
+        bomb_desired[delayed] = delayed_bomb_updates[delayed]
+        np.add.at(bomb_occupancy,
+                  (np.nonzero(delayed)[0], delayed_bomb_updates[delayed]), 1)
+        change = delayed.any(axis=1)
+
+        delayed = delayed_agent_updates >= 0
+        agent_desired[delayed] = delayed_agent_updates[delayed]
+        np.add.at(agent_occupancy,
+                  (np.nonzero(delayed)[0], delayed_agent_updates[delayed]), 1)
+        change |= delayed.any(axis=1)
+
+        while change.any():
+            changed = np.zeros(num_games, dtype=bool)
+            for agent_id in range(num_agents):
+                desired = agent_desired[:, agent_id]
+                current = agent_position[:, agent_id]
+                # Agents and bombs can only share a square if they are both in
+                # their original position (Agent dropped bomb and has not
+                # moved).
+                revert = change & alive[:, agent_id] & (desired != current) & (
+                    (agent_occupancy[games, desired] > 1) |
+                    (bomb_occupancy[games, desired] != 0))
+                # Late collisions resulting from failed kicks force this agent
+                # to stay at the original position. Undo its kick.
+                slot = kicked_bomb_indexed_by_agent[:, agent_id]
+                undo = np.nonzero(revert & (slot >= 0))[0]
+                slot = slot[undo]
+                bomb_desired[undo, slot] = bomb_position[undo, slot]
+                bomb_occupancy[undo, bomb_position[undo, slot]] += 1
+                agent_indexed_by_kicked_bomb[undo, slot] = -1
+                kicked_bomb_indexed_by_agent[undo, agent_id] = -1
+
+                reverted = np.nonzero(revert)[0]
+                agent_desired[reverted, agent_id] = current[reverted]
+                agent_occupancy[reverted, current[reverted]] += 1
+                changed |= revert
+
+            for slot in range(num_bomb_slots):
+                desired = bomb_desired[:, slot]
+                current = bomb_position[:, slot]
+                kicker = agent_indexed_by_kicked_bomb[:, slot]
+                # This bomb may be a boomerang, i.e. it was kicked back to the
+                # original location it moved from. If it is blocked now, it
+                # can't be kicked and the agent needs to move back to stay
+                # consistent with other movements.
+                revert = change & bomb_active[:, slot] & \
+                         ((desired != current) | (kicker >= 0)) & (
+                             (bomb_occupancy[games, desired] > 1) |
+                             (agent_occupancy[games, desired] != 0))
+                reverted = np.nonzero(revert)[0]
+                bomb_desired[reverted, slot] = current[reverted]
+                bomb_occupancy[reverted, current[reverted]] += 1
+
+                undo = np.nonzero(revert & (kicker >= 0))[0]
+                agent_id = kicker[undo]
+                agent_current = agent_position[undo, agent_id]
+                agent_desired[undo, agent_id] = agent_current
+                agent_occupancy[undo, agent_current] += 1
+                kicked_bomb_indexed_by_agent[undo, agent_id] = -1
+                agent_indexed_by_kicked_bomb[undo, slot] = -1
+                changed |= revert
+            change = changed
+
+        # Bombs that were not kicked this turn and stay at their current
+        # location are stopped in case they were moving before.
+        stop = bomb_active & (bomb_desired == bomb_position) & \
+               (agent_indexed_by_kicked_bomb < 0)
+        bomb_direction[stop] = 0
+        bomb_position = np.where(bomb_active, bomb_desired, bomb_position)
+
+        moved = alive & (agent_desired != agent_position)
+        agent_position = np.where(moved, agent_desired, agent_position)
+        picked_up = np.where(moved, board[games[:, None], agent_position],
+                             passage)
+        self._pick_up(picked_up)
+
+        # Explode bombs.
+        self.bomb_life[bomb_active] -= 1
+        exploded = bomb_active & ((self.bomb_life == 0) | (
+            board[games[:, None], bomb_position] == flames_value))
+        self.bomb_life[exploded] = 0
+
+        # Chain the explosions.
+        exploded_map = np.zeros((num_games, size, size), dtype=bool)
+        new_explosions = exploded
+        while new_explosions.any():
+            self._explode(new_explosions, bomb_position, exploded_map)
+            in_range = bomb_active & ~exploded & exploded_map.reshape(
+                num_games, -1)[games[:, None], bomb_position]
+            self.bomb_life[in_range] = 0
+            exploded |= in_range
+            new_explosions = in_range
+
+        # Keep the remaining bombs packed at the front in their list order.
+        remaining = bomb_active & ~exploded
+        order = np.argsort(~remaining, axis=1, kind='stable')
+        self.bomb_count[:] = remaining.sum(axis=1)
+        # Clear the freed slots so that equal games have equal bomb tables.
+        remaining = bomb_slots < self.bomb_count[:, None]
+        bomb_position = np.take_along_axis(bomb_position, order, axis=1)
+        bomb_position[~remaining] = 0
+        for table in [
+                self.bomb_life, self.bomb_blast_strength, self.bomb_bomber,
+                self.bomb_moving_direction
+        ]:
+            table[:] = np.take_along_axis(table, order, axis=1)
+            table[~remaining] = 0
+        self.bomb_position[..., 0] = bomb_position // size
+        self.bomb_position[..., 1] = bomb_position % size
+
+        # Update the board's bombs.
+        board[np.nonzero(remaining)[0], bomb_position[remaining]] = \
+            constants.Item.Bomb.value
+
+        # Update the board's flames.
+        self.flames[exploded_map] |= _NEW_FLAME_BIT
+        board[flames != 0] = flames_value
+
+        # Kill agents on flames. Otherwise, update position on the board.
+        on_flames = board[games[:, None], agent_position] == flames_value
+        self.agent_alive &= ~on_flames
+        standing = alive & ~on_flames
+        board[np.nonzero(standing)[0], agent_position[standing]] = \
+            constants.Item.Agent0.value + np.nonzero(standing)[1]
+
+        self.agent_position[..., 0] = agent_position // size
+        self.agent_position[..., 1] = agent_position % size
+        self.step_count += 1
+
+    def _pick_up(self, values):
+        '''Applies the powerups in values (N, num_agents) to the agents.'''
+        extra_bomb = values == constants.Item.ExtraBomb.value
+        self.agent_ammo[extra_bomb] = np.minimum(
+            self.agent_ammo[extra_bomb] + 1, 10)
+        incr_range = values == constants.Item.IncrRange.value
+        self.agent_blast_strength[incr_range] = np.minimum(
+            self.agent_blast_strength[incr_range] + 1, self.max_blast_strength)
+        self.agent_can_kick[values == constants.Item.Kick.value] = True
+
+    def _explode(self, exploding, bomb_position, exploded_map):
+        '''Gives the bombers their ammo back and marks the blasts.'''
+        size = self.board_size
+        games, slots = np.nonzero(exploding)
+        bomber = self.bomb_bomber[games, slots]
+        count = np.zeros((self.num_games, self.num_agents), dtype=np.int64)
+        np.add.at(count, (games, bomber), 1)
+        self.agent_ammo[:] = np.where(
+            count > 0, np.minimum(self.agent_ammo + count, 10),
+            self.agent_ammo)
+
+        position = bomb_position[games, slots]
+        row, col = position // size, position % size
+        blast_strength = self.bomb_blast_strength[games, slots]
+        exploded_map[games, row, col] = True
+        for d_row, d_col in utility.ACTION_DELTAS[1:5]:
+            spreading = np.ones(len(games), dtype=bool)
+            for distance in range(1, int(blast_strength.max(initial=0))):
+                r, c = row + d_row * distance, col + d_col * distance
+                spreading &= (distance < blast_strength) & (r >= 0) & \
+                             (r < size) & (c >= 0) & (c < size)
+                value = self.board[games, np.clip(r, 0, size - 1),
+                                   np.clip(c, 0, size - 1)]
+                spreading &= value != constants.Item.Rigid.value
+                exploded_map[games[spreading], r[spreading],
+                             c[spreading]] = True
+                spreading &= value != constants.Item.Wood.value
+
+    def get_rewards(self, game_type, max_steps):
+        """Returns the (N, num_agents) rewards, as ForwardModel.get_rewards."""
+        alive = self.agent_alive
+        num_alive = alive.sum(axis=1)
+        over = (self.step_count >= max_steps)[:, None]
+        rewards = np.zeros(alive.shape, dtype=np.int64)
+        if game_type in [constants.GameType.FFA, constants.GameType.OneVsOne]:
+            won = (num_alive == 1)[:, None]
+            rewards = np.where(won, 2 * alive - 1, np.where(over, -1, 0))
+            if game_type == constants.GameType.FFA:
+                running = ~won & ~over
+                rewards = np.where(running, alive.astype(np.int64) - 1,
+                                   rewards)
+            return rewards
+
+        # We are playing a team game.
+        team_a = alive[:, [0, 2]].any(axis=1)
+        team_b = alive[:, [1, 3]].any(axis=1)
+        a_wins = (team_a & ~team_b)[:, None]
+        b_wins = (team_b & ~team_a)[:, None]
+        tie = over | (num_alive == 0)[:, None]
+        rewards = np.where(tie, -1, rewards)
+        rewards = np.where(b_wins, [-1, 1, -1, 1], rewards)
+        rewards = np.where(a_wins, [1, -1, 1, -1], rewards)
+        return rewards
+
+    def get_done(self, game_type, max_steps):
+        """Returns the (N,) done flags, as ForwardModel.get_done."""
+        alive = self.agent_alive
+        done = self.step_count >= max_steps
+        if game_type in [constants.GameType.FFA, constants.GameType.OneVsOne]:
+            return done | (alive.sum(axis=1) <= 1)
+        team_a = alive[:, [0, 2]].any(axis=1)
+        team_b = alive[:, [1, 3]].any(axis=1)
+        return done | ~(team_a & team_b)
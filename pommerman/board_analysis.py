@@ -0,0 +1,144 @@
+'''Module for the per-step facts about a board that the agents share.
+
+Every SimpleAgent used to flatten the bomb layer into a list and work out
+which cells are passable, which are in range of a bomb and where each item
+lies from its own observation, although all the agents of a fully observable
+game see the same board. The analysis also holds the flame_time danger map,
+see blast.flame_time. A BoardAnalysis does this once per observed board.
+With Pomme.set_board_analysis(True), the env makes one per step and attaches
+it to the observations under 'board_analysis'. In partially observable games
+every agent sees a different board, so every agent gets its own.
+
+Each part is only computed when it is first used and then cached.
+'''
+from collections import defaultdict
+
+import numpy as np
+
+from . import blast
+from . import constants
+from . import utility
+
+
+class BoardAnalysis(object):
+    """Cached facts about one observed board.
+
+    Args:
+      board: The observed board array.
+      bomb_blast_strength: The observed bomb blast strength layer.
+      bomb_life: The observed bomb life layer.
+    """
+
+    def __init__(self, board, bomb_blast_strength, bomb_life):
+        # Copies, as the agents are free to mutate their observations.
+        self.board = np.array(board)
+        self.bomb_blast_strength = np.array(bomb_blast_strength)
+        self.bomb_life = np.array(bomb_life)
+        self._bombs = None
+        self._bomb_range = None
+        self._flame_time = None
+        self._item_cells = None
+        self._passable = {}
+
+    @classmethod
+    def from_observation(cls, obs):
+        '''Analyzes the board of an observation'''
+        return cls(obs['board'], obs['bomb_blast_strength'], obs['bomb_life'])
+
+    @classmethod
+    def get(cls, obs):
+        '''Returns the analysis attached to obs, or makes one from it'''
+        analysis = obs.get('board_analysis')
+        if analysis is None:
+            analysis = cls.from_observation(obs)
+        return analysis
+
+    @property
+    def bombs(self):
+        '''The bombs as a list of dicts with position and blast_strength'''
+        if self._bombs is None:
+            rows, cols = np.nonzero(self.bomb_blast_strength > 0)
+            self._bombs = [{
+                'position': (r, c),
+                'blast_strength': int(self.bomb_blast_strength[r, c])
+            } for r, c in zip(rows.tolist(), cols.tolist())]
+        return self._bombs
+
+    @property
+    def bomb_range(self):
+        """A bool array of the cells in range of a bomb.
+
+        Those are the cells in the row or the column of a bomb at most its
+        blast strength away. Walls are ignored, which errs on the safe side.
+        """
+        if self._bomb_range is None:
+            bomb_range = np.zeros(self.board.shape, dtype=bool)
+            for bomb in self.bombs:
+                row, col = bomb['position']
+                strength = bomb['blast_strength']
+                bomb_range[row, max(0, col - strength):col + strength + 1] = \
+                    True
+                bomb_range[max(0, row - strength):row + strength + 1, col] = \
+                    True
+            self._bomb_range = bomb_range
+        return self._bomb_range
+
+    @property
+    def flame_time(self):
+        '''The steps until a flame covers each cell, see blast.flame_time'''
+        if self._flame_time is None:
+            self._flame_time = blast.flame_time(
+                self.board, self.bomb_blast_strength, self.bomb_life)
+            self._flame_time.flags.writeable = False
+        return self._flame_time
+
+    def in_bomb_range(self, position):
+        '''Returns whether a position, maybe off the board, is in bomb range'''
+        if utility.position_on_board(self.board, position):
+            return bool(self.bomb_range[position])
+        x, y = position
+        for bomb in self.bombs:
+            bomb_x, bomb_y = bomb['position']
+            blast_strength = bomb['blast_strength']
+            if (x == bomb_x and abs(bomb_y - y) <= blast_strength) or \
+               (y == bomb_y and abs(bomb_x - x) <= blast_strength):
+                return True
+        return False
+
+    def passable(self, enemies):
+        '''Returns the utility.passable_mask of the board for these enemies'''
+        key = tuple(enemies)
+        mask = self._passable.get(key)
+        if mask is None:
+            mask = utility.passable_mask(self.board, key)
+            mask.flags.writeable = False
+            self._passable[key] = mask
+        return mask
+
+    def items(self, mask=None):
+        """Returns where each item lies.
+
+        Args:
+          mask: Optional bool array of the cells to look at. Defaults to the
+            whole board.
+
+        Returns:
+          A defaultdict(list) of Item to its positions, in row-major order.
+        """
+        if self._item_cells is None:
+            cells = np.argsort(self.board, axis=None, kind='stable')
+            values, starts = np.unique(
+                self.board.ravel()[cells], return_index=True)
+            self._item_cells = list(
+                zip([constants.Item(value) for value in values.tolist()],
+                    np.split(cells, starts[1:])))
+
+        size = len(self.board)
+        ret = defaultdict(list)
+        for item, cells in self._item_cells:
+            if mask is not None:
+                cells = cells[mask.ravel()[cells]]
+            if len(cells):
+                rows, cols = np.divmod(cells, size)
+                ret[item] = list(zip(rows.tolist(), cols.tolist()))
+        return ret
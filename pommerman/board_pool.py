@@ -0,0 +1,259 @@
+'''Module to pre-generate boards off the critical path of env.reset.
+
+A BoardGenerator yields a stream of (board, items) layouts that only depends
+on its seed: layout number i is made with its own random.Random seeded from
+(seed, i). That way the layouts are the same whether they are made on demand,
+ahead of time by a background thread or process, or read back from a file
+that a previous run saved.
+
+A BoardPool holds one BoardGenerator per configuration, i.e. per
+(board_size, num_rigid, num_wood, num_items, num_agents), and is what
+Pomme.set_board_pool takes. Seeding the env reseeds the pool, so seeded runs
+draw the same layouts.
+'''
+from collections import deque
+from concurrent import futures
+import random
+
+import numpy as np
+
+from . import utility
+
+
+def board_rng(seed, index):
+    '''Returns the random.Random that makes layout number index for a seed'''
+    return random.Random('%s-%d' % (seed, index))
+
+
+def make_layout(size, num_rigid, num_wood, num_items, num_agents, seed, index):
+    '''Makes layout number index of the stream of a seed'''
+    rng = board_rng(seed, index)
+    board = utility.make_board(size, num_rigid, num_wood, num_agents, rng=rng)
+    items = utility.make_items(board, num_items, rng=rng)
+    return board, items
+
+
+class BoardGenerator(object):
+    """Makes (board, items) layouts for one configuration.
+
+    Args:
+      size: The dimension of the board.
+      num_rigid: The number of rigid walls on the board.
+      num_wood: The number of wood walls on the board.
+      num_agents: The number of agents, 2 or 4.
+      seed: The seed of the stream of layouts. Defaults to a random one.
+      pool_size: If set, keep up to this many layouts made ahead of time.
+      background: How to make them ahead of time, 'thread' or 'process'.
+      num_items: The number of items hidden under the wood walls.
+    """
+
+    def __init__(self,
+                 size,
+                 num_rigid=0,
+                 num_wood=0,
+                 num_agents=4,
+                 seed=None,
+                 pool_size=0,
+                 background='thread',
+                 num_items=0):
+        assert background in ['thread', 'process']
+        self.size = size
+        self.num_rigid = num_rigid
+        self.num_wood = num_wood
+        self.num_agents = num_agents
+        self.num_items = num_items
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self._next_index = 0
+        self._saved = []
+        self._pending = deque()
+        self._executor = None
+        self._pool_size = 0
+        self._background = None
+        self._start(pool_size, background)
+
+    def _start(self, pool_size, background):
+        '''Starts making pool_size layouts ahead of time'''
+        self._pool_size = pool_size
+        self._background = background
+        if not pool_size:
+            return
+        if background == 'thread':
+            self._executor = futures.ThreadPoolExecutor(max_workers=1)
+        else:
+            self._executor = futures.ProcessPoolExecutor(max_workers=1)
+        self._fill()
+
+    @property
+    def num_saved(self):
+        '''The number of layouts at the start of the stream read from a file'''
+        return len(self._saved)
+
+    @property
+    def config(self):
+        '''The (size, num_rigid, num_wood, num_items, num_agents) made'''
+        return (self.size, self.num_rigid, self.num_wood, self.num_items,
+                self.num_agents)
+
+    def make(self, index):
+        '''Makes layout number index of the stream'''
+        size, num_rigid, num_wood, num_items, num_agents = self.config
+        return make_layout(size, num_rigid, num_wood, num_items, num_agents,
+                           self.seed, index)
+
+    def _fill(self):
+        '''Keeps pool_size of the layouts after the saved ones pending'''
+        if self._executor is None:
+            return
+        size, num_rigid, num_wood, num_items, num_agents = self.config
+        while len(self._pending) < self._pool_size:
+            if self._pending:
+                index = self._pending[-1][0] + 1
+            else:
+                index = max(self._next_index, len(self._saved))
+            self._pending.append((index,
+                                  self._executor.submit(
+                                      make_layout, size, num_rigid, num_wood,
+                                      num_items, num_agents, self.seed,
+                                      index)))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        '''Returns the next (board, items) layout of the stream'''
+        index = self._next_index
+        self._next_index += 1
+        if index < len(self._saved):
+            board, items = self._saved[index]
+            return board.copy(), dict(items)
+
+        if self._pending and self._pending[0][0] == index:
+            _, future = self._pending.popleft()
+            self._fill()
+            return future.result()
+        return self.make(index)
+
+    def save(self, path, count):
+        """Saves the first count layouts of the stream to an .npz file.
+
+        Args:
+          path: The file to write.
+          count: How many layouts to save.
+        """
+        boards = np.zeros((count, self.size, self.size), dtype=np.uint8)
+        items = np.zeros((count, self.size, self.size), dtype=np.uint8)
+        for index in range(count):
+            if index < len(self._saved):
+                board, layout_items = self._saved[index]
+            else:
+                board, layout_items = self.make(index)
+            boards[index] = board
+            for position, value in layout_items.items():
+                items[index][position] = value
+        np.savez_compressed(
+            path,
+            boards=boards,
+            items=items,
+            config=np.array(self.config),
+            seed=np.array(str(self.seed)))
+
+    @classmethod
+    def load(cls, path, pool_size=0, background='thread'):
+        '''Makes a generator that starts with the layouts saved to path'''
+        with np.load(path) as data:
+            size, num_rigid, num_wood, num_items, num_agents = \
+                [int(x) for x in data['config']]
+            generator = cls(size, num_rigid, num_wood, num_agents,
+                            str(data['seed']), num_items=num_items)
+            for board, items in zip(data['boards'], data['items']):
+                rows, cols = np.nonzero(items)
+                generator._saved.append(
+                    (board, {(int(r), int(c)): int(items[r, c])
+                             for r, c in zip(rows, cols)}))
+        generator._start(pool_size, background)
+        return generator
+
+    def close(self):
+        '''Stops making layouts ahead of time. They are then made on demand'''
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def rewind(self, pool_size=None, background=None):
+        """Restarts from the first layout of the stream.
+
+        Args:
+          pool_size: How many layouts to make ahead from now on. Defaults to
+            as many as before.
+          background: How to make them ahead. Defaults to as before.
+        """
+        pool_size = self._pool_size if pool_size is None else pool_size
+        background = background or self._background
+        self.close()
+        self._next_index = 0
+        self._start(pool_size, background)
+
+
+class BoardPool(object):
+    """Layouts for env.reset, with one BoardGenerator per configuration.
+
+    Args:
+      seed: The seed the streams of every configuration derive from.
+      pool_size: How many layouts of each configuration to make ahead.
+      background: How to make them ahead of time, 'thread' or 'process'.
+    """
+
+    def __init__(self, seed=None, pool_size=0, background='thread'):
+        self.pool_size = pool_size
+        self.background = background
+        self._generators = {}
+        # The configurations served by generators given to add().
+        self._added = set()
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """Restarts the streams of every configuration from a new seed.
+
+        Generators added with add() have their own seed. They are rewound to
+        the start of their stream instead, and make the pool's pool_size
+        layouts ahead from there.
+        """
+        self.close()
+        self._generators = {
+            config: generator
+            for config, generator in self._generators.items()
+            if config in self._added
+        }
+        for generator in self._generators.values():
+            generator.rewind(self.pool_size, self.background)
+        self._seed = random.getrandbits(64) if seed is None else seed
+
+    def add(self, generator):
+        '''Serves the configuration of a generator, e.g. a loaded one, from it'''
+        self._generators[generator.config] = generator
+        self._added.add(generator.config)
+
+    def get(self, size, num_rigid, num_wood, num_items, num_agents):
+        '''Returns the next (board, items) layout of a configuration'''
+        config = (size, num_rigid, num_wood, num_items, num_agents)
+        generator = self._generators.get(config)
+        if generator is None:
+            generator = BoardGenerator(
+                size,
+                num_rigid,
+                num_wood,
+                num_agents,
+                seed='%s/%s' % (self._seed, '/'.join(map(str, config))),
+                pool_size=self.pool_size,
+                background=self.background,
+                num_items=num_items)
+            self._generators[config] = generator
+        return next(generator)
+
+    def close(self):
+        '''Stops making layouts ahead of time'''
+        for generator in self._generators.values():
+            generator.close()
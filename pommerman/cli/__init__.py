@@ -1,2 +1,4 @@
 '''CLI module entry point'''
 from . import run_battle
+from . import run_league
+from . import build_dataset
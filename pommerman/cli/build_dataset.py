@@ -0,0 +1,50 @@
+"""Build a training dataset out of recorded games.
+
+The games are searched for in the given files and directories: run_battle
+recordings (--record_json_dir), action replays (--record_replay_dir) and
+network server matches. See pommerman.dataset for the format of the shards.
+
+An example over the recordings of run_battle:
+python build_dataset.py --games=recordings,replays --output_dir=dataset --num_workers=8
+"""
+import argparse
+
+from .. import dataset
+
+
+def main():
+    '''CLI entry point to build a dataset'''
+    parser = argparse.ArgumentParser(description='Playground Dataset Builder.')
+    parser.add_argument(
+        '--games',
+        required=True,
+        help='Comma delineated list of the files and directories of the '
+        'games.')
+    parser.add_argument(
+        '--output_dir',
+        required=True,
+        help='Directory to write the shards and their index to.')
+    parser.add_argument(
+        '--shard_size',
+        default=65536,
+        type=int,
+        help='The number of rows of each shard.')
+    parser.add_argument(
+        '--num_workers',
+        default=None,
+        type=int,
+        help='How many processes rebuild the games. Defaults to one per CPU.')
+    args = parser.parse_args()
+
+    games = dataset.find_games(args.games.split(','))
+    built = dataset.build_dataset(
+        games,
+        args.output_dir,
+        shard_size=args.shard_size,
+        num_workers=args.num_workers)
+    print("Wrote %d rows of %d games in %d shards to %s" %
+          (len(built), len(games), len(built.shards), args.output_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,16 @@ python run_battle.py --agents=player::arrows,test::agents.SimpleAgent,random::nu
 
 An example with a docker agent:
 python run_battle.py --agents=player::arrows,docker::pommerman/test-agent,random::null,random::null --config=PommeFFACompetition-v0
+
+An example tournament of 100 games over 8 processes, with the results of each
+game streamed to a file as it finishes:
+python run_battle.py --agents=test::agents.SimpleAgent,random::null,random::null,random::null --config=PommeFFACompetition-v0 --tournament_games=100 --num_workers=8 --seed=7 --results_file=results.jsonl
 """
 import atexit
+from collections import defaultdict
+from concurrent import futures
 from datetime import datetime
+import json
 import os
 import random
 import sys
@@ -22,70 +29,93 @@ import time
 import argparse
 import numpy as np
 
+from .. import constants
 from .. import helpers
 from .. import make
-from pommerman import utility
+from .. import recorder
+from .. import replay
+
 
+def run(args, num_times=1, seed=None, container_pool=None):
+    '''Wrapper to help start the game
 
-def run(args, num_times=1, seed=None):
-    '''Wrapper to help start the game'''
+    Docker agents get their containers from container_pool, an
+    agents.ContainerPool, if given.
+    '''
     config = args.config
     record_pngs_dir = args.record_pngs_dir
     record_json_dir = args.record_json_dir
+    record_replay_dir = args.record_replay_dir
     agent_env_vars = args.agent_env_vars
     game_state_file = args.game_state_file
     render_mode = args.render_mode
     do_sleep = args.do_sleep
 
     agents = [
-        helpers.make_agent_from_string(agent_string, agent_id)
+        helpers.make_agent_from_string(
+            agent_string, agent_id, container_pool=container_pool)
         for agent_id, agent_string in enumerate(args.agents.split(','))
     ]
 
     env = make(config, agents, game_state_file, render_mode=render_mode)
+    env.set_board_analysis(args.board_analysis)
+    env.set_concurrent_act(args.concurrent_act)
 
-    def _run(record_pngs_dir=None, record_json_dir=None):
+    def _run(record_pngs_dir=None, record_json_dir=None,
+             record_replay_dir=None):
         '''Runs a game'''
         print("Starting the Game.")
         if record_pngs_dir and not os.path.isdir(record_pngs_dir):
             os.makedirs(record_pngs_dir)
         if record_json_dir and not os.path.isdir(record_json_dir):
             os.makedirs(record_json_dir)
+        if record_replay_dir and not os.path.isdir(record_replay_dir):
+            os.makedirs(record_replay_dir)
+
+        game_recorder = None
+        if record_json_dir:
+            game_recorder = recorder.GameRecorder(
+                os.path.join(record_json_dir, recorder.GAME_FILE),
+                args.agents.split(','), config)
 
         obs = env.reset()
         done = False
 
+        replay_writer = None
+        if record_replay_dir:
+            replay_writer = replay.ReplayWriter(
+                os.path.join(record_replay_dir, 'game.replay'),
+                args.agents.split(','), config, seed=seed)
+            replay_writer.start(env)
+
         while not done:
             if args.render:
                 env.render(
                     record_pngs_dir=record_pngs_dir,
-                    record_json_dir=record_json_dir,
                     do_sleep=do_sleep)
-            if args.render is False and record_json_dir:
-                env.save_json(record_json_dir)
-                time.sleep(1.0 / env._render_fps)
+            if game_recorder:
+                game_recorder.record(env)
             actions = env.act(obs)
             obs, reward, done, info = env.step(actions)
+            if replay_writer:
+                replay_writer.step(actions, env)
 
         print("Final Result: ", info)
         if args.render:
             env.render(
                 record_pngs_dir=record_pngs_dir,
-                record_json_dir=record_json_dir,
                 do_sleep=do_sleep)
             if do_sleep:
                 time.sleep(5)
             env.render(close=True)
-            
-        if args.render is False and record_json_dir:
-            env.save_json(record_json_dir)
-            time.sleep(1.0 / env._render_fps)
 
-        if record_json_dir:
-            finished_at = datetime.now().isoformat()
-            _agents = args.agents.split(',')
-            utility.join_json_state(record_json_dir, _agents, finished_at,
-                                    config, info)
+        if game_recorder:
+            game_recorder.record(env)
+            game_recorder.close(info, datetime.now().isoformat())
+            if args.legacy_json:
+                recorder.to_legacy(game_recorder.path)
+        if replay_writer:
+            replay_writer.close(info, datetime.now().isoformat())
 
         return info
 
@@ -98,22 +128,167 @@ def run(args, num_times=1, seed=None):
 
     infos = []
     times = []
-    for i in range(num_times):
-        start = time.time()
+    try:
+        for i in range(num_times):
+            start = time.time()
 
-        record_pngs_dir_ = record_pngs_dir + '/%d' % (i+1) \
-                           if record_pngs_dir else None
-        record_json_dir_ = record_json_dir + '/%d' % (i+1) \
-                           if record_json_dir else None
-        infos.append(_run(record_pngs_dir_, record_json_dir_))
+            record_pngs_dir_ = record_pngs_dir + '/%d' % (i+1) \
+                               if record_pngs_dir else None
+            record_json_dir_ = record_json_dir + '/%d' % (i+1) \
+                               if record_json_dir else None
+            record_replay_dir_ = record_replay_dir + '/%d' % (i+1) \
+                                 if record_replay_dir else None
+            infos.append(_run(record_pngs_dir_, record_json_dir_,
+                              record_replay_dir_))
 
-        times.append(time.time() - start)
-        print("Game Time: ", times[-1])
-
-    atexit.register(env.close)
+            times.append(time.time() - start)
+            print("Game Time: ", times[-1])
+    finally:
+        if container_pool is not None:
+            # Hand the containers back to the pool for the next battle, even
+            # if a game failed.
+            env.close()
+    if container_pool is None:
+        atexit.register(env.close)
     return infos
 
 
+def game_seed(master_seed, index):
+    '''Returns the seed of game number index of a tournament'''
+    return random.Random('%s-%d' % (master_seed, index)).randint(
+        0, np.iinfo(np.int32).max)
+
+
+def play_game(config, agent_strings, seed, game_state_file=None):
+    """Plays one game with fresh agents and returns its result.
+
+    Everything random is seeded from seed, and nothing carries over from
+    earlier games, so the game only depends on its arguments.
+
+    Args:
+      config: The env config id.
+      agent_strings: The list of agent strings, see make_agent_from_string.
+      seed: The seed of the game.
+      game_state_file: Optional file of the initial game state.
+
+    Returns:
+      A dict with the result (a constants.Result value), the winners and the
+      number of steps.
+    """
+    agents = [
+        helpers.make_agent_from_string(agent_string, agent_id)
+        for agent_id, agent_string in enumerate(agent_strings)
+    ]
+    env = make(config, agents, game_state_file)
+    env.set_board_analysis(True)
+    env.set_concurrent_act(True)
+    np.random.seed(seed)
+    random.seed(seed)
+    env.seed(seed)
+    # The action space samples, e.g. for RandomAgent, from its own RNG.
+    if hasattr(env.action_space, 'seed'):
+        env.action_space.seed(seed)
+    else:
+        from gym.spaces import prng
+        prng.seed(seed)
+    try:
+        obs = env.reset()
+        done = False
+        while not done:
+            obs, reward, done, info = env.step(env.act(obs))
+        return {
+            'result': info['result'].value,
+            'winners': [int(winner) for winner in info.get('winners', [])],
+            'steps': env._step_count,
+        }
+    finally:
+        env.close()
+
+
+def _play_tournament_game(config, agent_strings, game_state_file, index,
+                          seed):
+    '''Plays game number index of a tournament in a worker process'''
+    ret = play_game(config, agent_strings, seed, game_state_file)
+    ret.update({'game': index, 'seed': seed, 'agents': agent_strings})
+    return ret
+
+
+def tournament_stats(results):
+    """Returns the win, tie and loss counts of each agent string.
+
+    Each seat counts on its own, so an agent string that plays in two seats
+    of a game counts two games.
+    """
+    stats = defaultdict(lambda: {'games': 0, 'wins': 0, 'ties': 0,
+                                 'losses': 0})
+    for result in results:
+        for agent_id, agent_string in enumerate(result['agents']):
+            counts = stats[agent_string]
+            counts['games'] += 1
+            if result['result'] == constants.Result.Tie.value:
+                counts['ties'] += 1
+            elif agent_id in result['winners']:
+                counts['wins'] += 1
+            else:
+                counts['losses'] += 1
+    return dict(stats)
+
+
+def run_tournament(args,
+                   num_games,
+                   seed=0,
+                   num_workers=None,
+                   results_file=None):
+    """Plays seeded games on a process pool and aggregates their results.
+
+    Game number i is played with game_seed(seed, i) and fresh agents, so the
+    results only depend on the master seed, whatever the order the games
+    finish in.
+
+    Args:
+      args: The parsed CLI arguments. Rendering and recording aren't
+        supported.
+      num_games: How many games to play.
+      seed: The master seed.
+      num_workers: How many processes to play on. Defaults to one per CPU.
+      results_file: Optional path to stream the result of every game to, one
+        JSON object per line, as the games finish.
+
+    Returns:
+      The results of the games, ordered by game number, and the
+      tournament_stats of them.
+    """
+    assert not args.render and not args.record_pngs_dir and \
+        not args.record_json_dir
+    agent_strings = args.agents.split(',')
+    results = []
+    out = open(results_file, 'a') if results_file else None
+    try:
+        with futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            pending = [
+                executor.submit(_play_tournament_game, args.config,
+                                agent_strings, args.game_state_file, index,
+                                game_seed(seed, index))
+                for index in range(num_games)
+            ]
+            for future in futures.as_completed(pending):
+                result = future.result()
+                results.append(result)
+                print("Game %d (seed %d): %s" %
+                      (result['game'], result['seed'],
+                       constants.Result(result['result']).name),
+                      result['winners'])
+                if out:
+                    out.write(json.dumps(result) + '\n')
+                    out.flush()
+    finally:
+        if out:
+            out.close()
+
+    results.sort(key=lambda result: result['game'])
+    return results, tournament_stats(results)
+
+
 def main():
     '''CLI entry pointed used to bootstrap a battle'''
     simple_agent = 'test::agents.SimpleAgent'
@@ -151,6 +326,17 @@ def main():
         default=None,
         help='Directory to record the JSON representations of '
         "the game. Doesn't record if None.")
+    parser.add_argument(
+        '--record_replay_dir',
+        default=None,
+        help='Directory to record the action replays of the game. '
+        "Doesn't record if None.")
+    parser.add_argument(
+        '--legacy_json',
+        default=False,
+        action='store_true',
+        help='Whether to also convert the recordings to the legacy '
+        'game_state.json format.')
     parser.add_argument(
         "--render",
         default=False,
@@ -168,8 +354,55 @@ def main():
         '--do_sleep',
         default=True,
         help="Whether we sleep after each rendering.")
+    parser.add_argument(
+        '--board_analysis',
+        default=False,
+        action='store_true',
+        help='Whether to attach a shared BoardAnalysis to the observations, '
+        'which SimpleAgents reuse instead of analysing the board each.')
+    parser.add_argument(
+        '--concurrent_act',
+        default=False,
+        action='store_true',
+        help='Whether to ask the remote agents, e.g. docker agents, for '
+        'their actions concurrently.')
+    parser.add_argument(
+        '--tournament_games',
+        default=0,
+        type=int,
+        help='If set, play this many seeded games on a process pool '
+        'and report win, tie and loss counts per agent.')
+    parser.add_argument(
+        '--num_workers',
+        default=None,
+        type=int,
+        help='How many processes play the tournament games. '
+        'Defaults to one per CPU.')
+    parser.add_argument(
+        '--seed',
+        default=None,
+        type=int,
+        help='The seed of the game, or the master seed of the '
+        'tournament.')
+    parser.add_argument(
+        '--results_file',
+        default=None,
+        help='File to stream the tournament results to, one JSON '
+        'object per game.')
     args = parser.parse_args()
-    run(args)
+    if args.tournament_games:
+        _, stats = run_tournament(
+            args,
+            args.tournament_games,
+            seed=args.seed or 0,
+            num_workers=args.num_workers,
+            results_file=args.results_file)
+        for agent_string, counts in sorted(stats.items()):
+            print("%s: %d wins, %d ties, %d losses in %d games" %
+                  (agent_string, counts['wins'], counts['ties'],
+                   counts['losses'], counts['games']))
+    else:
+        run(args, seed=args.seed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,309 @@
+"""Run a league among a pool of agents and rate them with Elo.
+
+The agents are given as agent strings, like for run_battle. FFA configs seat
+four different agents in a game. Team configs seat two, each of them
+playing both of its team's agents. Every match is played several times with
+the seats rotated.
+
+With the round robin schedule, every group of agents plays every config.
+With the Swiss schedule, every round groups the agents with the closest
+ratings so far, and agents left over sit the round out.
+
+Every game has a number and a seed derived from the master seed and that
+number, and its result is appended to the results file as soon as it
+finishes. Running the same league again with the same results file only
+plays the games that are not in it yet, and the ratings are always computed
+by going through the results in schedule order, so they don't depend on
+which games finished first or how often the league was restarted.
+
+An example with two SimpleAgents and two RandomAgents, over the FFA and Team
+configs:
+python run_league.py --agents=test::agents.SimpleAgent,simple::null,random::null,test::agents.RandomAgent --configs=PommeFFACompetition-v0,PommeTeamCompetition-v0 --results_file=league.jsonl
+"""
+import argparse
+from concurrent import futures
+import itertools
+import json
+import os
+import random
+
+from .. import constants
+from .. import make
+from . import run_battle
+
+# The number of seats each agent of a match plays, per game type.
+_SEATS = {
+    constants.GameType.FFA: 1,
+    constants.GameType.Team: 2,
+    constants.GameType.TeamRadio: 2,
+}
+
+
+def match_size(config):
+    '''Returns how many different agents play a game of the config'''
+    env = make(config, [])
+    game_type = env.spec._kwargs['game_type']
+    assert game_type in _SEATS, "Unsupported game type %s" % game_type
+    return 4 // _SEATS[game_type]
+
+
+def seat(players, rotation):
+    """Returns the agent of each of the four seats of a game.
+
+    With two players, they play the teams of seats 0 and 2, and 1 and 3.
+
+    Args:
+      players: The agents of the match.
+      rotation: Rotates the players over the seats, so that every player
+        gets to play every seat over as many games as there are players.
+    """
+    players = list(players)
+    rotation %= len(players)
+    players = players[rotation:] + players[:rotation]
+    return [players[num % len(players)] for num in range(4)]
+
+
+class Elo(object):
+    """Elo ratings, updated pairwise after every game.
+
+    A game counts as a win of each winner over each loser and as a draw
+    between agents on the same side of the result. With more than two
+    agents in a game, K is split between the pairs.
+
+    Args:
+      k: The K factor.
+      initial: The rating of an agent that hasn't played yet.
+    """
+
+    def __init__(self, k=32, initial=1500):
+        self.k = k
+        self.initial = initial
+        self.ratings = {}
+
+    def get(self, player):
+        return self.ratings.get(player, self.initial)
+
+    def update(self, seats, result, winners):
+        """Updates the ratings of the agents of a game.
+
+        Args:
+          seats: The agent of each seat.
+          result: The constants.Result value of the game.
+          winners: The winning seats.
+        """
+        players = sorted(set(seats))
+        won = {
+            player: result != constants.Result.Tie.value and any(
+                seats[winner] == player for winner in winners)
+            for player in players
+        }
+        deltas = {player: 0. for player in players}
+        for player, other in itertools.permutations(players, 2):
+            score = .5 + (won[player] - won[other]) / 2.
+            expected = 1. / (
+                1 + 10**((self.get(other) - self.get(player)) / 400.))
+            deltas[player] += self.k * (score - expected) / (len(players) - 1)
+        for player, delta in deltas.items():
+            self.ratings[player] = self.get(player) + delta
+
+
+class League(object):
+    """Schedules the games of a league and keeps its results and ratings.
+
+    Args:
+      agents: The list of agent strings of the pool.
+      configs: The list of env config ids to play.
+      schedule: 'round_robin' or 'swiss'.
+      rounds: The number of Swiss rounds.
+      games_per_match: How many games each match plays, with the seats
+        rotated between them.
+      seed: The master seed.
+      results_file: Optional path of the file to save the results in, and
+        resume from.
+    """
+
+    def __init__(self,
+                 agents,
+                 configs,
+                 schedule='round_robin',
+                 rounds=1,
+                 games_per_match=4,
+                 seed=0,
+                 results_file=None):
+        assert schedule in ['round_robin', 'swiss']
+        assert len(set(agents)) == len(agents), "The agents must be distinct"
+        self.agents = list(agents)
+        self.configs = list(configs)
+        self.schedule = schedule
+        self.rounds = rounds if schedule == 'swiss' else 1
+        self.games_per_match = games_per_match
+        self.seed = seed
+        self.results_file = results_file
+        self._sizes = {config: match_size(config) for config in self.configs}
+        for config, size in self._sizes.items():
+            assert len(self.agents) >= size, \
+                "%s needs at least %d agents" % (config, size)
+        self.results = {}
+        if results_file and os.path.exists(results_file):
+            with open(results_file) as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        self.results[result['game']] = result
+
+    def _groups(self, config, elo, round_):
+        '''Returns the groups of agents that play a round of a config'''
+        size = self._sizes[config]
+        if self.schedule == 'round_robin':
+            return list(itertools.combinations(self.agents, size))
+
+        # Swiss: the ties between equal ratings are broken by a seeded
+        # shuffle, so that the first round is a random draw.
+        rng = random.Random('%s-%s-%d' % (self.seed, config, round_))
+        order = list(self.agents)
+        rng.shuffle(order)
+        order.sort(key=elo.get, reverse=True)
+        return [
+            tuple(order[num:num + size])
+            for num in range(0, len(order) - size + 1, size)
+        ]
+
+    def _round(self, round_, elo, first_game):
+        '''Returns the games of a round as (game, config, seats) tuples'''
+        games = []
+        for config in self.configs:
+            for group in self._groups(config, elo, round_):
+                for rotation in range(self.games_per_match):
+                    games.append((first_game + len(games), config,
+                                  seat(group, rotation)))
+        return games
+
+    def _save(self, result):
+        if self.results_file:
+            with open(self.results_file, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+    def run(self, num_workers=None):
+        """Plays the games that have no result yet and returns the ratings.
+
+        Args:
+          num_workers: How many processes to play on. Defaults to one per
+            CPU.
+
+        Returns:
+          The Elo of the agents.
+        """
+        elo = Elo()
+        first_game = 0
+        with futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            for round_ in range(self.rounds):
+                games = self._round(round_, elo, first_game)
+                first_game += len(games)
+                pending = {}
+                for game, config, seats in games:
+                    result = self.results.get(game)
+                    if result is not None:
+                        assert result['config'] == config and \
+                            result['agents'] == seats, \
+                            "Game %d of %s is of another league" % (
+                                game, self.results_file)
+                        continue
+                    pending[executor.submit(
+                        _play_league_game, game, config, seats,
+                        run_battle.game_seed(self.seed, game))] = game
+
+                for future in futures.as_completed(pending):
+                    result = future.result()
+                    self.results[result['game']] = result
+                    self._save(result)
+                    print("Game %d %s %s: %s" %
+                          (result['game'], result['config'],
+                           ','.join(result['agents']),
+                           constants.Result(result['result']).name),
+                          result['winners'])
+
+                # Rate in schedule order, whatever order the games ended in.
+                for game, _, _ in games:
+                    result = self.results[game]
+                    elo.update(result['agents'], result['result'],
+                               result['winners'])
+        return elo
+
+    def standings(self, elo):
+        '''Returns (agent, rating, stats) rows, best rated first'''
+        stats = run_battle.tournament_stats(self.results.values())
+        no_games = {'games': 0, 'wins': 0, 'ties': 0, 'losses': 0}
+        return sorted(
+            [(agent, elo.get(agent), stats.get(agent, no_games))
+             for agent in self.agents],
+            key=lambda row: row[1],
+            reverse=True)
+
+
+def _play_league_game(game, config, seats, seed):
+    '''Plays one game of a league in a worker process'''
+    result = run_battle.play_game(config, seats, seed)
+    result.update({
+        'game': game,
+        'config': config,
+        'agents': seats,
+        'seed': seed
+    })
+    return result
+
+
+def main():
+    '''CLI entry point to run a league'''
+    parser = argparse.ArgumentParser(description='Playground League.')
+    parser.add_argument(
+        '--agents',
+        required=True,
+        help='Comma delineated list of the agent strings of the pool.')
+    parser.add_argument(
+        '--configs',
+        default='PommeFFACompetition-v0,PommeTeamCompetition-v0',
+        help='Comma delineated list of the configs to play.')
+    parser.add_argument(
+        '--schedule',
+        default='round_robin',
+        help='round_robin or swiss.')
+    parser.add_argument(
+        '--rounds',
+        default=3,
+        type=int,
+        help='The number of Swiss rounds.')
+    parser.add_argument(
+        '--games_per_match',
+        default=4,
+        type=int,
+        help='How many games each match plays, rotating the seats.')
+    parser.add_argument(
+        '--seed', default=0, type=int, help='The master seed.')
+    parser.add_argument(
+        '--num_workers',
+        default=None,
+        type=int,
+        help='How many processes play the games. Defaults to one per CPU.')
+    parser.add_argument(
+        '--results_file',
+        default=None,
+        help='File to save the results in and resume from.')
+    args = parser.parse_args()
+
+    league = League(
+        args.agents.split(','),
+        args.configs.split(','),
+        schedule=args.schedule,
+        rounds=args.rounds,
+        games_per_match=args.games_per_match,
+        seed=args.seed,
+        results_file=args.results_file)
+    elo = league.run(num_workers=args.num_workers)
+    for agent, rating, counts in league.standings(elo):
+        print("%7.1f %s: %d wins, %d ties, %d losses in %d games" %
+              (rating, agent, counts['wins'], counts['ties'],
+               counts['losses'], counts['games']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+'''Module for building training datasets out of recorded games.
+
+build_dataset goes through recorded games and writes, for every step of
+every game and every agent alive at that step, the featurized observation of
+the agent and the action it took. The games can be:
+
+  - run_battle recordings, game.ndjson files of the recorder module, or
+    their legacy game_state.json conversions;
+  - action replays, .replay files of the replay module;
+  - network server matches, in a replay_archive.ReplayArchive directory or
+    in the per-match .json files of older servers, as long as they hold
+    their initial state.
+
+The observations are rebuilt in an env of the game's config, by loading
+the recorded states or by stepping the forward model through the recorded
+actions, so they are exactly what the agents saw. They are featurized a game
+at a time with the env's featurize_batch. The games are processed on a
+process pool and written, in the order they were given, to fixed-size shards
+of .npy files in the output directory:
+
+  features-00000.npy  (rows, feature_dim) float32 featurized observations
+  actions-00000.npy   (rows,) int64 actions
+  messages-00000.npy  (rows, radio_num_words) int64 radio messages sent,
+                      for radio configs only
+  rows-00000.npy      (rows, 3) int64 game, step and agent_id of every row
+
+and an index.json listing the shards. A Dataset opens them memory-mapped,
+so slicing rows within a shard doesn't copy anything.
+'''
+from concurrent import futures
+import json
+import os
+
+import numpy as np
+
+from . import agents
+from . import recorder
+from . import replay
+from .replay_archive import ReplayArchive
+
+INDEX = 'index.json'
+_ARCHIVE_SEGMENT = 'replays.seg'
+
+
+def find_games(paths):
+    """Returns the games found in files and directories.
+
+    Args:
+      paths: The list of files and directories to search. Directories are
+        searched recursively, and are read as a ReplayArchive if they hold
+        one.
+
+    Returns:
+      The list of games, as (path, match_id) tuples. The match_id is the id
+      of the match in a ReplayArchive and None for games in their own file.
+    """
+    games = []
+    for path in paths:
+        if not os.path.isdir(path):
+            games.append((path, None))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            if _ARCHIVE_SEGMENT in files:
+                games.extend((root, match_id)
+                             for match_id in ReplayArchive(root).ids())
+            for name in sorted(files):
+                if name == 'game_state.json' and recorder.GAME_FILE in files:
+                    # The same game as its recording.
+                    continue
+                if name == recorder.GAME_FILE or name.endswith('.replay') \
+                   or (name.endswith('.json') and name != INDEX):
+                    games.append((os.path.join(root, name), None))
+    return games
+
+
+def _placeholder_env(config, num_agents=4):
+    '''Returns an env of the config whose agents are never asked to act'''
+    # Imported here as the package imports this module.
+    from . import make
+    env = make(config, [agents.BaseAgent() for _ in range(num_agents)])
+    env.reset()
+    return env
+
+
+def _frame_steps(config, frames):
+    """Yields the (observations, actions) of every step of recorded frames.
+
+    The actions of a step are the intended actions of the next frame. Those
+    only hold the moves, so with radio the message each agent sent is taken
+    from the radio of the next frame.
+    """
+    env = _placeholder_env(config)
+    for frame, next_frame in zip(frames, frames[1:]):
+        env._init_game_state = {
+            key: json.dumps(value)
+            for key, value in frame.items()
+        }
+        env.set_json_info()
+        actions = next_frame['intended_actions']
+        if 'radio_from_agent' in next_frame:
+            radio = next_frame['radio_from_agent']
+            actions = [[action] + list(radio['Agent%d' % agent_id])
+                       for agent_id, action in enumerate(actions)]
+        yield env.get_observations(), actions
+    env.close()
+
+
+def _replay_steps(game_replay):
+    '''Yields the (observations, actions) of every step of a Replay'''
+    for step in range(game_replay.first_step, game_replay.last_step):
+        yield game_replay.get_observations(step), game_replay.get_actions(
+            step)
+    game_replay.close()
+
+
+def _match_replay(record, actions):
+    '''Returns the Replay of a network server match record'''
+    if 'state' not in record:
+        raise ValueError('The match record has no initial state to rebuild '
+                         'the match from')
+    return replay.Replay({
+        'config': record['mode'],
+        'agents': []
+    }, [{
+        'step': 0,
+        'state': record['state'],
+        'actions': actions
+    }])
+
+
+def game_steps(path, match_id=None):
+    """Returns the config of a game and an iterator over its steps.
+
+    Args:
+      path: The file of the game, or the directory of its ReplayArchive.
+      match_id: The id of the match in the ReplayArchive.
+
+    Returns:
+      The (config, steps) of the game, where steps yields the
+      (observations, actions) of the agents at every step.
+    """
+    if match_id is not None:
+        record, actions = ReplayArchive(path).get(match_id)
+        game_replay = _match_replay(record, actions)
+        return game_replay.config, _replay_steps(game_replay)
+    if path.endswith('.replay'):
+        game_replay = replay.Replay.load(path)
+        return game_replay.config, _replay_steps(game_replay)
+    if path.endswith('.ndjson'):
+        header, frames, _ = recorder.read(path)
+        return header['config'], _frame_steps(header['config'], frames)
+
+    with open(path) as f:
+        game = json.load(f)
+    if 'state' in game and isinstance(game['state'], list):
+        # A legacy game_state.json, with the fields of every frame encoded.
+        frames = sorted(
+            [{key: json.loads(value)
+              for key, value in frame.items()} for frame in game['state']],
+            key=lambda frame: frame['step_count'])
+        return game['config'], _frame_steps(game['config'], frames)
+    if 'actions' in game and 'mode' in game:
+        game_replay = _match_replay(game, game['actions'])
+        return game_replay.config, _replay_steps(game_replay)
+    raise ValueError('%s is not a recorded game' % path)
+
+
+def _game_rows(game_number, path, match_id):
+    """Returns the rows of a game.
+
+    Returns:
+      A dict of the features, actions, messages and rows arrays of the game.
+      messages is None unless the game has radio.
+    """
+    # Imported here as the package imports this module.
+    from . import make
+
+    config, steps = game_steps(path, match_id)
+    env_class = type(make(config, []))
+    alive, actions, messages, rows = [], [], [], []
+    num_words = None
+    for observations, step_actions in steps:
+        for agent_id, (obs, action) in enumerate(
+                zip(observations, step_actions)):
+            if agent_id + 10 not in obs['alive']:
+                continue
+            alive.append(obs)
+            if 'message' in obs:
+                # Radio agents that act with a plain action send nothing.
+                num_words = len(obs['message'])
+                if isinstance(action, (list, tuple)):
+                    messages.append(action[1:1 + num_words])
+                    action = action[0]
+                else:
+                    messages.append([0] * num_words)
+            actions.append(action)
+            rows.append((game_number, obs['step_count'], agent_id))
+
+    if alive:
+        features = env_class.featurize_batch(alive)
+    else:
+        features = np.zeros((0, 0), dtype=np.float32)
+    return {
+        'features': features,
+        'actions': np.array(actions, dtype=np.int64),
+        'messages': np.array(messages, dtype=np.int64).reshape(
+            -1, num_words) if num_words else None,
+        'rows': np.array(rows, dtype=np.int64).reshape(-1, 3)
+    }
+
+
+class _ShardWriter(object):
+    '''Buffers rows and writes them out as shards of shard_size rows'''
+
+    def __init__(self, directory, shard_size):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.shards = []
+        self._buffers = None
+        self._count = 0
+
+    def _allocate(self, game):
+        self._buffers = {
+            name: np.empty(
+                (self.shard_size,) + array.shape[1:], dtype=array.dtype)
+            for name, array in game.items() if array is not None
+        }
+
+    def add(self, game):
+        if self._buffers is None:
+            self._allocate(game)
+        assert {
+            name: buffer.shape[1:]
+            for name, buffer in self._buffers.items()
+        } == {
+            name: array.shape[1:]
+            for name, array in game.items() if array is not None
+        }, "The games have different features, e.g. with and without radio"
+        done, total = 0, len(game['rows'])
+        while done < total:
+            count = min(total - done, self.shard_size - self._count)
+            for name, buffer in self._buffers.items():
+                buffer[self._count:self._count + count] = \
+                    game[name][done:done + count]
+            self._count += count
+            done += count
+            if self._count == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        '''Writes the buffered rows as a shard'''
+        if not self._count:
+            return
+        number = len(self.shards)
+        files = {}
+        for name, buffer in self._buffers.items():
+            files[name] = '%s-%05d.npy' % (name, number)
+            array = np.lib.format.open_memmap(
+                os.path.join(self.directory, files[name]),
+                mode='w+',
+                dtype=buffer.dtype,
+                shape=(self._count,) + buffer.shape[1:])
+            array[:] = buffer[:self._count]
+            array.flush()
+            del array
+        self.shards.append({
+            'first_row': sum(shard['rows'] for shard in self.shards),
+            'rows': self._count,
+            'files': files
+        })
+        self._count = 0
+
+
+def build_dataset(games, directory, shard_size=65536, num_workers=None):
+    """Builds a dataset out of recorded games.
+
+    Args:
+      games: The list of (path, match_id) games, see find_games.
+      directory: The directory to write the shards and index to.
+      shard_size: The number of rows of the shards, except the last one.
+      num_workers: How many processes rebuild and featurize the games.
+        Defaults to one per CPU.
+
+    Returns:
+      The Dataset.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    writer = _ShardWriter(directory, shard_size)
+    paths = [path for path, _ in games]
+    match_ids = [match_id for _, match_id in games]
+    with futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for game in executor.map(_game_rows, range(len(games)), paths,
+                                 match_ids):
+            if len(game['rows']):
+                writer.add(game)
+    writer.flush()
+
+    with open(os.path.join(directory, INDEX), 'w') as f:
+        json.dump({
+            'games': [list(game) for game in games],
+            'shards': writer.shards
+        },
+                  f,
+                  indent=4)
+    return Dataset(directory)
+
+
+class Dataset(object):
+    """The shards of a dataset, memory-mapped.
+
+    Args:
+      directory: The directory of the dataset.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX)) as f:
+            self.index = json.load(f)
+        self.games = [tuple(game) for game in self.index['games']]
+        self.shards = [{
+            name: np.load(os.path.join(directory, path), mmap_mode='r')
+            for name, path in shard['files'].items()
+        } for shard in self.index['shards']]
+        self._first_rows = [
+            shard['first_row'] for shard in self.index['shards']
+        ]
+
+    def __len__(self):
+        return sum(shard['rows'] for shard in self.index['shards'])
+
+    def get(self, name, start, stop):
+        """Returns rows [start, stop) of an array, e.g. 'features'.
+
+        The rows are a view into the memory-mapped shard when they are all
+        in one shard, and a copy otherwise.
+        """
+        chunks = []
+        for first_row, shard in zip(self._first_rows, self.shards):
+            array = shard[name]
+            if first_row + len(array) <= start or first_row >= stop:
+                continue
+            chunks.append(array[max(start - first_row, 0):stop - first_row])
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks)
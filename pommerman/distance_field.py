@@ -0,0 +1,93 @@
+'''Module for array-based breadth first search distance fields.
+
+The search expands a whole BFS level at a time with NumPy instead of popping
+cells off a queue one by one. Within a level, the cells are still handled in
+the order a FIFO queue would pop them, so the predecessors, including the
+ones picked by a random tie break, are the same as the queue-based search
+that SimpleAgent used to run.
+'''
+import numpy as np
+
+from . import utility
+
+
+def distance_field(passable, start, reachable=None, tie_break=None):
+    """Returns the BFS distance and predecessor of every cell from start.
+
+    Args:
+      passable: (size, size) bool array of the cells that can be moved
+        through, i.e. whose neighbors are expanded.
+      start: The (row, col) to search from.
+      reachable: (size, size) bool array of the cells that get a distance at
+        all. Defaults to every cell. Cells that are reachable but not
+        passable are reached, but not expanded, like wood or enemies.
+      tie_break: Optional function called without arguments whenever a cell
+        is reached again at the same distance from another predecessor. If it
+        returns True, the new predecessor replaces the old one. It is called
+        in queue order.
+
+    Returns:
+      dist: (size, size) float array of distances, inf where not reached.
+      prev: (size, size) int array of the flat index of each cell's
+        predecessor, -1 for the start and cells that weren't reached.
+    """
+    passable = np.asarray(passable, dtype=bool)
+    size = passable.shape[0]
+    if reachable is None:
+        reachable = np.ones_like(passable)
+    dist = np.full(size * size, np.inf)
+    prev = np.full(size * size, -1, dtype=np.int64)
+    passable = passable.ravel()
+    reachable = np.asarray(reachable, dtype=bool).ravel()
+    # Up, down, left, right: the order the queue-based search expanded in.
+    neighbors = utility.neighbor_table(size)[:, 1:5]
+
+    start = start[0] * size + start[1]
+    if not reachable[start]:
+        return dist.reshape(size, size), prev.reshape(size, size)
+    dist[start] = 0
+
+    level = 0
+    frontier = np.array([start])
+    while frontier.size:
+        parents = frontier[passable[frontier]]
+        cells = neighbors[parents].ravel()
+        parents = np.repeat(parents, 4)
+        new = cells >= 0
+        new[new] = reachable[cells[new]]
+        new[new] = dist[cells[new]] == np.inf
+        cells, parents = cells[new], parents[new]
+
+        # The first time a cell comes up is when the queue would reach it.
+        _, first = np.unique(cells, return_index=True)
+        first.sort()
+        frontier = cells[first]
+        level += 1
+        dist[frontier] = level
+        prev[frontier] = parents[first]
+
+        if tie_break is not None and len(first) < len(cells):
+            again = np.ones(len(cells), dtype=bool)
+            again[first] = False
+            for num in np.flatnonzero(again):
+                if tie_break():
+                    prev[cells[num]] = parents[num]
+
+    return dist.reshape(size, size), prev.reshape(size, size)
+
+
+def path_direction(prev, start, position):
+    """Returns the Action of the first step from start on the way to position.
+
+    Args:
+      prev: The predecessor array from distance_field.
+      start: The (row, col) the field was computed from.
+      position: A (row, col) that the field reached, other than start.
+    """
+    size = prev.shape[0]
+    start_index = start[0] * size + start[1]
+    index = position[0] * size + position[1]
+    prev = prev.ravel()
+    while prev[index] != start_index:
+        index = prev[index]
+    return utility.get_direction(start, divmod(int(index), size))
@@ -3,6 +3,7 @@
 This evironment acts as game manager for Pommerman. Further environments,
 such as in v1.py, will inherit from this.
 """
+from concurrent import futures
 import json
 import os
 
@@ -12,11 +13,87 @@ from gym import spaces
 from gym.utils import seeding
 import gym
 
+from .. import board_analysis
 from .. import characters
 from .. import constants
 from .. import forward_model
+from .. import game_state
 from .. import graphics
 from .. import utility
+from .. import zobrist
+
+
+def _item_value(item):
+    '''Returns the value of an Item, which is already one after JSON'''
+    return getattr(item, 'value', item)
+
+
+def featurize_batch(observations, out=None, planar=False, extra=None):
+    """Featurizes a batch of observations at once.
+
+    The flat layout has the features of Pomme.featurize in the same order.
+    The planar layout has one channel per feature instead: the board, bomb
+    blast strength and bomb life layers, a one-hot layer of the position,
+    then a constant layer for each of ammo, blast strength, can_kick,
+    teammate, every enemy and every column of extra.
+
+    Args:
+      observations: The list of observations. They must all be of the same
+        game type, so that they have as many enemies.
+      out: Optional float32 array to write the features into, of shape
+        (B, feature_dim), or (B, channels, size, size) if planar.
+      planar: Whether to use the planar layout, for convolutional policies.
+      extra: Optional (B, k) array of more features to add at the end, like
+        the radio messages of v2.
+
+    Returns:
+      The features, in out if given.
+    """
+    batch_size = len(observations)
+    assert batch_size, "There are no observations to featurize"
+    size = len(observations[0]['board'])
+    layers = [
+        np.stack([obs[key] for obs in observations])
+        for key in ['board', 'bomb_blast_strength', 'bomb_life']
+    ]
+    position = np.array([obs['position'] for obs in observations],
+                        dtype=np.int64).reshape(batch_size, 2)
+    scalars = [
+        np.array([[
+            obs['ammo'], obs['blast_strength'], obs['can_kick'],
+            _item_value(obs['teammate'])
+        ] + [_item_value(enemy) for enemy in obs['enemies']]
+                  for obs in observations],
+                 dtype=np.float32)
+    ]
+    if extra is not None:
+        scalars.append(np.asarray(extra, dtype=np.float32).reshape(
+            batch_size, -1))
+    scalars = np.concatenate(scalars, axis=1)
+
+    if planar:
+        shape = (batch_size, len(layers) + 1 + scalars.shape[1], size, size)
+    else:
+        shape = (batch_size, len(layers) * size**2 + 2 + scalars.shape[1])
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    assert out.shape == shape and out.dtype == np.float32, \
+        "out must be a float32 array of shape %s" % (shape,)
+
+    if planar:
+        for channel, layer in enumerate(layers):
+            out[:, channel] = layer
+        out[:, len(layers)] = 0
+        out[np.arange(batch_size), len(layers), position[:, 0],
+            position[:, 1]] = 1
+        out[:, len(layers) + 1:] = scalars[:, :, None, None]
+    else:
+        bss = size**2
+        for num, layer in enumerate(layers):
+            out[:, num * bss:(num + 1) * bss] = layer.reshape(batch_size, bss)
+        out[:, len(layers) * bss:len(layers) * bss + 2] = position
+        out[:, len(layers) * bss + 2:] = scalars
+    return out
 
 
 class Pomme(gym.Env):
@@ -48,6 +125,8 @@ class Pomme(gym.Env):
         self._num_items = num_items
         self._max_steps = max_steps
         self._viewer = None
+        self._state_hash = None
+        self._board_pool = None
         self._is_partially_observable = is_partially_observable
         self._env = env
 
@@ -58,6 +137,21 @@ class Pomme(gym.Env):
         # or from the cli tool using '--render_mode=MODE_TYPE'
         self._mode = 'human'
 
+        # This can be changed through set_observation_mode
+        self._read_only_observations = False
+
+        # This can be changed through set_board_analysis
+        self._board_analysis = False
+
+        # This can be changed through set_state_hashing
+        self._state_hashing = False
+
+        # These can be changed through set_concurrent_act
+        self._act_executor = None
+        self._act_timeout = None
+        # The acts of remote agents that timed out and are still running.
+        self._outstanding_acts = {}
+
         # Observation and Action Spaces. These are both geared towards a single
         # agent even though the environment expects actions and returns
         # observations for all four agents. We do this so that it's clear what
@@ -72,6 +166,53 @@ class Pomme(gym.Env):
     def set_render_mode(self, mode):
         self._mode = mode
 
+    def set_observation_mode(self, read_only):
+        '''Sets whether the observation arrays are read-only views.
+
+        Views avoid copying the board and layers for every agent each step,
+        but they are overwritten by the next step. Only use them if neither
+        the agents nor the caller mutate or keep the observations.
+        '''
+        self._read_only_observations = read_only
+
+    def set_board_analysis(self, enabled):
+        '''Sets whether the observations carry a shared BoardAnalysis.
+
+        The analysis is put under 'board_analysis', and its flame_time danger
+        map under 'flame_time'. In fully observable games all the agents
+        share the same one, so work like flattening the bomb layer is done
+        once per step instead of once per agent.
+        '''
+        self._board_analysis = enabled
+
+    def set_state_hashing(self, enabled):
+        '''Sets whether step keeps the Zobrist hash of the state up to date.
+
+        Without it get_state_hash hashes the whole state on every call, which
+        is cheaper unless it is called on most steps, e.g. by a search.
+        '''
+        self._state_hashing = enabled
+        self._state_hash = None
+
+    def set_concurrent_act(self, enabled, timeout=None):
+        """Sets whether the remote agents are asked to act concurrently.
+
+        Args:
+          enabled: If True, the agents whose is_remote() is True, like
+            DockerAgent, get their observations at the same time from a
+            thread pool, so a step takes as long as the slowest of them.
+          timeout: How many seconds to wait for each of them before giving it
+            the Stop action. None waits for as long as they take. An agent
+            keeps getting Stop until its late act finishes.
+        """
+        if self._act_executor is not None:
+            self._act_executor.shutdown(wait=False)
+            self._act_executor = None
+        if enabled:
+            self._act_executor = futures.ThreadPoolExecutor(
+                max_workers=len(self._agents or []) or 4)
+        self._act_timeout = timeout
+
     def _set_observation_space(self):
         """The Observation Space for each agent.
 
@@ -131,20 +272,46 @@ class Pomme(gym.Env):
     def make_items(self):
         self._items = utility.make_items(self._board, self._num_items)
 
+    def set_board_pool(self, board_pool):
+        '''Draws the board and items of each reset from a BoardPool.
+
+        Seeding the env then reseeds the pool. Pass None to go back to making
+        them in reset.
+        '''
+        self._board_pool = board_pool
+
     def act(self, obs):
         agents = [agent for agent in self._agents \
                   if agent.agent_id != self.training_agent]
-        return self.model.act(agents, obs, self.action_space)
+        return self.model.act(
+            agents,
+            obs,
+            self.action_space,
+            executor=self._act_executor,
+            timeout=self._act_timeout,
+            outstanding=self._outstanding_acts)
 
     def get_observations(self):
         self.observations = self.model.get_observations(
             self._board, self._agents, self._bombs, self._flames,
             self._is_partially_observable, self._agent_view_size,
-            self._game_type, self._env)
+            self._game_type, self._env,
+            read_only=self._read_only_observations)
         for obs in self.observations:
             obs['step_count'] = self._step_count
+        if self._board_analysis:
+            self._add_board_analysis(self.observations)
         return self.observations
 
+    def _add_board_analysis(self, observations):
+        '''Attaches a BoardAnalysis per distinct observed board'''
+        analysis = None
+        for obs in observations:
+            if analysis is None or self._is_partially_observable:
+                analysis = board_analysis.BoardAnalysis.from_observation(obs)
+            obs['board_analysis'] = analysis
+            obs['flame_time'] = analysis.flame_time
+
     def _get_rewards(self):
         return self.model.get_rewards(self._agents, self._game_type,
                                       self._step_count, self._max_steps)
@@ -164,8 +331,13 @@ class Pomme(gym.Env):
             self.set_json_info()
         else:
             self._step_count = 0
-            self.make_board()
-            self.make_items()
+            if self._board_pool is not None:
+                self._board, self._items = self._board_pool.get(
+                    self._board_size, self._num_rigid, self._num_wood,
+                    self._num_items, len(self._agents))
+            else:
+                self.make_board()
+                self.make_items()
             self._bombs = []
             self._flames = []
             self._powerups = []
@@ -176,10 +348,28 @@ class Pomme(gym.Env):
                 agent.set_start_position((row, col))
                 agent.reset()
 
+        self._reset_state_hash()
         return self.get_observations()
 
+    def _reset_state_hash(self):
+        '''Drops the kept hash, e.g. after the state was replaced'''
+        self._state_hash = None
+
+    def get_state_hash(self):
+        '''Returns the Zobrist hash of the current game state'''
+        if self._state_hash is not None:
+            return self._state_hash.value
+        state_hash = zobrist.ZobristHash(self._board, self._agents,
+                                         self._bombs, self._items,
+                                         self._flames)
+        if self._state_hashing:
+            self._state_hash = state_hash
+        return state_hash.value
+
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
+        if self._board_pool is not None:
+            self._board_pool.seed(seed)
         return [seed]
 
     def step(self, actions):
@@ -193,7 +383,8 @@ class Pomme(gym.Env):
             self._bombs,
             self._items,
             self._flames,
-            max_blast_strength=max_blast_strength)
+            max_blast_strength=max_blast_strength,
+            state_hash=self._state_hash)
         self._board, self._agents, self._bombs, self._items, self._flames = \
                                                                     result[:5]
 
@@ -277,6 +468,10 @@ class Pomme(gym.Env):
             self._viewer.close()
             self._viewer = None
 
+        if self._act_executor is not None:
+            self._act_executor.shutdown(wait=False)
+            self._act_executor = None
+
         for agent in self._agents:
             agent.shutdown()
 
@@ -297,6 +492,11 @@ class Pomme(gym.Env):
             (board, bomb_blast_strength, bomb_life, position, ammo,
              blast_strength, can_kick, teammate, enemies))
 
+    @staticmethod
+    def featurize_batch(observations, out=None, planar=False):
+        '''Featurizes a list of observations at once, see featurize_batch'''
+        return featurize_batch(observations, out, planar)
+
     def save_json(self, record_json_dir):
         info = self.get_json_info()
         count = "{0:0=3d}".format(self._step_count)
@@ -321,6 +521,15 @@ class Pomme(gym.Env):
             ret[key] = json.dumps(value, cls=utility.PommermanJSONEncoder)
         return ret
 
+    def get_game_state(self):
+        '''Returns a compact GameState snapshot of the current game'''
+        return game_state.GameState.from_env(self)
+
+    def set_game_state(self, state):
+        '''Restores the game to a GameState snapshot'''
+        state.to_env(self)
+        self._reset_state_hash()
+
     def set_json_info(self):
         """Sets the game state as the init_game_state."""
         board_size = int(self._init_game_state['board_size'])
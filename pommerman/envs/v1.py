@@ -15,6 +15,8 @@ The collapsing works in the following manner:
    and turn it into rigid walls. This has the effect of destroying any items,
    bombs (which don't go off), and agents in those squares.
 """
+import json
+
 from .. import constants
 from .. import utility
 from . import v0
@@ -88,7 +90,8 @@ class Pomme(v0.Pomme):
 
     def get_json_info(self):
         ret = super().get_json_info()
-        ret['collapses'] = json.dumps(self.collapses, cls=json_encoder)
+        ret['collapses'] = json.dumps(
+            self.collapses, cls=utility.PommermanJSONEncoder)
         return ret
 
     def set_json_info(self):
@@ -101,6 +104,7 @@ class Pomme(v0.Pomme):
         for ring, collapse in enumerate(self.collapses):
             if self._step_count == collapse:
                 self._board = self._collapse_board(ring)
+                self._reset_state_hash()
                 break
 
         return obs, reward, done, info
@@ -101,11 +101,20 @@ class Pomme(v0.Pomme):
 
     @staticmethod
     def featurize(obs):
-        ret = super().featurize(obs)
+        ret = v0.Pomme.featurize(obs)
         message = obs['message']
         message = utility.make_np_float(message)
         return np.concatenate((ret, message))
 
+    @staticmethod
+    def featurize_batch(observations, out=None, planar=False):
+        '''Featurizes a list of observations at once, with their messages'''
+        return v0.featurize_batch(
+            observations,
+            out,
+            planar,
+            extra=[obs['message'] for obs in observations])
+
     def get_json_info(self, json_encoder=utility.PommermanJSONEncoder):
         ret = super().get_json_info()
         ret['radio_vocab_size'] = json.dumps(
@@ -1,10 +1,15 @@
 '''Module to manage and advanced game state'''
 from collections import defaultdict
+from concurrent import futures
+import time
 
 import numpy as np
 
+from . import batched_forward_model
+from . import blast
 from . import constants
 from . import characters
+from . import observation_builder
 from . import utility
 
 
@@ -21,8 +26,13 @@ class ForwardModel(object):
             is_partially_observable,
             agent_view_size,
             action_space,
+            game_type,
+            step_count=0,
+            max_steps=1000,
             training_agent=None,
-            is_communicative=False):
+            is_communicative=False,
+            game_env=None,
+            max_blast_strength=10):
         """Run the forward model.
 
         Args:
@@ -38,9 +48,14 @@ class ForwardModel(object):
           agent_view_size: If it's partially observable, then the size of the
             square that the agent can view.
           action_space: The actions that each agent can take.
+          game_type: The GameType being played.
+          step_count: The number of steps taken so far in the game.
+          max_steps: The number of steps after which the game is over.
           training_agent: The training agent to pass to done.
           is_communicative: Whether the action depends on communication
             observations as well.
+          game_env: The env id to put in the observations.
+          max_blast_strength: The cap on the agents' blast strength.
 
         Returns:
           steps: The list of step results, which are each a dict of "obs",
@@ -54,19 +69,31 @@ class ForwardModel(object):
           info: The result of the game if it's completed.
         """
         steps = []
-        for _ in num_times:
-            obs = self.get_observations(
-                board, agents, bombs, is_partially_observable, agent_view_size)
+        done = False
+        info = None
+        for _ in range(num_times):
+            obs = self.get_observations(board, agents, bombs, flames,
+                                        is_partially_observable,
+                                        agent_view_size, game_type, game_env)
             actions = self.act(
                 agents, obs, action_space, is_communicative=is_communicative)
             board, agents, bombs, items, flames = self.step(
-                actions, board, agents, bombs, items, flames)
-            next_obs = self.get_observations(
-                board, agents, bombs, is_partially_observable, agent_view_size)
+                actions,
+                board,
+                agents,
+                bombs,
+                items,
+                flames,
+                max_blast_strength=max_blast_strength)
+            step_count += 1
+            next_obs = self.get_observations(board, agents, bombs, flames,
+                                             is_partially_observable,
+                                             agent_view_size, game_type,
+                                             game_env)
             reward = self.get_rewards(agents, game_type, step_count, max_steps)
-            done = self.get_done(agents, game_type, step_count, max_steps,
+            done = self.get_done(agents, step_count, max_steps, game_type,
                                  training_agent)
-            info = self.get_info(done, rewards, game_type, agents)
+            info = self.get_info(done, reward, game_type, agents)
 
             steps.append({
                 "obs": obs,
@@ -82,7 +109,13 @@ class ForwardModel(object):
         return steps, board, agents, bombs, items, flames, done, info
 
     @staticmethod
-    def act(agents, obs, action_space, is_communicative=False):
+    def act(agents,
+            obs,
+            action_space,
+            is_communicative=False,
+            executor=None,
+            timeout=None,
+            outstanding=None):
         """Returns actions for each agent in this list.
 
         Args:
@@ -91,6 +124,18 @@ class ForwardModel(object):
           action_space: The action space for the environment using this model.
           is_communicative: Whether the action depends on communication
             observations as well.
+          executor: Optional concurrent.futures.Executor. If given, the
+            remote agents, i.e. those whose is_remote() is True, are asked
+            for their actions on it all at once, so a step waits for the
+            slowest of them rather than for all of them in turn. The other
+            agents still act one after another in the calling thread.
+          timeout: With an executor, how many seconds to wait for each remote
+            agent. An agent that doesn't answer in time gets the Stop action.
+          outstanding: Optional dict from agent_id to the future of an act
+            that timed out, kept by the caller from step to step. A running
+            act can't be cancelled, and the agent may not handle two at once,
+            so until it finishes the agent gets the Stop action without being
+            asked again. The acts that time out now are added to it.
 
         Returns a list of actions.
         """
@@ -114,12 +159,46 @@ class ForwardModel(object):
             else:
                 return [constants.Action.Stop.value, 0, 0]
 
+        act_agent = act_with_communication if is_communicative \
+            else act_ex_communication
+        stop = [constants.Action.Stop.value, 0, 0] if is_communicative \
+            else constants.Action.Stop.value
+
+        busy = set()
+        if outstanding:
+            for agent_id, future in list(outstanding.items()):
+                if future.done():
+                    del outstanding[agent_id]
+                else:
+                    busy.add(agent_id)
+
+        pending = {}
+        if executor is not None:
+            for num, agent in enumerate(agents):
+                if agent.is_alive and agent.is_remote() and \
+                   agent.agent_id not in busy:
+                    pending[num] = executor.submit(act_agent, agent)
+
         ret = []
-        for agent in agents:
-            if is_communicative:
-                ret.append(act_with_communication(agent))
+        for num, agent in enumerate(agents):
+            if agent.agent_id in busy:
+                ret.append(stop)
             else:
-                ret.append(act_ex_communication(agent))
+                ret.append(None if num in pending else act_agent(agent))
+
+        if pending:
+            deadline = None if timeout is None else time.time() + timeout
+            for num, future in pending.items():
+                wait = None if deadline is None else \
+                    max(0, deadline - time.time())
+                try:
+                    ret[num] = future.result(timeout=wait)
+                except futures.TimeoutError:
+                    print('Timeout! Agent %d gets the Stop action.' %
+                          agents[num].agent_id)
+                    if not future.cancel() and outstanding is not None:
+                        outstanding[agents[num].agent_id] = future
+                    ret[num] = stop
         return ret
 
     @staticmethod
@@ -129,8 +208,10 @@ class ForwardModel(object):
              curr_bombs,
              curr_items,
              curr_flames,
-             max_blast_strength=10):
-        board_size = len(curr_board)
+             max_blast_strength=10,
+             state_hash=None):
+        # The ZobristHash to keep up to date, if any, needs the old board.
+        old_board = curr_board.copy() if state_hash is not None else None
 
         # Tick the flames. Replace any dead ones with passages. If there is an
         # item there, then reveal that item.
@@ -426,51 +507,34 @@ class ForwardModel(object):
                         constants.Item(curr_board[agent.position]),
                         max_blast_strength=max_blast_strength)
 
-        # Explode bombs.
-        exploded_map = np.zeros_like(curr_board)
-        has_new_explosions = False
-
+        # Explode bombs, along with every bomb caught in a blast.
+        exploding = []
         for bomb in curr_bombs:
             bomb.tick()
-            if bomb.exploded():
-                has_new_explosions = True
-            elif curr_board[bomb.position] == constants.Item.Flames.value:
+            if not bomb.exploded() and \
+               curr_board[bomb.position] == constants.Item.Flames.value:
                 bomb.fire()
-                has_new_explosions = True
-
-        # Chain the explosions.
-        while has_new_explosions:
-            next_bombs = []
-            has_new_explosions = False
-            for bomb in curr_bombs:
-                if not bomb.exploded():
-                    next_bombs.append(bomb)
-                    continue
+            exploding.append(bomb.exploded())
+
+        exploded, exploded_map = blast.resolve_chain(
+            curr_board, [bomb.position for bomb in curr_bombs],
+            [bomb.blast_strength for bomb in curr_bombs], exploding)
 
+        next_bombs = []
+        for bomb, is_exploded in zip(curr_bombs, exploded):
+            if is_exploded:
+                bomb.fire()
                 bomb.bomber.incr_ammo()
-                for _, indices in bomb.explode().items():
-                    for r, c in indices:
-                        if not all(
-                            [r >= 0, c >= 0, r < board_size, c < board_size]):
-                            break
-                        if curr_board[r][c] == constants.Item.Rigid.value:
-                            break
-                        exploded_map[r][c] = 1
-                        if curr_board[r][c] == constants.Item.Wood.value:
-                            break
-
-            curr_bombs = next_bombs
-            for bomb in curr_bombs:
-                if bomb.in_range(exploded_map):
-                    bomb.fire()
-                    has_new_explosions = True
+            else:
+                next_bombs.append(bomb)
+        curr_bombs = next_bombs
 
         # Update the board's bombs.
         for bomb in curr_bombs:
             curr_board[bomb.position] = constants.Item.Bomb.value
 
         # Update the board's flames.
-        flame_positions = np.where(exploded_map == 1)
+        flame_positions = np.where(exploded_map)
         for row, col in zip(flame_positions[0], flame_positions[1]):
             curr_flames.append(characters.Flame((row, col)))
         for flame in curr_flames:
@@ -483,91 +547,127 @@ class ForwardModel(object):
             else:
                 curr_board[agent.position] = utility.agent_value(agent.agent_id)
 
+        if state_hash is not None:
+            state_hash.update(old_board, curr_board, curr_agents, curr_bombs,
+                              curr_items, curr_flames)
+
         return curr_board, curr_agents, curr_bombs, curr_items, curr_flames
 
+    @staticmethod
+    def simulate(state,
+                 joint_actions,
+                 game_type,
+                 max_steps=1000,
+                 max_blast_strength=10):
+        """Steps a GameState without touching it or any game objects.
+
+        Args:
+          state: The GameState to step from. It is left unchanged.
+          joint_actions: Either one action per agent, or an (M, num_agents)
+            array of joint actions to step M copies of the state with.
+          game_type: The GameType being played.
+          max_steps: The number of steps after which the game is over.
+          max_blast_strength: The cap on the agents' blast strength.
+
+        Returns:
+          next_state: The GameState after the step, or a list of M of them.
+          rewards: The (num_agents,) rewards, or (M, num_agents) of them.
+          done: Whether the game is over, or an (M,) array of flags.
+        """
+        joint_actions = np.asarray(joint_actions, dtype=np.int64)
+        batch = joint_actions.reshape(-1, state.num_agents)
+        model = batched_forward_model.BatchedForwardModel(
+            len(batch),
+            state.board_size,
+            num_agents=state.num_agents,
+            max_blast_strength=max_blast_strength,
+            max_bombs=state.max_bombs)
+        model.set_state(slice(None), state)
+        model.step(batch)
+        next_states = model.get_states()
+        rewards = model.get_rewards(game_type, max_steps)
+        dones = model.get_done(game_type, max_steps)
+        if joint_actions.ndim == 1:
+            return next_states[0], rewards[0], bool(dones[0])
+        return next_states, rewards, dones
+
+    @classmethod
+    def expand(cls,
+               state,
+               game_type,
+               agent_ids=None,
+               default_actions=None,
+               max_steps=1000,
+               max_blast_strength=10):
+        """Simulates every joint action of a set of agents in one call.
+
+        Args:
+          state: The GameState to expand. It is left unchanged.
+          game_type: The GameType being played.
+          agent_ids: The k agents whose actions are enumerated. Defaults to
+            the agents that are alive.
+          default_actions: The actions of all the other agents, one per agent.
+            Defaults to Stop.
+          max_steps: The number of steps after which the game is over.
+          max_blast_strength: The cap on the agents' blast strength.
+
+        Returns:
+          joint_actions: The (6^k, num_agents) joint actions, ordered as
+            itertools.product over the agents in agent_ids.
+          next_states: The list of 6^k child GameStates.
+          rewards: The (6^k, num_agents) rewards.
+          dones: The (6^k,) done flags.
+        """
+        if agent_ids is None:
+            agent_ids = np.flatnonzero(state.agent_alive)
+        agent_ids = list(agent_ids)
+        if default_actions is None:
+            default_actions = [constants.Action.Stop.value] * state.num_agents
+
+        num_actions = len(constants.Action)
+        joint_actions = np.tile(
+            np.asarray(default_actions, dtype=np.int64),
+            (num_actions**len(agent_ids), 1))
+        if agent_ids:
+            grid = np.indices([num_actions] * len(agent_ids))
+            joint_actions[:, agent_ids] = grid.reshape(len(agent_ids), -1).T
+        next_states, rewards, dones = cls.simulate(
+            state, joint_actions, game_type, max_steps, max_blast_strength)
+        return joint_actions, next_states, rewards, dones
+
     def get_observations(self, curr_board, agents, bombs, flames,
                          is_partially_observable, agent_view_size,
-                         game_type, game_env):
+                         game_type, game_env, read_only=False):
         """Gets the observations as an np.array of the visible squares.
 
         The agent gets to choose whether it wants to keep the fogged part in
         memory.
+
+        The arrays are built by an ObservationBuilder that is kept across
+        calls and only updates what changed. With read_only, the board and
+        layer arrays are read-only views that the next call overwrites
+        instead of fresh copies.
         """
         board_size = len(curr_board)
+        builder = getattr(self, '_observation_builder', None)
+        if builder is None or builder.config != (
+                board_size, is_partially_observable, agent_view_size):
+            builder = observation_builder.ObservationBuilder(
+                board_size, is_partially_observable, agent_view_size)
+            self._observation_builder = builder
+        builder.read_only = read_only
+        return builder.build(curr_board, agents, bombs, flames, game_type,
+                             game_env)
 
-        def make_bomb_maps(position):
-            ''' Makes an array of an agents bombs and the bombs attributes '''
-            blast_strengths = np.zeros((board_size, board_size))
-            life = np.zeros((board_size, board_size))
-            moving_direction = np.zeros((board_size, board_size))
-
-            for bomb in bombs:
-                x, y = bomb.position
-                if not is_partially_observable \
-                   or in_view_range(position, x, y):
-                    blast_strengths[(x, y)] = bomb.blast_strength
-                    life[(x, y)] = bomb.life
-                    if bomb.moving_direction is not None:
-                        moving_direction[(x, y)] = bomb.moving_direction.value
-            return blast_strengths, life, moving_direction
-
-        def make_flame_map(position):
-            ''' Makes an array of an agents flame life'''
-            life = np.zeros((board_size, board_size))
-
-            for flame in flames:
-                x, y = flame.position
-                if not is_partially_observable \
-                   or in_view_range(position, x, y):
-                    # +1 needed because flame removal check is done
-                    # before flame is ticked down, i.e. flame life
-                    # in environment is 2 -> 1 -> 0 -> dead
-                    life[(x, y)] = flame.life + 1
-            return life
-
-        def in_view_range(position, v_row, v_col):
-            '''Checks to see if a tile is in an agents viewing area'''
-            row, col = position
-            return all([
-                row >= v_row - agent_view_size, row <= v_row + agent_view_size,
-                col >= v_col - agent_view_size, col <= v_col + agent_view_size
-            ])
-
-        attrs = [
-            'position', 'blast_strength', 'can_kick', 'teammate', 'ammo',
-            'enemies'
-        ]
-        alive_agents = [
-            utility.agent_value(agent.agent_id)
-            for agent in agents
-            if agent.is_alive
-        ]
-
-        observations = []
-        for agent in agents:
-            agent_obs = {'alive': alive_agents}
-            board = curr_board.copy()
-            if is_partially_observable:
-                for row in range(board_size):
-                    for col in range(board_size):
-                        if not in_view_range(agent.position, row, col):
-                            board[row, col] = constants.Item.Fog.value
-            agent_obs['board'] = board
-            bomb_blast_strengths, bomb_life, bomb_moving_direction = make_bomb_maps(agent.position)
-            agent_obs['bomb_blast_strength'] = bomb_blast_strengths
-            agent_obs['bomb_life'] = bomb_life
-            agent_obs['bomb_moving_direction'] = bomb_moving_direction
-            flame_life = make_flame_map(agent.position)
-            agent_obs['flame_life'] = flame_life
-            agent_obs['game_type'] = game_type.value
-            agent_obs['game_env'] = game_env
-
-            for attr in attrs:
-                assert hasattr(agent, attr)
-                agent_obs[attr] = getattr(agent, attr)
-            observations.append(agent_obs)
-
-        return observations
+    @staticmethod
+    def get_flame_time(curr_board, bombs):
+        '''Returns the danger map of blast.flame_time for the Bomb objects'''
+        bomb_blast_strength = np.zeros(curr_board.shape, dtype=np.int64)
+        bomb_life = np.zeros(curr_board.shape, dtype=np.int64)
+        for bomb in bombs:
+            bomb_blast_strength[bomb.position] = bomb.blast_strength
+            bomb_life[bomb.position] = bomb.life
+        return blast.flame_time(curr_board, bomb_blast_strength, bomb_life)
 
     @staticmethod
     def get_done(agents, step_count, max_steps, game_type, training_agent):
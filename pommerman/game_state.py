@@ -0,0 +1,273 @@
+'''Module for a compact, array-backed snapshot of the game state.
+
+The env keeps its state as a board plus lists of Bomber, Bomb and Flame
+objects and an items dict, so snapshotting it for search means deep-copying
+all of them. A GameState holds the same state in one contiguous NumPy record,
+which makes clone() a single memcpy and to_bytes() a single buffer copy. The
+field layout is the one of the BatchedForwardModel, minus the batch dimension.
+'''
+import functools
+
+import numpy as np
+
+from . import characters
+from . import constants
+
+# The flame bitmask is a uint8, so flame lives have to fit in 8 bits.
+_MAX_FLAME_LIFE = 7
+
+
+@functools.lru_cache(maxsize=None)
+def state_dtype(board_size, num_agents, max_bombs):
+    '''Returns the record dtype of a GameState with these dimensions'''
+    board = (board_size, board_size)
+    return np.dtype(
+        [
+            ('board', np.uint8, board),
+            ('items', np.uint8, board),
+            ('flames', np.uint8, board),
+            ('step_count', np.int64),
+            ('agent_position', np.int64, (num_agents, 2)),
+            ('agent_alive', np.bool_, (num_agents,)),
+            ('agent_ammo', np.int64, (num_agents,)),
+            ('agent_blast_strength', np.int64, (num_agents,)),
+            ('agent_can_kick', np.bool_, (num_agents,)),
+            ('bomb_count', np.int64),
+            ('bomb_position', np.int64, (max_bombs, 2)),
+            ('bomb_life', np.int64, (max_bombs,)),
+            ('bomb_blast_strength', np.int64, (max_bombs,)),
+            ('bomb_bomber', np.int64, (max_bombs,)),
+            ('bomb_moving_direction', np.int64, (max_bombs,)),
+        ],
+        align=True)
+
+
+# The table fields, shared with the BatchedForwardModel.
+FIELDS = state_dtype(1, 1, 1).names
+
+
+def _character(agent):
+    '''Returns the Bomber behind an agent, or the agent if it is a Bomber'''
+    return getattr(agent, '_character', agent)
+
+
+class GameState(object):
+    """The full state of one game, backed by a single NumPy record.
+
+    Every field of FIELDS is an attribute holding a writable view into the
+    record, so writing to e.g. state.board[row, col] updates the state. The
+    scalar step_count and bomb_count fields are exposed as ints.
+
+    Board state:
+      board: (size, size) uint8 array of Item values.
+      items: (size, size) uint8 array of the powerups hidden under wood
+        (0 when there is none).
+      flames: (size, size) uint8 bitmask of the flame lives on each cell. Bit
+        k is set if a flame with life k covers the cell, as several flames
+        can share a cell.
+
+    Agent table, indexed by agent_id:
+      agent_position: (num_agents, 2), agent_alive, agent_ammo,
+        agent_blast_strength and agent_can_kick.
+
+    Bomb table, where slots [0, bomb_count) hold the live bombs in the order
+    of the env's bomb list:
+      bomb_position: (max_bombs, 2), bomb_life, bomb_blast_strength,
+      bomb_bomber (agent_id) and bomb_moving_direction (an Action value, 0
+      when the bomb is not moving).
+    """
+
+    def __init__(self, board_size, num_agents=4, max_bombs=None, data=None):
+        self.board_size = board_size
+        self.num_agents = num_agents
+        # There can never be more than one bomb per cell.
+        self.max_bombs = max_bombs or board_size**2
+        dtype = state_dtype(board_size, num_agents, self.max_bombs)
+        if data is None:
+            data = np.zeros((), dtype=dtype)
+        assert data.dtype == dtype and data.shape == ()
+        self._data = data
+        for name in FIELDS:
+            if name not in ['step_count', 'bomb_count']:
+                setattr(self, name, data[name])
+
+    @property
+    def step_count(self):
+        return int(self._data['step_count'])
+
+    @step_count.setter
+    def step_count(self, value):
+        self._data['step_count'] = value
+
+    @property
+    def bomb_count(self):
+        return int(self._data['bomb_count'])
+
+    @bomb_count.setter
+    def bomb_count(self, value):
+        self._data['bomb_count'] = value
+
+    def clone(self):
+        '''Returns an independent copy of this state'''
+        return GameState(self.board_size, self.num_agents, self.max_bombs,
+                         self._data.copy())
+
+    def copy_from(self, other):
+        '''Overwrites this state in place with another of the same shape'''
+        np.copyto(self._data, other._data)
+
+    def __eq__(self, other):
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return self._data.dtype == other._data.dtype and all(
+            np.array_equal(self._data[name], other._data[name])
+            for name in FIELDS)
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        return ret if ret is NotImplemented else not ret
+
+    __hash__ = None
+
+    def to_bytes(self):
+        '''Serializes the state, including its dimensions'''
+        header = np.array(
+            [self.board_size, self.num_agents, self.max_bombs],
+            dtype=np.int64)
+        return header.tobytes() + self._data.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''Deserializes a state written by to_bytes'''
+        header = np.frombuffer(data, dtype=np.int64, count=3)
+        board_size, num_agents, max_bombs = [int(x) for x in header]
+        dtype = state_dtype(board_size, num_agents, max_bombs)
+        record = np.frombuffer(
+            data, dtype=dtype, count=1, offset=header.nbytes)
+        return cls(board_size, num_agents, max_bombs,
+                   record.reshape(()).copy())
+
+    @classmethod
+    def from_game(cls,
+                  board,
+                  agents,
+                  bombs,
+                  items,
+                  flames,
+                  step_count=0,
+                  max_bombs=None):
+        """Builds a state from the object representation of ForwardModel.
+
+        Args:
+          board: The board array.
+          agents: The list of agents, ordered by agent_id.
+          bombs: The list of Bomb objects.
+          items: Dict of position to the Item value hidden there.
+          flames: The list of Flame objects.
+          step_count: The number of steps taken so far in this game.
+          max_bombs: The size of the bomb table. Defaults to one per cell.
+
+        Returns:
+          The new GameState.
+        """
+        state = cls(len(board), len(agents), max_bombs)
+        assert len(bombs) <= state.max_bombs
+        state.board[:] = board
+        for position, value in items.items():
+            state.items[position] = value
+        for flame in flames:
+            assert flame.life <= _MAX_FLAME_LIFE
+            state.flames[flame.position] |= 1 << flame.life
+        state.step_count = step_count
+
+        for agent in agents:
+            id_ = agent.agent_id
+            state.agent_position[id_] = agent.position
+            state.agent_alive[id_] = agent.is_alive
+            state.agent_ammo[id_] = agent.ammo
+            state.agent_blast_strength[id_] = agent.blast_strength
+            state.agent_can_kick[id_] = agent.can_kick
+
+        state.bomb_count = len(bombs)
+        for slot, bomb in enumerate(bombs):
+            state.bomb_position[slot] = bomb.position
+            state.bomb_life[slot] = bomb.life
+            state.bomb_blast_strength[slot] = bomb.blast_strength
+            state.bomb_bomber[slot] = bomb.bomber.agent_id
+            state.bomb_moving_direction[slot] = \
+                bomb.moving_direction.value if bomb.is_moving() else 0
+        return state
+
+    def get_board(self):
+        '''Returns a copy of the board'''
+        return self.board.copy()
+
+    def get_agents(self, agents):
+        '''Writes the agent table into the agents, ordered by agent_id'''
+        for agent in agents:
+            character = _character(agent)
+            id_ = agent.agent_id
+            character.position = tuple(
+                int(x) for x in self.agent_position[id_])
+            character.is_alive = bool(self.agent_alive[id_])
+            character.ammo = int(self.agent_ammo[id_])
+            character.blast_strength = int(self.agent_blast_strength[id_])
+            character.can_kick = bool(self.agent_can_kick[id_])
+        return agents
+
+    def get_bombs(self, agents):
+        '''Returns the bomb table as Bomb objects laid by the agents'''
+        bombs = []
+        for slot in range(self.bomb_count):
+            direction = int(self.bomb_moving_direction[slot])
+            bombs.append(
+                characters.Bomb(
+                    agents[self.bomb_bomber[slot]],
+                    tuple(int(x) for x in self.bomb_position[slot]),
+                    int(self.bomb_life[slot]),
+                    int(self.bomb_blast_strength[slot]),
+                    constants.Action(direction) if direction else None))
+        return bombs
+
+    def get_items(self):
+        '''Returns the items layer as a dict of position to Item value'''
+        rows, cols = np.nonzero(self.items)
+        return {(int(r), int(c)): int(self.items[r, c])
+                for r, c in zip(rows, cols)}
+
+    def get_flames(self):
+        '''Returns the flame bitmask as Flame objects, oldest first'''
+        flames = []
+        for life in range(_MAX_FLAME_LIFE + 1):
+            rows, cols = np.nonzero(self.flames & (1 << life))
+            for r, c in zip(rows, cols):
+                flames.append(characters.Flame((int(r), int(c)), life))
+        return flames
+
+    def to_game(self, agents):
+        """Writes the state back into the object representation.
+
+        Args:
+          agents: The agents to write the agent state into, ordered by
+            agent_id. They are also used as the bombers of the bombs.
+
+        Returns:
+          The same (board, agents, bombs, items, flames) tuple that
+          ForwardModel.step returns.
+        """
+        return (self.get_board(), self.get_agents(agents),
+                self.get_bombs(agents), self.get_items(), self.get_flames())
+
+    @classmethod
+    def from_env(cls, env, max_bombs=None):
+        '''Snapshots the current state of a Pomme env'''
+        return cls.from_game(env._board, env._agents, env._bombs, env._items,
+                             env._flames, env._step_count, max_bombs)
+
+    def to_env(self, env):
+        '''Restores a Pomme env to this state'''
+        assert env._board_size == self.board_size
+        assert len(env._agents) == self.num_agents
+        env._board, _, env._bombs, env._items, env._flames = \
+            self.to_game(env._agents)
+        env._step_count = self.step_count
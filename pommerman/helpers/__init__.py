@@ -8,8 +8,15 @@ GAME_SERVERS = {id_: os.getenv("PLAYGROUND_GAME_INSTANCE_%d" % id_)
 
 
 # NOTE: This routine is meant for internal usage.
-def make_agent_from_string(agent_string, agent_id, docker_env_dict=None):
-    '''Internal helper for building an agent instance'''
+def make_agent_from_string(agent_string,
+                           agent_id,
+                           docker_env_dict=None,
+                           container_pool=None):
+    '''Internal helper for building an agent instance
+
+    Local docker agents get their containers from container_pool, a
+    ContainerPool, if given.
+    '''
     
     agent_type, agent_control = agent_string.split("::")
 
@@ -32,8 +39,14 @@ def make_agent_from_string(agent_string, agent_id, docker_env_dict=None):
         else:
             server = GAME_SERVERS[agent_id]
         assert port is not None
+        if USE_GAME_SERVERS:
+            container_pool = None
         agent_instance = agents.DockerAgent(
-            agent_control, port=port, server=server, env_vars=docker_env_dict)
+            agent_control,
+            port=port,
+            server=server,
+            env_vars=docker_env_dict,
+            container_pool=container_pool)
     elif agent_type == "http":
         host, port = agent_control.split(":")
         agent_instance = agents.HttpAgent(port=port, host=host)
@@ -222,7 +222,10 @@ raised or not)"""
         ],
     )
     env.reset()
-    env._board = numpy.array(replay_obj["board"])
+    if "state" in replay_obj:
+        env.set_game_state(pommerman.replay.decode_state(replay_obj["state"]))
+    else:
+        env._board = numpy.array(replay_obj["board"])
     # Note: Render FPS is set to 30 as it'll be smoother
     env._render_fps = 30
     for i in replay_obj["actions"]:
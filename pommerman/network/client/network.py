@@ -124,11 +124,18 @@ action of the agent and server)"""
             match_id=self.match_id,
             turn_id=turn_id)
 
-    def get_replay(self, id):
+    def get_replay(self, id, start=None, stop=None):
         """Description: Send the action to the server for playing out  
         Arguments:  
-        * id: The ID of the match to be replayed"""
-        self._send(intent=constants.NetworkCommands.replay.value, replay_id=id)
+        * id: The ID of the match to be replayed  
+        * start: The first step whose actions are sent (Defaults to the first)  
+        * stop: The step after the last one whose actions are sent (Defaults \
+to the end of the match)"""
+        self._send(
+            intent=constants.NetworkCommands.replay.value,
+            replay_id=id,
+            start=start,
+            stop=stop)
         try:
             status, replay = rapidjson.loads(
                 str(gzip.decompress(self.ws_.recv()), "utf-8"))
@@ -14,19 +14,25 @@ import rapidjson
 import gzip
 import enum
 import pommerman
+from pommerman import replay
+from pommerman.replay_archive import ReplayArchive
 import numpy
 
+MATCHES_DIR = "matches"
 
-def unique_uuid(dir):
+
+def unique_uuid(dir, archive=None):
     """Generates a unique UUID and checks for collision with files within the
-    specified directory (So we don't override a pre-existing file)"""
+    specified directory and with the matches of the archive (So we don't
+    override a pre-existing match)"""
     try:
         ls_dir = os.listdir(dir)
     except FileNotFoundError:
         os.makedirs(dir)
         ls_dir = []
     uuid_ = str(uuid.uuid4())[:10]
-    while uuid_ + ".json" in ls_dir:
+    while uuid_ + ".json" in ls_dir or (archive is not None and
+                                        uuid_ in archive):
         uuid_ = str(uuid.uuid4())[:10]
     return uuid_
 
@@ -54,7 +60,8 @@ def resolve_classes(i):
 
 def thread(players, queue_subproc, mode):
     """Handles running of the match loop"""
-    uuid_ = unique_uuid("matches")
+    archive = ReplayArchive(MATCHES_DIR)
+    uuid_ = unique_uuid(MATCHES_DIR, archive)
     base_agent = pommerman.agents.BaseAgent
     env = pommerman.make(
         mode,
@@ -65,6 +72,9 @@ def thread(players, queue_subproc, mode):
     obs = env.reset()
     record = {
         "board": numpy.array(env._board, copy=True).tolist(),
+        # The board alone misses the items under the wood, so keep the whole
+        # initial state for rebuilding the match.
+        "state": replay.encode_state(env.get_game_state()),
         "actions": [],
         "mode": str(mode)
     }
@@ -103,10 +113,10 @@ def thread(players, queue_subproc, mode):
             act = [0, 0, 0, 0]
         record["actions"].append(numpy.array(act, copy=True).tolist())
         obs, rew, done = env.step(act)[:3]
-    record["reward"] = rew
+    record["reward"] = [int(x) for x in rew]
     env.close()
-    with open("./matches/" + uuid_ + ".json", "w") as file:
-        rapidjson.dump(record, file)
+    actions = record.pop("actions")
+    archive.append(uuid_, record, actions)
     net.send([constants.SubprocessCommands.match_end.value, rew])
     net.recv()
     exit(0)
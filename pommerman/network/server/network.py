@@ -17,6 +17,8 @@ import re
 import gzip
 import rapidjson
 import uuid
+from pommerman.replay_archive import ReplayArchive
+from . import match
 
 CONCURRENTLY_LOOKING = {
     "room": {},
@@ -29,6 +31,51 @@ PIPE_MAIN = False  # This holds the queue (Main-proc <-> Network-proc)
 QUEUE_SUBPROC = False  # This holds the queue (Subproc <-> Network-proc)
 MODE = ""
 STOP_TIMEOUT = 0
+REPLAY_ARCHIVE = None  # This holds the archive the replays are served from
+
+
+def _replay_archive():
+    """Returns the archive of the matches, opening it on first use"""
+    global REPLAY_ARCHIVE
+    if REPLAY_ARCHIVE is None:
+        REPLAY_ARCHIVE = ReplayArchive(
+            os.path.join(os.getcwd(), match.MATCHES_DIR))
+    return REPLAY_ARCHIVE
+
+
+def _load_replay(replay_id, start, stop):
+    """Returns the record of a match, with the actions of the steps from
+start to stop"""
+    archive = _replay_archive()
+    if replay_id in archive:
+        record = archive.get_meta(replay_id)
+        record["actions"] = archive.get_steps(replay_id, start, stop)
+    else:
+        # Note: Matches played before the archive are in their own files
+        with open(
+                os.path.join(
+                    os.path.join(os.getcwd(), match.MATCHES_DIR),
+                    replay_id + ".json"), 'r') as f:
+            record = rapidjson.load(f)
+        record["actions"] = record["actions"][start:stop]
+    record["start"] = start
+    return record
+
+
+def replay_response(message):
+    """Returns the gzipped reply to a replay request. The request can ask
+for a range of steps with "start" and "stop" """
+    try:
+        replay_id = str(message["replay_id"])
+        if re.fullmatch("^[a-z0-9-]*$", replay_id) is None:
+            raise ValueError(replay_id)
+        stop = message.get("stop")
+        record = _load_replay(replay_id, int(message.get("start") or 0),
+                              None if stop is None else int(stop))
+        reply = [constants.NetworkCommands.status_ok.value, record]
+    except:
+        reply = [constants.NetworkCommands.status_fail.value]
+    return gzip.compress(bytes(rapidjson.dumps(reply), "utf8"))
 
 
 async def message_parse(message, websocket):
@@ -52,35 +99,10 @@ async def message_parse(message, websocket):
             MATCH_PROCESS[message["match_id"]]["recv"][MATCH_PROCESS[message[
                 "match_id"]]["players"].index(message["player_id"])] = True
     elif message["intent"] is constants.NetworkCommands.replay.value:
-        try:
-            with open(
-                    os.path.join(
-                        os.path.join(os.getcwd(), "matches"),
-                        str(message["replay_id"]) + ".json"), 'r') as f:
-                # Note: Registry expression match comes after as it's an expensive operation as compared to file I/O
-                if re.fullmatch("^[a-z0-9-]*$",
-                                message["replay_id"]) is not None:
-                    f = rapidjson.load(f)
-                    await websocket.send(
-                        gzip.compress(
-                            bytes(
-                                rapidjson.dumps([
-                                    constants.NetworkCommands.status_ok.value, f
-                                ]), "utf8")))
-                else:
-                    await websocket.send(
-                        gzip.compress(
-                            bytes(
-                                rapidjson.dumps([
-                                    constants.NetworkCommands.status_fail.value
-                                ]), "utf8")))
-        except:
-            await websocket.send(
-                gzip.compress(
-                    bytes(
-                        rapidjson.dumps(
-                            [constants.NetworkCommands.status_fail.value]),
-                        "utf8")))
+        # Note: Reading and compressing a replay is done off the event loop
+        # so that serving replays doesn't hold up the matches
+        await websocket.send(await asyncio.get_event_loop().run_in_executor(
+            None, replay_response, message))
     elif message["intent"] in [
             constants.NetworkCommands.match.value,
             constants.NetworkCommands.room.value
@@ -0,0 +1,168 @@
+'''Module to build the agent observations with persistent buffers.
+
+ForwardModel.get_observations used to allocate a board copy and four
+board-sized arrays per agent per step, fill them by looping over every bomb
+and flame and, with partial observability, fog the board cell by cell. The
+ObservationBuilder instead keeps its buffers between steps:
+  - The bomb and flame layers of the full board are built once per step for
+    all agents. Only the cells of last step's bombs and flames are cleared.
+  - With partial observability every agent has its own buffers. The view is
+    a precomputed window slice: cells outside of it are fogged once and only
+    refogged when the window moves.
+  - In view mode the observation arrays are read-only views of the buffers
+    instead of copies. They are overwritten by the next step, so this is only
+    for callers that neither mutate nor keep the observations around.
+'''
+import numpy as np
+
+from . import constants
+from . import utility
+
+LAYERS = [
+    'bomb_blast_strength', 'bomb_life', 'bomb_moving_direction', 'flame_life'
+]
+
+
+def _read_only(array):
+    '''Returns a view of array that can't be written to'''
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class _Buffers(object):
+    """The board and layer arrays backing one set of observations."""
+
+    def __init__(self, board_size):
+        shape = (board_size, board_size)
+        self.board = np.zeros(shape, dtype=np.uint8)
+        self.layers = {name: np.zeros(shape) for name in LAYERS}
+        self.views = {name: _read_only(array)
+                      for name, array in self.layers.items()}
+        self.views['board'] = _read_only(self.board)
+        self.window = None
+
+    def get(self, read_only):
+        '''Returns the observation arrays, as views or as copies'''
+        if read_only:
+            return self.views
+        ret = {name: array.copy() for name, array in self.layers.items()}
+        ret['board'] = self.board.copy()
+        return ret
+
+
+class ObservationBuilder(object):
+    """Builds the per agent observations of ForwardModel.get_observations."""
+
+    def __init__(self,
+                 board_size,
+                 is_partially_observable,
+                 agent_view_size,
+                 read_only=False):
+        self._board_size = board_size
+        self._is_partially_observable = is_partially_observable
+        self._agent_view_size = agent_view_size
+        self.read_only = read_only
+
+        # The full board layers and the flat cells that were set last step.
+        self._full = _Buffers(board_size)
+        self._bomb_cells = np.zeros(0, dtype=np.int64)
+        self._flame_cells = np.zeros(0, dtype=np.int64)
+        self._agent_buffers = {}
+
+    @property
+    def config(self):
+        '''The board configuration that the buffers were made for'''
+        return (self._board_size, self._is_partially_observable,
+                self._agent_view_size)
+
+    def _update_layers(self, bombs, flames):
+        '''Updates the full board bomb and flame layers in place'''
+        layers = self._full.layers
+        size = self._board_size
+        for name in LAYERS[:3]:
+            layers[name].flat[self._bomb_cells] = 0
+        layers['flame_life'].flat[self._flame_cells] = 0
+
+        self._bomb_cells = np.array(
+            [r * size + c for r, c in (bomb.position for bomb in bombs)],
+            dtype=np.int64)
+        for bomb, cell in zip(bombs, self._bomb_cells):
+            layers['bomb_blast_strength'].flat[cell] = bomb.blast_strength
+            layers['bomb_life'].flat[cell] = bomb.life
+            if bomb.moving_direction is not None:
+                layers['bomb_moving_direction'].flat[cell] = \
+                    bomb.moving_direction.value
+
+        # +1 needed because flame removal check is done before flame is ticked
+        # down, i.e. flame life in environment is 2 -> 1 -> 0 -> dead. If
+        # flames share a cell, the last one in the list wins.
+        self._flame_cells = np.array(
+            [r * size + c for r, c in (flame.position for flame in flames)],
+            dtype=np.int64)
+        layers['flame_life'].flat[self._flame_cells] = [
+            flame.life + 1 for flame in flames
+        ]
+
+    def view_window(self, position):
+        '''Returns the slices of the board that an agent at position sees'''
+        row, col = position
+        view = self._agent_view_size
+        return (slice(max(0, row - view), row + view + 1),
+                slice(max(0, col - view), col + view + 1))
+
+    def _update_agent(self, agent_id, position):
+        '''Fogs the full board buffers into an agent's view'''
+        buffers = self._agent_buffers.get(agent_id)
+        if buffers is None:
+            buffers = _Buffers(self._board_size)
+            self._agent_buffers[agent_id] = buffers
+
+        window = self.view_window(position)
+        if window != buffers.window:
+            # The view moved, so everything outside of it has to be fogged.
+            buffers.board.fill(constants.Item.Fog.value)
+            for array in buffers.layers.values():
+                array.fill(0)
+            buffers.window = window
+
+        buffers.board[window] = self._full.board[window]
+        for name, array in buffers.layers.items():
+            array[window] = self._full.layers[name][window]
+        return buffers
+
+    def build(self, curr_board, agents, bombs, flames, game_type, game_env):
+        """Returns the observations of every agent.
+
+        See ForwardModel.get_observations for the arguments.
+        """
+        np.copyto(self._full.board, curr_board)
+        self._update_layers(bombs, flames)
+
+        attrs = [
+            'position', 'blast_strength', 'can_kick', 'teammate', 'ammo',
+            'enemies'
+        ]
+        alive_agents = [
+            utility.agent_value(agent.agent_id)
+            for agent in agents
+            if agent.is_alive
+        ]
+
+        observations = []
+        for agent in agents:
+            if self._is_partially_observable:
+                buffers = self._update_agent(agent.agent_id, agent.position)
+            else:
+                buffers = self._full
+            agent_obs = {'alive': alive_agents}
+            agent_obs.update(buffers.get(self.read_only))
+            agent_obs['game_type'] = game_type.value
+            agent_obs['game_env'] = game_env
+
+            for attr in attrs:
+                assert hasattr(agent, attr)
+                agent_obs[attr] = getattr(agent, attr)
+            observations.append(agent_obs)
+
+        return observations
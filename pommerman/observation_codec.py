@@ -0,0 +1,142 @@
+'''Module for the compact binary encoding of observations sent over http.
+
+The JSON encoding writes every board layer out as nested lists of numbers,
+and DockerAgent then wraps that JSON string in another JSON body. The binary
+encoding instead sends the raw bytes of the arrays after a small header:
+
+  magic (4 bytes) | version (uint16) | meta length (uint32) | meta | arrays
+
+The meta is a short JSON object holding the non-array values of the
+observation and the key, dtype and shape of every array, in the order their
+bytes follow. Float layers whose values are all small whole numbers, like
+bomb_life, are sent as uint8 and cast back on decoding.
+
+The DockerAgentRunner lists the encodings it accepts in its /ping reply, so
+agents fall back to JSON with runners that predate this one.
+'''
+import json
+import struct
+
+import numpy as np
+
+from . import utility
+
+CONTENT_TYPE = 'application/x-pommerman-observation'
+ENCODINGS = ['binary', 'json']
+# The keys that the env adds to the observations for local agents only, see
+# Pomme.set_board_analysis. They are not part of what is sent.
+LOCAL_ONLY_KEYS = ('board_analysis', 'flame_time')
+
+_MAGIC = b'POBS'
+_VERSION = 1
+_HEADER = struct.Struct('!4sHI')
+
+
+def _is_small_whole(array):
+    '''Returns whether a float array fits in a uint8 without loss'''
+    if not array.size:
+        return True
+    return bool(np.all((array >= 0) & (array <= 255)) and
+                np.all(np.floor(array) == array))
+
+
+def encode(obs):
+    """Encodes an observation into bytes.
+
+    Args:
+      obs: The observation dict of one agent.
+
+    Returns:
+      The encoded bytes, to be sent with the CONTENT_TYPE content type.
+    """
+    values = {}
+    arrays = []
+    chunks = []
+    for key, value in obs.items():
+        if not isinstance(value, np.ndarray):
+            values[key] = value
+            continue
+
+        value = np.ascontiguousarray(value)
+        dtype = value.dtype.str
+        if value.dtype.kind == 'f' and _is_small_whole(value):
+            value = value.astype(np.uint8)
+        arrays.append([key, dtype, value.dtype.str, list(value.shape)])
+        chunks.append(value.tobytes())
+
+    meta = json.dumps({
+        'values': values,
+        'arrays': arrays
+    },
+                      cls=utility.PommermanJSONEncoder).encode('utf-8')
+    return b''.join(
+        [_HEADER.pack(_MAGIC, _VERSION, len(meta)), meta] + chunks)
+
+
+def decode(data):
+    """Decodes bytes written by encode.
+
+    The arrays come back with their original dtype. Enums, like the items
+    in enemies, come back as their values, as they do from JSON.
+    """
+    magic, version, meta_length = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('Not a version %d pommerman observation' % _VERSION)
+    offset = _HEADER.size
+    meta = json.loads(data[offset:offset + meta_length].decode('utf-8'))
+    offset += meta_length
+
+    obs = meta['values']
+    for key, dtype, sent_dtype, shape in meta['arrays']:
+        sent_dtype = np.dtype(sent_dtype)
+        count = int(np.prod(shape))
+        array = np.frombuffer(
+            data, dtype=sent_dtype, count=count, offset=offset)
+        offset += count * sent_dtype.itemsize
+        obs[key] = array.reshape(shape).astype(dtype)
+    return obs
+
+
+def negotiate(ping_response):
+    '''Returns the encoding to send observations in given a /ping reply'''
+    try:
+        encodings = ping_response.json().get('encodings', [])
+    except (ValueError, AttributeError):
+        return 'json'
+    for encoding in ENCODINGS:
+        if encoding in encodings:
+            return encoding
+    return 'json'
+
+
+def post(session, request_url, obs, action_space, encoding, timeout=0.15):
+    """Posts an observation to a runner's /action endpoint.
+
+    Args:
+      session: The requests.Session to post with.
+      request_url: The url of the /action endpoint.
+      obs: The observation dict.
+      action_space: The action space of the agent.
+      encoding: 'binary' or 'json', see negotiate.
+      timeout: The request timeout in seconds.
+
+    Returns:
+      The requests.Response.
+    """
+    action_space = json.dumps(action_space, cls=utility.PommermanJSONEncoder)
+    if encoding == 'binary':
+        return session.post(
+            request_url,
+            timeout=timeout,
+            data=encode(obs),
+            headers={
+                'Content-Type': CONTENT_TYPE,
+                'X-Action-Space': action_space
+            })
+    return session.post(
+        request_url,
+        timeout=timeout,
+        json={
+            "obs": json.dumps(obs, cls=utility.PommermanJSONEncoder),
+            "action_space": action_space
+        })
@@ -0,0 +1,148 @@
+'''Module for recording games to a single streaming file.
+
+A recording is a newline delimited JSON file with one object per line:
+
+  {"type": "header", "version": 1, "agents": [...], "config": ...}
+  {"type": "frame", "board": ..., "agents": ..., "step_count": ..., ...}
+  ...
+  {"type": "result", "finished_at": ..., "result": {...}, "winners": [...]}
+
+A frame holds the fields of the env's get_json_info. Those are already JSON
+strings, so they are spliced into the frame line as they are instead of
+being encoded a second time. Frames are appended to the open file as the
+game goes, so recording costs one write per step however long the game is.
+
+to_legacy converts a recording into the older game_state.json format, which
+holds every state in one JSON document, for the tools that read that format.
+'''
+import json
+import os
+
+from . import constants
+
+VERSION = 1
+# The name run_battle gives its recordings.
+GAME_FILE = 'game.ndjson'
+
+
+def _line(fields):
+    '''Returns a JSON line of already encoded values'''
+    return '{%s}\n' % ','.join(
+        '%s:%s' % (json.dumps(key), value) for key, value in fields.items())
+
+
+class GameRecorder(object):
+    """Appends the frames of a game to a recording file.
+
+    Args:
+      path: The file to record into. It is overwritten.
+      agents: The agent strings of the game.
+      config: The env config id.
+    """
+
+    def __init__(self, path, agents, config):
+        self.path = path
+        self.num_frames = 0
+        self._file = open(path, 'w')
+        self._write({
+            'type': 'header',
+            'version': VERSION,
+            'agents': agents,
+            'config': config
+        })
+
+    def _write(self, value):
+        self._file.write(json.dumps(value, separators=(',', ':')) + '\n')
+
+    def record(self, env):
+        '''Appends a frame of the env's current state'''
+        fields = {'type': '"frame"'}
+        fields.update(env.get_json_info())
+        self._file.write(_line(fields))
+        self.num_frames += 1
+
+    def close(self, info, finished_at):
+        """Writes the result of the game and closes the file.
+
+        Args:
+          info: The info dict of the env's last step.
+          finished_at: When the game finished, in ISO format.
+        """
+        result = {
+            'type': 'result',
+            'finished_at': finished_at,
+            'result': {
+                'name': info['result'].name,
+                'id': info['result'].value
+            }
+        }
+        if info['result'] is not constants.Result.Tie:
+            result['winners'] = info['winners']
+        self._write(result)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read(path):
+    """Reads a recording.
+
+    Returns:
+      The (header, frames, result) of the recording. The result is None if
+      the recording was not closed, e.g. because the game crashed.
+    """
+    header, frames, result = None, [], None
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            value = json.loads(line)
+            kind = value.pop('type')
+            if kind == 'header':
+                header = value
+            elif kind == 'frame':
+                frames.append(value)
+            elif kind == 'result':
+                result = value
+    if header is None:
+        raise ValueError('%s is not a game recording' % path)
+    return header, frames, result
+
+
+def to_legacy(path, legacy_path=None):
+    """Converts a recording to the legacy game_state.json format.
+
+    Args:
+      path: The recording.
+      legacy_path: Where to write the game_state.json. Defaults to the
+        recording's directory.
+
+    Returns:
+      The path of the game_state.json.
+    """
+    header, frames, result = read(path)
+    if result is None:
+        raise ValueError('%s has no result, the game did not finish' % path)
+
+    game = {
+        'agents': header['agents'],
+        'config': header['config'],
+        'finished_at': result['finished_at'],
+        'result': result['result'],
+        # The legacy format has every field of a state encoded as a string.
+        'state': [{key: json.dumps(value)
+                   for key, value in frame.items()} for frame in frames]
+    }
+    if 'winners' in result:
+        game['winners'] = result['winners']
+
+    legacy_path = legacy_path or os.path.join(
+        os.path.dirname(path), 'game_state.json')
+    with open(legacy_path, 'w') as f:
+        f.write(json.dumps(game, sort_keys=True, indent=4))
+    return legacy_path
@@ -0,0 +1,264 @@
+'''Module for compact action replays and for rebuilding their states.
+
+The game is deterministic given its state and the actions taken, so a replay
+only needs the initial state and the action stream. To load any step
+without replaying the game from the start, a replay also holds a keyframe,
+a GameState snapshot, every keyframe_interval steps. Like a recording of the
+recorder module, it is a newline delimited JSON file:
+
+  {"type": "header", "version": 1, "config": ..., "agents": [...], ...}
+  {"type": "keyframe", "step": 0, "state": ..., "actions": [...]}
+  {"type": "keyframe", "step": 100, "state": ..., "actions": [...]}
+  ...
+  {"type": "result", "finished_at": ..., "result": {...}, "winners": [...]}
+
+Every keyframe line holds the state at its step, zlib compressed and base64
+encoded, and the actions of the steps from there to the next keyframe. The
+first keyframe is the initial state of the game.
+
+A Replay rebuilds the state of any step by restoring the closest keyframe
+before it into an env and stepping the env through the recorded actions.
+'''
+import base64
+import bisect
+import json
+import zlib
+
+from . import agents
+from . import constants
+from .game_state import GameState
+
+VERSION = 1
+
+
+def encode_state(state):
+    '''Returns a GameState as a compressed base64 string'''
+    return base64.b64encode(zlib.compress(state.to_bytes())).decode('ascii')
+
+
+def decode_state(data):
+    '''Returns the GameState of a string written by encode_state'''
+    return GameState.from_bytes(zlib.decompress(base64.b64decode(data)))
+
+
+def _json_actions(actions):
+    '''Returns the actions of a step as plain ints and lists of ints'''
+    return [
+        int(action) if isinstance(action, int) or not hasattr(
+            action, '__len__') else [int(x) for x in action]
+        for action in actions
+    ]
+
+
+class ReplayWriter(object):
+    """Writes the action replay of a game.
+
+    Call start after resetting the env, step after every step of the env,
+    and close with the info of the last step.
+
+    Args:
+      path: The file to write the replay to. It is overwritten.
+      agents: The agent strings of the game.
+      config: The env config id.
+      keyframe_interval: How many steps apart the keyframes are.
+      seed: The seed of the game, if any. It is only kept as information,
+        the initial state is what the replay is rebuilt from.
+    """
+
+    def __init__(self, path, agents, config, keyframe_interval=100,
+                 seed=None):
+        assert keyframe_interval > 0
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self._file = open(path, 'w')
+        self._keyframe = None
+        self._write({
+            'type': 'header',
+            'version': VERSION,
+            'config': config,
+            'agents': agents,
+            'keyframe_interval': keyframe_interval,
+            'seed': seed
+        })
+
+    def _write(self, value):
+        self._file.write(json.dumps(value, separators=(',', ':')) + '\n')
+
+    def _flush_keyframe(self):
+        if self._keyframe is not None:
+            self._write(self._keyframe)
+            self._keyframe = None
+
+    def _start_keyframe(self, env):
+        self._keyframe = {
+            'type': 'keyframe',
+            'step': env._step_count,
+            'state': encode_state(env.get_game_state()),
+            'actions': []
+        }
+
+    def start(self, env):
+        '''Writes the initial state of the env's game'''
+        self._start_keyframe(env)
+
+    def step(self, actions, env):
+        """Appends the actions of a step.
+
+        Args:
+          actions: The actions the env was just stepped with.
+          env: The env, after the step.
+        """
+        self._keyframe['actions'].append(_json_actions(actions))
+        if len(self._keyframe['actions']) == self.keyframe_interval:
+            self._flush_keyframe()
+            self._start_keyframe(env)
+
+    def close(self, info, finished_at):
+        '''Writes the result of the game and closes the file'''
+        self._flush_keyframe()
+        result = {
+            'type': 'result',
+            'finished_at': finished_at,
+            'result': {
+                'name': info['result'].name,
+                'id': info['result'].value
+            }
+        }
+        if info['result'] is not constants.Result.Tie:
+            result['winners'] = info['winners']
+        self._write(result)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if not self._file.closed:
+            self._file.close()
+
+
+class Replay(object):
+    """A loaded action replay that can rebuild the state of any step.
+
+    The states are rebuilt in an env of the replay's config whose agents are
+    placeholders, so nothing is asked to act. Seeking forward from the
+    current step only steps the env, so going through the steps in order
+    costs one env step per step.
+
+    Args:
+      header: The header of the replay.
+      keyframes: The list of keyframes, in step order.
+      result: The result of the replay, or None if the game did not finish.
+    """
+
+    def __init__(self, header, keyframes, result=None):
+        self.header = header
+        self.result = result
+        self.config = header['config']
+        self.agents = header['agents']
+        self._keyframe_steps = [keyframe['step'] for keyframe in keyframes]
+        self._keyframe_states = [keyframe['state'] for keyframe in keyframes]
+        self.actions = []
+        for keyframe in keyframes:
+            assert keyframe['step'] == self.first_step + len(self.actions), \
+                "The keyframes of the replay are not contiguous"
+            self.actions.extend(keyframe['actions'])
+        self._env = None
+        # The step the env is at.
+        self._step = None
+
+    @property
+    def first_step(self):
+        return self._keyframe_steps[0]
+
+    @property
+    def last_step(self):
+        '''The step of the final state of the replay'''
+        return self.first_step + len(self.actions)
+
+    @classmethod
+    def load(cls, path):
+        '''Reads a replay written by a ReplayWriter'''
+        with open(path) as f:
+            return cls.from_lines(f)
+
+    @classmethod
+    def from_lines(cls, lines):
+        '''Reads a replay from its lines'''
+        header, keyframes, result = None, [], None
+        for line in lines:
+            if not line.strip():
+                continue
+            value = json.loads(line)
+            kind = value.pop('type')
+            if kind == 'header':
+                header = value
+            elif kind == 'keyframe':
+                keyframes.append(value)
+            elif kind == 'result':
+                result = value
+        if header is None or not keyframes:
+            raise ValueError('Not an action replay')
+        return cls(header, keyframes, result)
+
+    @property
+    def env(self):
+        '''The env the states are rebuilt in'''
+        if self._env is None:
+            # Imported here as the package imports this module.
+            from . import make
+            state = decode_state(self._keyframe_states[0])
+            self._env = make(self.config, [
+                agents.BaseAgent() for _ in range(state.num_agents)
+            ])
+            self._env.reset()
+            self._env.set_game_state(state)
+            self._step = self.first_step
+        return self._env
+
+    def seek(self, step):
+        """Brings the env to the state of a step.
+
+        The env is restored to the last keyframe before the step and stepped
+        from there, unless it is already between that keyframe and the step.
+        The step itself is always stepped into rather than restored, so that
+        the env also has what a step leaves behind besides the GameState,
+        like the radio messages of the last actions. The env must not be
+        stepped by anything else.
+
+        Returns:
+          The env.
+        """
+        assert self.first_step <= step <= self.last_step, \
+            "Step %d is not in the replay" % step
+        if step == self.first_step and self._step != step:
+            # Start over from a new env, as the first step has no actions to
+            # step into.
+            self.close()
+        env = self.env
+        index = max(0, bisect.bisect_left(self._keyframe_steps, step) - 1)
+        keyframe_step = self._keyframe_steps[index]
+        if not keyframe_step <= self._step <= step:
+            env.set_game_state(decode_state(self._keyframe_states[index]))
+            self._step = keyframe_step
+        for num in range(self._step, step):
+            env.step(self.actions[num - self.first_step])
+        self._step = step
+        return env
+
+    def get_state(self, step):
+        '''Returns the GameState of a step'''
+        return self.seek(step).get_game_state()
+
+    def get_observations(self, step):
+        '''Returns the observations of the agents at a step'''
+        return self.seek(step).get_observations()
+
+    def get_actions(self, step):
+        '''Returns the actions taken at a step'''
+        return self.actions[step - self.first_step]
+
+    def close(self):
+        if self._env is not None:
+            self._env.close()
+            self._env = None
@@ -0,0 +1,256 @@
+'''Module for an indexed archive of many match replays in one file.
+
+The matches are appended to a segment file, each as a record:
+
+  magic (4 bytes) | id length (uint32) | payload length (uint64) | id | payload
+
+and the payload of a match is laid out so that any range of its steps can
+be read without decoding the rest:
+
+  meta length (uint32) | num steps (uint32) | meta | step offsets | steps
+
+The meta is a JSON object with whatever describes the match as a whole,
+like its mode, initial board and rewards. The steps, e.g. the actions of
+every step, are JSON values written one after the other, each followed by a
+comma. The step offsets are num steps + 1 uint64s giving where each of them
+starts, so a range of steps is one slice of the file and one json.loads.
+
+An index file next to the segment maps every match id to the offset of its
+record. It is only a cache: records that are in the segment but not in the
+index, e.g. because a writer died in between, are found by scanning the
+segment after the last indexed record. The next writer adds them to the
+index, and cuts off any line a dead writer left unfinished.
+
+Readers map the segment into memory, so looking up a step range only
+touches the pages it's in. Writers hold an exclusive lock on the segment
+while appending, so several processes can append to the same archive.
+'''
+import json
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # There is no file locking without fcntl, so only one process may
+    # append to an archive at a time.
+    fcntl = None
+
+_MAGIC = b'PREP'
+_RECORD = struct.Struct('!4sIQ')
+_PAYLOAD = struct.Struct('!II')
+
+
+def _trim_index(index):
+    '''Cuts off the end of an index a writer died in the middle of'''
+    end = index.seek(0, os.SEEK_END)
+    position = end
+    while position > 0:
+        start = max(0, position - 4096)
+        index.seek(start)
+        newline = index.read(position - start).rfind(b'\n')
+        if newline >= 0:
+            position = start + newline + 1
+            break
+        position = start
+    if position < end:
+        index.truncate(position)
+
+
+class ReplayArchive(object):
+    """An append-only store of match replays with random access to steps.
+
+    Args:
+      directory: The directory of the archive. It is created if needed.
+      name: The name of the archive's segment and index files.
+    """
+
+    def __init__(self, directory, name='replays'):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.segment_path = os.path.join(directory, name + '.seg')
+        self.index_path = os.path.join(directory, name + '.idx')
+        # Match id to the (payload offset, payload length) of its record.
+        self._index = {}
+        self._indexed_end = 0
+        self._index_position = 0
+        # The ids found by scanning the segment but not yet in the index.
+        self._unindexed = set()
+        self._map = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __contains__(self, match_id):
+        self.refresh()
+        return match_id in self._index
+
+    def __len__(self):
+        self.refresh()
+        return len(self._index)
+
+    def ids(self):
+        '''Returns the ids of the matches in the archive'''
+        self.refresh()
+        return list(self._index)
+
+    def refresh(self):
+        '''Picks up the matches appended since the last refresh'''
+        with self._lock:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'rb') as f:
+                    f.seek(self._index_position)
+                    for line in iter(f.readline, b''):
+                        if not line.endswith(b'\n'):
+                            # A writer is still writing this line.
+                            break
+                        self._index_position += len(line)
+                        match_id, offset, length = json.loads(
+                            line.decode('utf-8'))
+                        self._add(match_id, offset, length)
+                        self._unindexed.discard(match_id)
+            self._scan()
+
+    def _add(self, match_id, offset, length):
+        self._index[match_id] = (offset, length)
+        self._indexed_end = max(self._indexed_end, offset + length)
+
+    def _scan(self):
+        '''Indexes the complete records after the last indexed one'''
+        if not os.path.exists(self.segment_path):
+            return
+        size = os.path.getsize(self.segment_path)
+        if self._indexed_end >= size:
+            return
+        with open(self.segment_path, 'rb') as f:
+            position = self._indexed_end
+            while position + _RECORD.size <= size:
+                f.seek(position)
+                magic, id_length, length = _RECORD.unpack(
+                    f.read(_RECORD.size))
+                if magic != _MAGIC:
+                    raise ValueError('%s is corrupt at offset %d' %
+                                     (self.segment_path, position))
+                offset = position + _RECORD.size + id_length
+                if offset + length > size:
+                    break
+                match_id = f.read(id_length).decode('utf-8')
+                self._add(match_id, offset, length)
+                self._unindexed.add(match_id)
+                position = offset + length
+
+    def _view(self, offset, length):
+        '''Returns a memoryview of the segment, remapping it if it grew'''
+        with self._lock:
+            if self._map is None or len(self._map) < offset + length:
+                # The old map stays open as long as views into it are used.
+                with open(self.segment_path, 'rb') as f:
+                    self._map = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._map)[offset:offset + length]
+
+    def append(self, match_id, meta, steps):
+        """Appends a match to the archive.
+
+        Args:
+          match_id: The id of the match. It must not be in the archive yet.
+          meta: The JSON-able dict describing the whole match.
+          steps: The list of the JSON-able values of every step.
+        """
+        meta = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+        offsets = [0]
+        chunks = []
+        for step in steps:
+            chunks.append(
+                json.dumps(step, separators=(',', ':')).encode('utf-8') +
+                b',')
+            offsets.append(offsets[-1] + len(chunks[-1]))
+        payload = b''.join([
+            _PAYLOAD.pack(len(meta), len(steps)), meta,
+            struct.pack('!%dQ' % len(offsets), *offsets)
+        ] + chunks)
+        id_bytes = match_id.encode('utf-8')
+
+        with open(self.segment_path, 'ab') as segment:
+            if fcntl is not None:
+                fcntl.flock(segment, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if match_id in self._index:
+                    raise KeyError('%s is already archived' % match_id)
+                segment.seek(0, os.SEEK_END)
+                position = segment.tell()
+                segment.write(
+                    _RECORD.pack(_MAGIC, len(id_bytes), len(payload)) +
+                    id_bytes + payload)
+                segment.flush()
+                offset = position + _RECORD.size + len(id_bytes)
+                with self._lock:
+                    # No other writer is in the middle of appending, so the
+                    # records the index misses are the ones of dead writers.
+                    lines = [[id_, self._index[id_][0], self._index[id_][1]]
+                             for id_ in sorted(self._unindexed)]
+                    self._unindexed.clear()
+                lines.append([match_id, offset, len(payload)])
+                with open(self.index_path, 'ab+') as index:
+                    _trim_index(index)
+                    index.write(''.join(
+                        json.dumps(line) + '\n'
+                        for line in lines).encode('utf-8'))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(segment, fcntl.LOCK_UN)
+        with self._lock:
+            self._add(match_id, offset, len(payload))
+
+    def _payload(self, match_id):
+        '''Returns the view of a match's payload and its step table'''
+        if match_id not in self._index:
+            self.refresh()
+        offset, length = self._index[match_id]
+        view = self._view(offset, length)
+        meta_length, num_steps = _PAYLOAD.unpack_from(view)
+        return view, meta_length, num_steps
+
+    def get_meta(self, match_id):
+        '''Returns the meta dict of a match'''
+        view, meta_length, _ = self._payload(match_id)
+        return json.loads(
+            bytes(view[_PAYLOAD.size:_PAYLOAD.size + meta_length]))
+
+    def num_steps(self, match_id):
+        '''Returns how many steps a match has'''
+        return self._payload(match_id)[2]
+
+    def get_steps(self, match_id, start=0, stop=None):
+        """Returns a range of the steps of a match.
+
+        Args:
+          match_id: The id of the match.
+          start: The first step of the range.
+          stop: The step after the last one of the range, like in a slice.
+            Defaults to the end of the match.
+
+        Returns:
+          The list of the values of the steps in the range.
+        """
+        view, meta_length, num_steps = self._payload(match_id)
+        start, stop, _ = slice(start, stop).indices(num_steps)
+        if start >= stop:
+            return []
+        table = _PAYLOAD.size + meta_length
+        first = struct.unpack_from('!Q', view, table + 8 * start)[0]
+        last = struct.unpack_from('!Q', view, table + 8 * stop)[0]
+        steps = table + 8 * (num_steps + 1)
+        chunk = bytes(view[steps + first:steps + last - 1])
+        return json.loads(b'[' + chunk + b']')
+
+    def get(self, match_id):
+        '''Returns the (meta, steps) of a whole match'''
+        return self.get_meta(match_id), self.get_steps(match_id)
+
+    def close(self):
+        '''Unmaps the segment. It is mapped again on the next read'''
+        with self._lock:
+            self._map = None
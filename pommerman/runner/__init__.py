@@ -1,2 +1,3 @@
 '''Module entry point for the base docker agent.'''
 from .docker_agent_runner import DockerAgentRunner
+from .async_agent_runner import AsyncDockerAgentRunner
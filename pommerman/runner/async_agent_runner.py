@@ -0,0 +1,259 @@
+'''An asyncio docker agent runner that batches its action requests.
+
+The Flask runner handles one request at a time. This one serves the same
+endpoints from a single asyncio event loop, with HTTP/1.1 keep-alive, so a
+container can serve the agents of many concurrent matches. The observations
+of the /action requests that arrive within max_batch_delay of each other,
+and the ones of the batched /actions requests, are put together and handed
+to act_batch at once, e.g. to run a neural net on the whole batch.
+'''
+import asyncio
+from concurrent import futures
+import json
+import logging
+import struct
+
+from .. import constants
+from .. import observation_codec
+from .. import utility
+from .docker_agent_runner import DockerAgentRunner, decode_action, \
+    decode_actions
+
+LOGGER = logging.getLogger(__name__)
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error'
+}
+
+# The method of each endpoint.
+_METHODS = {
+    '/action': 'POST',
+    '/actions': 'POST',
+    '/init_agent': 'POST',
+    '/episode_end': 'POST',
+    '/shutdown': 'POST',
+    '/ping': 'GET',
+}
+
+
+class _HttpError(Exception):
+    '''An error that is sent back as the response status'''
+
+    def __init__(self, status):
+        super(_HttpError, self).__init__(_REASONS[status])
+        self.status = status
+
+
+async def _read_request(reader):
+    """Reads one HTTP/1.1 request off a connection.
+
+    Returns:
+      The (method, path, headers, body) of the request, or None if the
+      connection was closed. The header names are lower case.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split()
+    except ValueError:
+        raise _HttpError(400)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in [b'\r\n', b'\n', b'']:
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, target.split('?')[0], headers, body
+
+
+def _response(status, body, keep_alive):
+    '''Returns the bytes of an HTTP/1.1 response with a JSON body'''
+    body = json.dumps(body, cls=utility.PommermanJSONEncoder).encode('utf-8')
+    head = [
+        'HTTP/1.1 %d %s' % (status, _REASONS[status]),
+        'Content-Type: application/json',
+        'Content-Length: %d' % len(body),
+        'Connection: %s' % ('keep-alive' if keep_alive else 'close'),
+    ]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+class AsyncDockerAgentRunner(DockerAgentRunner):
+    """Docker agent runner on an asyncio server with batched actions.
+
+    Subclasses implement act, and should override act_batch if they can do
+    better than calling act on each observation. act_batch runs on a worker
+    thread, one batch at a time, so the server keeps reading requests while
+    a batch is being worked on. init_agent and episode_end run on the same
+    thread, so they never overlap a batch.
+
+    Args:
+      max_batch_size: The most observations handed to act_batch at once.
+      max_batch_delay: How many seconds to wait for more observations after
+        the first one of a batch arrives.
+    """
+
+    def __init__(self, max_batch_size=64, max_batch_delay=0.002):
+        super(AsyncDockerAgentRunner, self).__init__()
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self._queue = None
+        self._worker = None
+
+    async def _run_on_worker(self, function, *args):
+        '''Runs a call on the worker thread, in order with the batches'''
+        return await asyncio.get_event_loop().run_in_executor(
+            self._worker, function, *args)
+
+    async def _act(self, observation, action_space):
+        '''Queues an observation for the next batch and awaits its action'''
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((observation, action_space, future))
+        return await future
+
+    async def _batch_actions(self):
+        '''Hands the queued observations to act_batch, batch after batch'''
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_batch_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0 and self._queue.empty():
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(
+                        self._queue.get(), max(timeout, 0)))
+                except asyncio.TimeoutError:
+                    break
+
+            observations, action_spaces, waiting = zip(*batch)
+            try:
+                actions = list(await self._run_on_worker(
+                    self.act_batch, list(observations), list(action_spaces)))
+                if len(actions) != len(waiting):
+                    # Otherwise the requests of the missing ones never end.
+                    raise RuntimeError(
+                        'act_batch returned %d actions for %d observations' %
+                        (len(actions), len(waiting)))
+            except Exception as e:  #pylint: disable=W0703
+                LOGGER.exception("act_batch failed")
+                for future in waiting:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future, action in zip(waiting, actions):
+                if not future.done():
+                    future.set_result(action)
+
+    async def _handle(self, method, path, headers, body):
+        '''Returns the JSON reply to a request'''
+        if path not in _METHODS:
+            raise _HttpError(404)
+        if method != _METHODS[path]:
+            raise _HttpError(405)
+
+        if path == '/action':
+            mimetype = headers.get('content-type', '').split(';')[0].strip()
+            observation, action_space = decode_action(
+                mimetype, body,
+                {"X-Action-Space": headers.get('x-action-space')})
+            return {"action": await self._act(observation, action_space)}
+        elif path == '/actions':
+            observations, action_spaces = decode_actions(body)
+            actions = await asyncio.gather(*[
+                self._act(observation, action_space)
+                for observation, action_space in zip(observations,
+                                                     action_spaces)
+            ])
+            return {"actions": list(actions)}
+        elif path == '/init_agent':
+            data = json.loads(body)
+            await self._run_on_worker(
+                self.init_agent, json.loads(data.get("id")),
+                constants.GameType(json.loads(data.get("game_type"))))
+        elif path == '/episode_end':
+            data = json.loads(body)
+            await self._run_on_worker(self.episode_end,
+                                      json.loads(data.get("reward")))
+        elif path == '/shutdown':
+            self.shutdown()
+        elif path == '/ping':
+            return {"success": True, "encodings": observation_codec.ENCODINGS}
+        return {"success": True}
+
+    async def _serve_connection(self, reader, writer):
+        '''Serves the requests of one keep-alive connection'''
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get('connection',
+                                             '').lower() != 'close'
+                    try:
+                        status, reply = 200, await self._handle(
+                            method, path, headers, body)
+                    except _HttpError as e:
+                        status, reply = e.status, {"error": str(e)}
+                    except (ValueError, KeyError, TypeError,
+                            struct.error) as e:
+                        status, reply = 400, {"error": str(e)}
+                except _HttpError as e:
+                    status, reply, keep_alive = e.status, {"error": str(e)}, \
+                        False
+                except Exception as e:  #pylint: disable=W0703
+                    LOGGER.exception("Request failed")
+                    status, reply, keep_alive = 500, {"error": str(e)}, False
+
+                writer.write(_response(status, reply, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="0.0.0.0", port=10080):
+        '''Serves the agent on the running event loop until cancelled'''
+        self._queue = asyncio.Queue()
+        self._worker = futures.ThreadPoolExecutor(max_workers=1)
+        batcher = asyncio.ensure_future(self._batch_actions())
+        server = await asyncio.start_server(self._serve_connection, host,
+                                            port)
+        LOGGER.info("Starting async agent server on port %d", port)
+        try:
+            # Nothing completes this future, it only ends by being cancelled.
+            await asyncio.get_event_loop().create_future()
+        finally:
+            server.close()
+            await server.wait_closed()
+            batcher.cancel()
+            self._worker.shutdown(wait=False)
+
+    def run(self, host="0.0.0.0", port=10080):
+        """Runs the agent by creating a webserver that handles action requests."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        task = loop.create_task(self.serve(host, port))
+        try:
+            loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+        finally:
+            loop.close()
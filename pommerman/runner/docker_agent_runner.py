@@ -3,12 +3,60 @@ import abc
 import logging
 import json
 from .. import constants
+from .. import observation_codec
+from .. import utility
 import numpy as np
 from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler
 
 LOGGER = logging.getLogger(__name__)
 
 
+def prepare_observation(observation):
+    '''Turns a decoded observation back into the types agents expect'''
+    observation['teammate'] = constants.Item(observation['teammate'])
+    for enemy_id in range(len(observation['enemies'])):
+        observation['enemies'][enemy_id] = constants.Item(observation['enemies'][enemy_id])
+    observation['position'] = tuple(observation['position'])
+    observation['board'] = np.array(observation['board'], dtype=np.uint8)
+    observation['bomb_life'] = np.array(observation['bomb_life'], dtype=np.float64)
+    observation['bomb_blast_strength'] = np.array(observation['bomb_blast_strength'], dtype=np.float64)
+    observation['bomb_moving_direction'] = np.array(observation['bomb_moving_direction'], dtype=np.float64)
+    observation['flame_life'] = np.array(observation['flame_life'], dtype=np.float64)
+    return observation
+
+
+def decode_action(mimetype, data, headers):
+    """Returns the (observation, action_space) of an /action request.
+
+    The body is either the binary encoding of observation_codec, with the
+    action space in the X-Action-Space header, or JSON with the "obs" and
+    "action_space" each JSON encoded on their own.
+    """
+    if mimetype == observation_codec.CONTENT_TYPE:
+        observation = observation_codec.decode(data)
+        action_space = headers.get("X-Action-Space")
+    else:
+        data = json.loads(data)
+        observation = json.loads(data.get("obs"))
+        action_space = data.get("action_space")
+    return prepare_observation(observation), json.loads(action_space)
+
+
+def decode_actions(data):
+    """Returns the observations and action spaces of an /actions request.
+
+    The body is JSON with a "requests" list holding one JSON /action body
+    per observation, e.g. one per game that the agent plays at the moment.
+    """
+    observations = []
+    action_spaces = []
+    for item in json.loads(data)["requests"]:
+        observations.append(prepare_observation(json.loads(item["obs"])))
+        action_spaces.append(json.loads(item["action_space"]))
+    return observations, action_spaces
+
+
 class DockerAgentRunner(metaclass=abc.ABCMeta):
     """Abstract base class to implement Docker-based agent"""
 
@@ -20,6 +68,17 @@ class DockerAgentRunner(metaclass=abc.ABCMeta):
         """Given an observation, returns the action the agent should"""
         raise NotImplementedError()
 
+    def act_batch(self, observations, action_spaces):
+        """Returns the actions for several observations at once.
+
+        This serves the /actions endpoint. Override it to e.g. run a model
+        once on the whole batch instead of once per observation.
+        """
+        return [
+            self.act(observation, action_space)
+            for observation, action_space in zip(observations, action_spaces)
+        ]
+
     def run(self, host="0.0.0.0", port=10080):
         """Runs the agent by creating a webserver that handles action requests."""
         app = Flask(self.__class__.__name__)
@@ -27,25 +86,21 @@ class DockerAgentRunner(metaclass=abc.ABCMeta):
         @app.route("/action", methods=["POST"])
         def action(): #pylint: disable=W0612
             '''handles an action over http'''
-            data = request.get_json()
-            observation = data.get("obs")
-            observation = json.loads(observation)
-
-            observation['teammate'] = constants.Item(observation['teammate'])
-            for enemy_id in range(len(observation['enemies'])):
-                observation['enemies'][enemy_id] = constants.Item(observation['enemies'][enemy_id])
-            observation['position'] = tuple(observation['position'])
-            observation['board'] = np.array(observation['board'], dtype=np.uint8)
-            observation['bomb_life'] = np.array(observation['bomb_life'], dtype=np.float64)
-            observation['bomb_blast_strength'] = np.array(observation['bomb_blast_strength'], dtype=np.float64)
-            observation['bomb_moving_direction'] = np.array(observation['bomb_moving_direction'], dtype=np.float64)
-            observation['flame_life'] = np.array(observation['flame_life'], dtype=np.float64)
-
-            action_space = data.get("action_space")
-            action_space = json.loads(action_space)
+            observation, action_space = decode_action(
+                request.mimetype, request.get_data(), request.headers)
             action = self.act(observation, action_space)
             return jsonify({"action": action})
 
+        @app.route("/actions", methods=["POST"])
+        def actions(): #pylint: disable=W0612
+            '''handles a batch of actions over http'''
+            observations, action_spaces = decode_actions(request.get_data())
+            actions = self.act_batch(observations, action_spaces)
+            return app.response_class(
+                json.dumps({"actions": actions},
+                           cls=utility.PommermanJSONEncoder),
+                mimetype="application/json")
+
         @app.route("/init_agent", methods=["POST"])
         def init_agent(): #pylint: disable=W0612
             '''initiates agent over http'''
@@ -75,7 +130,10 @@ class DockerAgentRunner(metaclass=abc.ABCMeta):
         @app.route("/ping", methods=["GET"])
         def ping(): #pylint: disable=W0612
             '''Basic agent health check'''
-            return jsonify(success=True)
+            return jsonify(
+                success=True, encodings=observation_codec.ENCODINGS)
 
         LOGGER.info("Starting agent server on port %d", port)
+        # HTTP/1.1 keeps the connections of the agents' sessions alive.
+        WSGIRequestHandler.protocol_version = "HTTP/1.1"
         app.run(host=host, port=port)
@@ -1,18 +1,66 @@
 '''This file contains a set of utility functions that
 help with positioning, building a game board, and
 encoding data to be used later'''
-import itertools
+import functools
 import json
 import random
-import os
-from jsonmerge import Merger
 
 from gym import spaces
 import numpy as np
+from scipy import ndimage
 
 from . import constants
 
 
+def _value_mask(items):
+    '''Returns a read-only lookup table of whether a board value is in items'''
+    mask = np.zeros(256, dtype=bool)
+    mask[[item.value for item in items]] = True
+    mask.flags.writeable = False
+    return mask
+
+
+# Lookup tables indexed by board value.
+_IS_WALL = _value_mask([constants.Item.Rigid, constants.Item.Wood])
+_IS_POWERUP = _value_mask([
+    constants.Item.ExtraBomb, constants.Item.IncrRange, constants.Item.Kick
+])
+_IS_AGENT = _value_mask([
+    constants.Item.Agent0, constants.Item.Agent1, constants.Item.Agent2,
+    constants.Item.Agent3
+])
+# Agents, powerups and passages can be moved onto, save for enemies.
+_IS_OPEN = _value_mask([
+    constants.Item.Agent0, constants.Item.Agent1, constants.Item.Agent2,
+    constants.Item.Agent3, constants.Item.ExtraBomb, constants.Item.IncrRange,
+    constants.Item.Kick, constants.Item.Passage
+])
+
+# Row and column deltas indexed by Action value. Bomb doesn't move.
+ACTION_DELTAS = np.array([[0, 0], [-1, 0], [1, 0], [0, -1], [0, 1], [0, 0]])
+ACTION_DELTAS.flags.writeable = False
+
+# The deltas of the moves, keyed by Action. The ones for
+# is_valid_direction accept Action values too.
+_MOVE_DELTAS_BY_ACTION = {
+    constants.Action.Stop: (0, 0),
+    constants.Action.Up: (-1, 0),
+    constants.Action.Down: (1, 0),
+    constants.Action.Left: (0, -1),
+    constants.Action.Right: (0, 1),
+}
+_MOVE_DELTAS = dict(_MOVE_DELTAS_BY_ACTION)
+_MOVE_DELTAS.update(
+    {action.value: delta for action, delta in _MOVE_DELTAS_BY_ACTION.items()})
+
+
+@functools.lru_cache(maxsize=None)
+def _enemy_mask(enemies):
+    '''Returns a lookup table of whether a board value is one of enemies'''
+    return _value_mask(
+        [enemy for enemy in enemies if isinstance(enemy, constants.Item)])
+
+
 class PommermanJSONEncoder(json.JSONEncoder):
     '''A helper class to encode state data into a json object'''
 
@@ -36,7 +84,7 @@ class PommermanJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def make_board(size, num_rigid=0, num_wood=0, num_agents=4):
+def make_board(size, num_rigid=0, num_wood=0, num_agents=4, rng=None):
     """Make the random but symmetric board.
 
     The numbers refer to the Item enum in constants. This is:
@@ -52,24 +100,23 @@ def make_board(size, num_rigid=0, num_wood=0, num_agents=4):
      9 - skull
      10 - 13: agents
 
+    Walls are laid in mirrored pairs, (x, y) and (y, x), by shuffling the
+    free pairs once and taking the rigid walls and then the wood walls from
+    the front of it. The board is remade as long as more than 4 passages
+    can't be reached.
+
     Args:
       size: The dimension of the board, i.e. it's sizeXsize.
       num_rigid: The number of rigid walls on the board. This should be even.
       num_wood: Similar to above but for wood walls.
+      num_agents: The number of agents, 2 or 4.
+      rng: The random.Random to draw from. Defaults to the random module, so
+        that boards are the same for the same random.seed.
 
     Returns:
       board: The resulting random board.
     """
-
-    def lay_wall(value, num_left, coordinates, board):
-        '''Lays all of the walls on a board'''
-        x, y = random.sample(coordinates, 1)[0]
-        coordinates.remove((x, y))
-        coordinates.remove((y, x))
-        board[x, y] = value
-        board[y, x] = value
-        num_left -= 2
-        return num_left
+    rng = rng or random
 
     def make(size, num_rigid, num_wood, num_agents):
         '''Constructs a game/board'''
@@ -77,13 +124,11 @@ def make_board(size, num_rigid=0, num_wood=0, num_agents=4):
         board = np.ones((size,
                          size)).astype(np.uint8) * constants.Item.Passage.value
 
-        # Gather all the possible coordinates to use for walls.
-        coordinates = set([
-            (x, y) for x, y in \
-            itertools.product(range(size), range(size)) \
-            if x != y])
+        # Cells that can't get a random wall. Walls come in mirrored pairs,
+        # so this stays symmetric, and the diagonal never gets one.
+        taken = np.eye(size, dtype=bool)
 
-        # Set the players down. Exclude them from coordinates.
+        # Set the players down. Exclude them from the walls.
         # Agent0 is in top left. Agent1 is in bottom left.
         # Agent2 is in bottom right. Agent 3 is in top right.
         assert (num_agents % 2 == 0)
@@ -100,21 +145,16 @@ def make_board(size, num_rigid=0, num_wood=0, num_agents=4):
             agents = [(1, 1), (size - 2, 1), (1, size - 2), (size - 2, size - 2)]
 
         for position in agents:
-            if position in coordinates:
-                coordinates.remove(position)
+            taken[position] = True
 
         # Exclude breathing room on either side of the agents.
         for i in range(2, 4):
-            coordinates.remove((1, i))
-            coordinates.remove((i, 1))
-            coordinates.remove((size - 2, size - i - 1))
-            coordinates.remove((size - i - 1, size - 2))
+            taken[1, i] = taken[i, 1] = True
+            taken[size - 2, size - i - 1] = taken[size - i - 1, size - 2] = True
 
             if num_agents == 4:
-                coordinates.remove((1, size - i - 1))
-                coordinates.remove((size - i - 1, 1))
-                coordinates.remove((i, size - 2))
-                coordinates.remove((size - 2, i))
+                taken[1, size - i - 1] = taken[size - i - 1, 1] = True
+                taken[i, size - 2] = taken[size - 2, i] = True
 
         # Lay down wooden walls providing guaranteed passage to other agents.
         wood = constants.Item.Wood.value
@@ -124,21 +164,24 @@ def make_board(size, num_rigid=0, num_wood=0, num_agents=4):
                 board[size - i - 1, 1] = wood
                 board[size - 2, size - i - 1] = wood
                 board[size - i - 1, size - 2] = wood
-                coordinates.remove((1, i))
-                coordinates.remove((size - i - 1, 1))
-                coordinates.remove((size - 2, size - i - 1))
-                coordinates.remove((size - i - 1, size - 2))
+                taken[1, i] = taken[size - i - 1, 1] = True
+                taken[size - 2, size - i - 1] = True
+                taken[size - i - 1, size - 2] = True
                 num_wood -= 4
 
-        # Lay down the rigid walls.
-        while num_rigid > 0:
-            num_rigid = lay_wall(constants.Item.Rigid.value, num_rigid,
-                                 coordinates, board)
-
-        # Lay down the wooden walls.
-        while num_wood > 0:
-            num_wood = lay_wall(constants.Item.Wood.value, num_wood,
-                                coordinates, board)
+        # Lay down the rigid and then the wooden walls.
+        rows, cols = np.nonzero(np.triu(~taken))
+        order = list(range(len(rows)))
+        rng.shuffle(order)
+        num_rigid = max(num_rigid, 0) // 2
+        num_wood = max(num_wood, 0) // 2
+        assert num_rigid + num_wood <= len(order), "Not enough room for walls"
+        for value, pairs in [
+            (constants.Item.Rigid.value, order[:num_rigid]),
+            (wood, order[num_rigid:num_rigid + num_wood]),
+        ]:
+            board[rows[pairs], cols[pairs]] = value
+            board[cols[pairs], rows[pairs]] = value
 
         return board, agents
 
@@ -153,18 +196,19 @@ def make_board(size, num_rigid=0, num_wood=0, num_agents=4):
     return board
 
 
-def make_items(board, num_items):
-    '''Lays all of the items on the board'''
+def make_items(board, num_items, rng=None):
+    '''Lays all of the items on the board, drawing from rng or random'''
+    rng = rng or random
     item_positions = {}
     while num_items > 0:
-        row = random.randint(0, len(board) - 1)
-        col = random.randint(0, len(board[0]) - 1)
+        row = rng.randint(0, len(board) - 1)
+        col = rng.randint(0, len(board[0]) - 1)
         if board[row, col] != constants.Item.Wood.value:
             continue
         if (row, col) in item_positions:
             continue
 
-        item_positions[(row, col)] = random.choice([
+        item_positions[(row, col)] = rng.choice([
             constants.Item.ExtraBomb, constants.Item.IncrRange,
             constants.Item.Kick
         ]).value
@@ -173,60 +217,35 @@ def make_items(board, num_items):
 
 
 def inaccessible_passages(board, agent_positions):
-    """Return inaccessible passages on this board."""
-    seen = set()
-    agent_position = agent_positions.pop()
-    passage_positions = np.where(board == constants.Item.Passage.value)
-    positions = list(zip(passage_positions[0], passage_positions[1]))
-
-    Q = [agent_position]
-    while Q:
-        row, col = Q.pop()
-        for (i, j) in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            next_position = (row + i, col + j)
-            if next_position in seen:
-                continue
-            if not position_on_board(board, next_position):
-                continue
-            if position_is_rigid(board, next_position):
-                continue
-
-            if next_position in positions:
-                positions.pop(positions.index(next_position))
-                if not len(positions):
-                    return []
-
-            seen.add(next_position)
-            Q.append(next_position)
-    return positions
+    """Return inaccessible passages on this board.
+
+    These are the passages that can't be reached from the last of the agent
+    positions without crossing a rigid wall.
+    """
+    labels, _ = ndimage.label(board != constants.Item.Rigid.value)
+    reachable = labels == labels[tuple(agent_positions[-1])]
+    passages = (board == constants.Item.Passage.value) & ~reachable
+    return list(zip(*np.nonzero(passages)))
 
 
 def is_valid_direction(board, position, direction, invalid_values=None):
     '''Determins if a move is in a valid direction'''
     row, col = position
-    if invalid_values is None:
-        invalid_values = [item.value for item in \
-                          [constants.Item.Rigid, constants.Item.Wood]]
-
-    if constants.Action(direction) == constants.Action.Stop:
+    delta = _MOVE_DELTAS.get(direction)
+    if delta is None:
+        # Raises a ValueError for values that aren't an Action at all.
+        constants.Action(direction)
+        raise constants.InvalidAction("We did not receive a valid direction: ",
+                                      direction)
+    if delta == (0, 0):
         return True
 
-    if constants.Action(direction) == constants.Action.Up:
-        return row - 1 >= 0 and board[row - 1][col] not in invalid_values
-
-    if constants.Action(direction) == constants.Action.Down:
-        return row + 1 < len(board) and board[row +
-                                              1][col] not in invalid_values
-
-    if constants.Action(direction) == constants.Action.Left:
-        return col - 1 >= 0 and board[row][col - 1] not in invalid_values
-
-    if constants.Action(direction) == constants.Action.Right:
-        return col + 1 < len(board[0]) and \
-               board[row][col + 1] not in invalid_values
-
-    raise constants.InvalidAction("We did not receive a valid direction: ",
-                                  direction)
+    row, col = row + delta[0], col + delta[1]
+    if not (0 <= row < len(board) and 0 <= col < len(board[0])):
+        return False
+    if invalid_values is None:
+        return not _IS_WALL[board[row][col]]
+    return board[row][col] not in invalid_values
 
 
 def _position_is_item(board, position, item):
@@ -253,17 +272,12 @@ def position_is_bomb(bombs, position):
 
 def position_is_powerup(board, position):
     '''Determins is a position has a powerup present'''
-    powerups = [
-        constants.Item.ExtraBomb, constants.Item.IncrRange, constants.Item.Kick
-    ]
-    item_values = [item.value for item in powerups]
-    return board[position] in item_values
+    return bool(_IS_POWERUP[board[position]])
 
 
 def position_is_wall(board, position):
     '''Determins if a position is a wall tile'''
-    return position_is_rigid(board, position) or \
-           position_is_wood(board, position)
+    return bool(_IS_WALL[board[position]])
 
 
 def position_is_passage(board, position):
@@ -283,27 +297,19 @@ def position_is_wood(board, position):
 
 def position_is_agent(board, position):
     '''Determins if a position has an agent present'''
-    return board[position] in [
-        constants.Item.Agent0.value, constants.Item.Agent1.value,
-        constants.Item.Agent2.value, constants.Item.Agent3.value
-    ]
+    return bool(_IS_AGENT[board[position]])
 
 
 def position_is_enemy(board, position, enemies):
     '''Determins if a position is an enemy'''
-    return constants.Item(board[position]) in enemies
+    return bool(_enemy_mask(tuple(enemies))[board[position]])
 
 
 # TODO: Fix this so that it includes the teammate.
 def position_is_passable(board, position, enemies):
     '''Determins if a possible can be passed'''
-    return all([
-        any([
-            position_is_agent(board, position),
-            position_is_powerup(board, position),
-            position_is_passage(board, position)
-        ]), not position_is_enemy(board, position, enemies)
-    ])
+    value = board[position]
+    return bool(_IS_OPEN[value] and not _enemy_mask(tuple(enemies))[value])
 
 
 def position_is_fog(board, position):
@@ -324,7 +330,74 @@ def position_in_items(board, position, items):
 def position_on_board(board, position):
     '''Determines if a positions is on the board'''
     x, y = position
-    return all([len(board) > x, len(board[0]) > y, x >= 0, y >= 0])
+    return 0 <= x < len(board) and 0 <= y < len(board[0])
+
+
+@functools.lru_cache(maxsize=None)
+def neighbor_table(board_size):
+    """Returns the flat index of the cell each action leads to from each cell.
+
+    Args:
+      board_size: The length of a side of the board.
+
+    Returns:
+      A read-only (board_size**2, len(Action)) array, indexed by the flat
+      cell and the Action value, that is -1 where the move leaves the board.
+    """
+    rows, cols = np.divmod(np.arange(board_size**2), board_size)
+    next_rows = rows[:, None] + ACTION_DELTAS[:, 0]
+    next_cols = cols[:, None] + ACTION_DELTAS[:, 1]
+    on_board = (next_rows >= 0) & (next_rows < board_size) & \
+        (next_cols >= 0) & (next_cols < board_size)
+    table = np.where(on_board, next_rows * board_size + next_cols, -1)
+    table.flags.writeable = False
+    return table
+
+
+def next_positions(positions, directions):
+    '''Bulk get_next_position for (n, 2) positions and n Action values'''
+    return np.asarray(positions) + ACTION_DELTAS[np.asarray(directions)]
+
+
+def positions_on_board(board, positions):
+    '''Bulk position_on_board, for an (n, 2) array of positions'''
+    positions = np.asarray(positions).reshape(-1, 2)
+    board = np.asarray(board)
+    return (positions >= 0).all(axis=1) & (positions < board.shape).all(axis=1)
+
+
+def _board_values(board, positions):
+    '''Returns the board values at positions, or 0 where off the board'''
+    positions = np.asarray(positions).reshape(-1, 2)
+    board = np.asarray(board)
+    on_board = positions_on_board(board, positions)
+    rows = np.where(on_board, positions[:, 0], 0)
+    cols = np.where(on_board, positions[:, 1], 0)
+    return board[rows, cols], on_board
+
+
+def positions_are_walls(board, positions):
+    '''Bulk position_is_wall. Positions off the board are not walls'''
+    values, on_board = _board_values(board, positions)
+    return _IS_WALL[values] & on_board
+
+
+def positions_are_powerups(board, positions):
+    '''Bulk position_is_powerup. Positions off the board have none'''
+    values, on_board = _board_values(board, positions)
+    return _IS_POWERUP[values] & on_board
+
+
+def positions_are_passable(board, positions, enemies):
+    '''Bulk position_is_passable. Positions off the board are not'''
+    values, on_board = _board_values(board, positions)
+    return _IS_OPEN[values] & ~_enemy_mask(tuple(enemies))[values] & on_board
+
+
+def passable_mask(board, enemies):
+    '''Returns a bool array of position_is_passable for the whole board'''
+    board = np.asarray(board)
+    return _IS_OPEN[board] & ~_enemy_mask(tuple(enemies))[board]
 
 
 def get_direction(position, next_position):
@@ -351,59 +424,13 @@ def get_direction(position, next_position):
 def get_next_position(position, direction):
     '''Returns the next position coordinates'''
     x, y = position
-    if direction == constants.Action.Right:
-        return (x, y + 1)
-    elif direction == constants.Action.Left:
-        return (x, y - 1)
-    elif direction == constants.Action.Down:
-        return (x + 1, y)
-    elif direction == constants.Action.Up:
-        return (x - 1, y)
-    elif direction == constants.Action.Stop:
-        return (x, y)
-    raise constants.InvalidAction("We did not receive a valid direction.")
+    delta = _MOVE_DELTAS_BY_ACTION.get(direction)
+    if delta is None:
+        raise constants.InvalidAction("We did not receive a valid direction.")
+    return (x + delta[0], y + delta[1])
 
 
 def make_np_float(feature):
     '''Converts an integer feature space into a floats'''
     return np.array(feature).astype(np.float32)
 
-
-def join_json_state(record_json_dir, agents, finished_at, config, info):
-    '''Combines all of the json state files into one'''
-    json_schema = {"properties": {"state": {"mergeStrategy": "append"}}}
-
-    json_template = {
-        "agents": agents,
-        "finished_at": finished_at,
-        "config": config,
-        "result": {
-            "name": info['result'].name,
-            "id": info['result'].value
-        }
-    }
-
-    if info['result'] is not constants.Result.Tie:
-        json_template['winners'] = info['winners']
-
-    json_template['state'] = []
-
-    merger = Merger(json_schema)
-    base = merger.merge({}, json_template)
-
-    for root, dirs, files in os.walk(record_json_dir):
-        for name in files:
-            path = os.path.join(record_json_dir, name)
-            if name.endswith('.json') and "game_state" not in name:
-                with open(path) as data_file:
-                    data = json.load(data_file)
-                    head = {"state": [data]}
-                    base = merger.merge(base, head)
-
-    with open(os.path.join(record_json_dir, 'game_state.json'), 'w') as f:
-        f.write(json.dumps(base, sort_keys=True, indent=4))
-
-    for root, dirs, files in os.walk(record_json_dir):
-        for name in files:
-            if "game_state" not in name:
-                os.remove(os.path.join(record_json_dir, name))
@@ -0,0 +1,467 @@
+'''A vectorized wrapper that steps several pommerman envs as one.
+
+The observations of every env and agent are stacked into arrays with leading
+dimensions (num_envs, num_agents) so that a whole batch can be fed straight
+into a learner. Envs that finish are reset automatically.
+
+VecEnv steps all of its envs in this process. SubprocVecEnv shards them over
+worker processes that write the observations straight into one block of
+shared memory, so no observation is ever pickled.
+'''
+import enum
+import inspect
+import multiprocessing
+
+import numpy as np
+
+from . import configs
+from . import constants
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Only available from python 3.8.
+    shared_memory = None
+
+# Observation keys that are stacked and the dtype they are stacked with.
+# Anything that is not listed here (e.g. game_env) is only available through
+# VecEnv.raw_observations.
+STACKED_KEYS = {
+    'board': np.uint8,
+    'bomb_blast_strength': np.float32,
+    'bomb_life': np.float32,
+    'bomb_moving_direction': np.float32,
+    'flame_life': np.float32,
+    'position': np.int64,
+    'ammo': np.int64,
+    'blast_strength': np.int64,
+    'can_kick': bool,
+    'teammate': np.int64,
+    'enemies': np.int64,
+    'step_count': np.int64,
+    'game_type': np.int64,
+    'message': np.int64,
+}
+
+
+def _to_array_value(value):
+    '''Converts the enums in an observation value to their ints'''
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return [_to_array_value(v) for v in value]
+    return value
+
+
+def write_observations(arrays, num_env, env_obs):
+    """Writes the agent observations of one env into stacked arrays.
+
+    Args:
+      arrays: A dict of arrays with leading dimensions (num_envs, num_agents),
+        e.g. from stack_observations or the shared memory of SubprocVecEnv.
+      num_env: The index of the env along the first dimension.
+      env_obs: The list of agent observations of that env.
+    """
+    for key, array in arrays.items():
+        if key == 'alive':
+            array[num_env] = False
+            for agent_value in env_obs[0]['alive']:
+                array[num_env,
+                      agent_value - constants.Item.Agent0.value] = True
+            continue
+        for num_agent, obs in enumerate(env_obs):
+            array[num_env, num_agent] = _to_array_value(obs[key])
+
+
+def stack_observations(observations):
+    """Stacks per env, per agent observation dicts into arrays.
+
+    Args:
+      observations: A list with, for each env, the list of agent observations
+        returned by Pomme.get_observations.
+
+    Returns:
+      A dict of arrays with leading dimensions (num_envs, num_agents). The
+      'alive' list is turned into a (num_envs, num_agents) boolean mask.
+    """
+    first = observations[0][0]
+    leading = (len(observations), len(observations[0]))
+    arrays = {
+        key: np.zeros(
+            leading + np.shape(_to_array_value(first[key])), dtype=dtype)
+        for key, dtype in STACKED_KEYS.items()
+        if key in first
+    }
+    arrays['alive'] = np.zeros(leading, dtype=bool)
+    for num_env, env_obs in enumerate(observations):
+        write_observations(arrays, num_env, env_obs)
+    return arrays
+
+
+class VecEnv(object):
+    """Steps a list of pommerman envs in lockstep.
+
+    This follows the gym vector env conventions: step returns the stacked
+    observations, a (num_envs, num_agents) reward array, a (num_envs,) done
+    array and a list of infos. When an env is done it is reset right away, the
+    returned observation is the first one of the new episode and the info
+    holds the last observation of the finished one under
+    'terminal_observation'.
+    """
+
+    def __init__(self, envs):
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.num_agents = len(envs[0]._agents)
+        self.action_space = envs[0].action_space
+        self.observation_space = envs[0].observation_space
+        self.training_agent = None
+        self.raw_observations = None
+
+    def set_training_agent(self, agent_id):
+        """Sets the agent whose actions are passed to step.
+
+        The other agents then act through their own act method, as with
+        Pomme.set_training_agent.
+        """
+        self.training_agent = agent_id
+        for env in self.envs:
+            env.set_training_agent(agent_id)
+
+    def seed(self, seed=None):
+        '''Seeds every env, each with its own offset of seed'''
+        if seed is None:
+            return [env.seed() for env in self.envs]
+        return [env.seed(seed + num) for num, env in enumerate(self.envs)]
+
+    def reset(self):
+        '''Resets all of the envs and returns the stacked observations'''
+        self.raw_observations = [env.reset() for env in self.envs]
+        return stack_observations(self.raw_observations)
+
+    def act(self):
+        """Returns the actions of the agents that act on their own.
+
+        With a training agent set, its column is left out and this returns
+        one list of actions per env for the remaining agents.
+        """
+        return [
+            env.act(obs) for env, obs in zip(self.envs, self.raw_observations)
+        ]
+
+    def _joint_actions(self, actions, num_env):
+        '''Merges the training agent's action with the other agents' ones'''
+        env = self.envs[num_env]
+        action = actions[num_env]
+        if self.training_agent is None:
+            return [_to_list(a) for a in action]
+        joint = env.act(self.raw_observations[num_env])
+        joint.insert(self.training_agent, _to_list(action))
+        return joint
+
+    def step(self, actions):
+        """Steps every env.
+
+        Args:
+          actions: A (num_envs, num_agents) array of actions. If a training
+            agent is set, a (num_envs,) array with only that agent's actions.
+
+        Returns:
+          obs: The stacked observations.
+          rewards: (num_envs, num_agents) float32 rewards.
+          dones: (num_envs,) bools.
+          infos: The list of infos, one per env.
+        """
+        rewards = np.zeros((self.num_envs, self.num_agents), dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = []
+        for num_env, env in enumerate(self.envs):
+            obs, reward, done, info = env.step(
+                self._joint_actions(actions, num_env))
+            if done:
+                info = dict(info, terminal_observation=obs)
+                obs = env.reset()
+            self.raw_observations[num_env] = obs
+            rewards[num_env] = reward
+            dones[num_env] = done
+            infos.append(info)
+        return stack_observations(self.raw_observations), rewards, dones, \
+               infos
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def _to_list(action):
+    '''Converts an action from a NumPy array to what Pomme.step expects'''
+    if isinstance(action, np.ndarray):
+        return action.tolist()
+    if isinstance(action, np.integer):
+        return int(action)
+    return action
+
+
+def _action_row(action, width):
+    '''Returns an action as width ints, with no words for a plain action'''
+    row = np.ravel(action).tolist()
+    return row + [0] * (width - len(row))
+
+
+def _get_config(config_id):
+    '''Returns the config in configs.py with this env_id'''
+    for name, f in inspect.getmembers(configs, inspect.isfunction):
+        if name.endswith('_env') and f()['env_id'] == config_id:
+            return f()
+    raise ValueError("Unknown configuration '{}'.".format(config_id))
+
+
+def observation_layout(config_id):
+    """Returns the shapes and dtypes of one env's stacked observations.
+
+    Returns:
+      A list of (key, dtype, shape) where shape excludes the env dimension.
+    """
+    kwargs = _get_config(config_id)['env_kwargs']
+    num_agents = 2 if kwargs['game_type'] == constants.GameType.OneVsOne \
+                 else 4
+    board = (num_agents, kwargs['board_size'], kwargs['board_size'])
+    shapes = {
+        'board': board,
+        'bomb_blast_strength': board,
+        'bomb_life': board,
+        'bomb_moving_direction': board,
+        'flame_life': board,
+        'position': (num_agents, 2),
+        'enemies': (num_agents, 3 if num_agents == 4 else 1),
+    }
+    if kwargs.get('radio_num_words'):
+        shapes['message'] = (num_agents, kwargs['radio_num_words'])
+    layout = [(key, dtype, shapes.get(key, (num_agents,)))
+              for key, dtype in STACKED_KEYS.items()
+              if key != 'message' or key in shapes]
+    layout.append(('alive', bool, (num_agents,)))
+    return layout
+
+
+class _SharedArrays(object):
+    """A dict of arrays that all live in one block of shared memory."""
+
+    def __init__(self, fields, name=None):
+        size = 0
+        offsets = []
+        for _, dtype, shape in fields:
+            offsets.append(size)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            # Keep every array 8-byte aligned.
+            size += (nbytes + 7) // 8 * 8
+
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=name is None, size=max(size, 1))
+        self.arrays = {
+            key: np.ndarray(
+                shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            for (key, dtype, shape), offset in zip(fields, offsets)
+        }
+
+    def close(self, unlink=False):
+        self.arrays = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker(remote, parent_remote, shm_name, fields, config_id, agent_factory,
+            env_indices):
+    '''Runs a shard of envs and writes their results to shared memory'''
+    # Imported here so that spawned workers also register the envs with gym.
+    from . import make
+
+    parent_remote.close()
+    shared = _SharedArrays(fields, name=shm_name)
+    arrays = shared.arrays
+    observations = {
+        key: arrays[key]
+        for key, _, _ in fields if key not in ['actions', 'rewards', 'dones']
+    }
+    envs = [make(config_id, agent_factory()) for _ in env_indices]
+    training_agent = None
+
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == 'reset':
+                for num_env, env in zip(env_indices, envs):
+                    write_observations(observations, num_env, env.reset())
+                remote.send(None)
+            elif command == 'step':
+                infos = []
+                for num_env, env in zip(env_indices, envs):
+                    actions = [
+                        action[0] if len(action) == 1 else action
+                        for action in arrays['actions'][num_env].tolist()
+                    ]
+                    if training_agent is not None:
+                        action = actions[training_agent]
+                        actions = env.act(env.observations)
+                        actions.insert(training_agent, action)
+                    obs, reward, done, info = env.step(actions)
+                    if done:
+                        obs = env.reset()
+                    write_observations(observations, num_env, obs)
+                    arrays['rewards'][num_env] = reward
+                    arrays['dones'][num_env] = done
+                    infos.append(info)
+                remote.send(infos)
+            elif command == 'act':
+                remote.send([env.act(env.observations) for env in envs])
+            elif command == 'seed':
+                remote.send([env.seed(seed) for env, seed in zip(envs, data)])
+            elif command == 'set_training_agent':
+                training_agent = data
+                for env in envs:
+                    env.set_training_agent(data)
+                remote.send(None)
+            elif command == 'close':
+                for env in envs:
+                    env.close()
+                remote.send(None)
+                break
+    finally:
+        shared.close()
+        remote.close()
+
+
+class SubprocVecEnv(object):
+    """A VecEnv that runs shards of its envs in worker processes.
+
+    The workers write the stacked observations, rewards and dones of their
+    envs straight into one shared memory block and read their actions from
+    it, so only commands and infos go through the pipes. The returned arrays
+    are copies unless step and reset are called with copy=False, in which case
+    they are views that the next call overwrites.
+
+    The agent_factory is called in the workers. With the 'spawn' start method
+    it has to be picklable, e.g. a module level function. Unlike VecEnv, the
+    infos of finished envs don't hold the terminal observation.
+    """
+
+    def __init__(self,
+                 config_id,
+                 num_envs,
+                 agent_factory,
+                 num_workers=None,
+                 context=None):
+        if shared_memory is None:
+            raise RuntimeError(
+                "SubprocVecEnv requires multiprocessing.shared_memory, which "
+                "is available from python 3.8.")
+
+        layout = observation_layout(config_id)
+        num_agents = layout[0][2][0]
+        action_width = 1
+        for key, _, shape in layout:
+            if key == 'message':
+                action_width += shape[1]
+        fields = [(key, dtype, (num_envs,) + shape)
+                  for key, dtype, shape in layout]
+        fields += [
+            ('actions', np.int64, (num_envs, num_agents, action_width)),
+            ('rewards', np.float32, (num_envs, num_agents)),
+            ('dones', bool, (num_envs,)),
+        ]
+
+        self.num_envs = num_envs
+        self.num_agents = num_agents
+        self.training_agent = None
+        self._observation_keys = [key for key, _, _ in layout]
+        self._shared = _SharedArrays(fields)
+
+        num_workers = min(num_workers or multiprocessing.cpu_count(),
+                          num_envs)
+        self._shards = np.array_split(np.arange(num_envs), num_workers)
+        ctx = multiprocessing.get_context(context)
+        self._remotes = []
+        self._processes = []
+        for shard in self._shards:
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(work_remote, remote, self._shared.shm.name, fields,
+                      config_id, agent_factory, shard.tolist()),
+                daemon=True)
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+        self._closed = False
+
+    def _call(self, command, data=None):
+        '''Sends a command to every worker and gathers the replies'''
+        for num, remote in enumerate(self._remotes):
+            remote.send((command, None if data is None else data[num]))
+        return [remote.recv() for remote in self._remotes]
+
+    def _observations(self, copy):
+        '''Returns the stacked observations from shared memory'''
+        arrays = self._shared.arrays
+        return {
+            key: arrays[key].copy() if copy else arrays[key]
+            for key in self._observation_keys
+        }
+
+    def set_training_agent(self, agent_id):
+        '''Sets the agent whose actions are passed to step'''
+        self.training_agent = agent_id
+        self._call('set_training_agent', [agent_id] * len(self._remotes))
+
+    def seed(self, seed=None):
+        '''Seeds every env, each with its own offset of seed'''
+        ret = self._call('seed', [[
+            None if seed is None else seed + int(num_env) for num_env in shard
+        ] for shard in self._shards])
+        return [seeds for shard in ret for seeds in shard]
+
+    def reset(self, copy=True):
+        '''Resets all of the envs and returns the stacked observations'''
+        self._call('reset')
+        return self._observations(copy)
+
+    def act(self):
+        '''Returns the actions of the agents that act on their own'''
+        return [actions for shard in self._call('act') for actions in shard]
+
+    def step(self, actions, copy=True):
+        """Steps every env. See VecEnv.step.
+
+        Args:
+          actions: A (num_envs, num_agents) array of actions, with a trailing
+            dimension for the radio words in v2. If a training agent is set,
+            a (num_envs,) array with only that agent's actions. Like with
+            VecEnv, they can also be lists, e.g. those of act, where the
+            plain actions of v2 agents send no words.
+          copy: Whether to return copies of the shared arrays.
+        """
+        arrays = self._shared.arrays
+        width = arrays['actions'].shape[2]
+        if self.training_agent is None:
+            arrays['actions'][:] = [[
+                _action_row(action, width) for action in env_actions
+            ] for env_actions in actions]
+        else:
+            arrays['actions'][:, self.training_agent] = [
+                _action_row(action, width) for action in actions
+            ]
+        infos = [info for shard in self._call('step') for info in shard]
+        rewards = arrays['rewards'].copy() if copy else arrays['rewards']
+        dones = arrays['dones'].copy() if copy else arrays['dones']
+        return self._observations(copy), rewards, dones, infos
+
+    def close(self):
+        if self._closed:
+            return
+        self._call('close')
+        for process in self._processes:
+            process.join()
+        self._shared.close(unlink=True)
+        self._closed = True
@@ -0,0 +1,228 @@
+'''Zobrist hashing of game states and a transposition table for search.
+
+A Zobrist hash xors together one random 64 bit key per (feature, value) pair
+of the state, so a change of one feature is undone and redone by two xors.
+The board, the powerups hidden under wood, the flames with their life, the
+agent stats and the bombs with their life, blast strength, bomber and moving
+direction are all hashed. The order of the bomb and flame lists and the
+step count are not.
+
+ForwardModel.step keeps a ZobristHash up to date by xoring only the board
+cells that changed. The bombs, flames, items and agents are few, so their
+part of the hash is recomputed.
+'''
+from collections import OrderedDict
+import functools
+
+import numpy as np
+
+from . import constants
+
+# Upper bound, exclusive, of the counters that get keys, e.g. ammo or bomb
+# life. Larger values share the last key.
+_MAX_COUNT = 32
+_NUM_ITEMS = len(constants.Item)
+_NUM_ACTIONS = len(constants.Action)
+
+
+def _xor(keys):
+    '''Returns the xor of an array of keys as an int'''
+    return int(np.bitwise_xor.reduce(keys, axis=None)) if keys.size else 0
+
+
+def _count(values):
+    '''Clips counters into the range of the key tables'''
+    return np.minimum(np.asarray(values, dtype=np.int64), _MAX_COUNT - 1)
+
+
+class ZobristTable(object):
+    """The random keys for one board size and number of agents."""
+
+    def __init__(self, board_size, num_agents=4, seed=0):
+        self.board_size = board_size
+        self.num_agents = num_agents
+        rng = np.random.RandomState(seed)
+        cells = board_size**2
+
+        def keys(*shape):
+            return rng.randint(0, 2**64, size=shape, dtype=np.uint64)
+
+        self.board = keys(cells, _NUM_ITEMS)
+        self.items = keys(cells, _NUM_ITEMS)
+        self.flames = keys(cells, 8)
+        self.agent_alive = keys(num_agents)
+        self.agent_ammo = keys(num_agents, _MAX_COUNT)
+        self.agent_blast_strength = keys(num_agents, _MAX_COUNT)
+        self.agent_can_kick = keys(num_agents)
+        self.bomb_life = keys(cells, _MAX_COUNT)
+        self.bomb_blast_strength = keys(cells, _MAX_COUNT)
+        self.bomb_bomber = keys(cells, num_agents)
+        self.bomb_moving_direction = keys(cells, _NUM_ACTIONS)
+
+    def hash_board(self, board):
+        '''Returns the hash of the board'''
+        board = np.asarray(board).ravel()
+        return _xor(self.board[np.arange(board.size), board])
+
+    def _hash_arrays(self, alive, ammo, blast_strength, can_kick, items,
+                     flames, bomb_cells, bomb_life, bomb_blast_strength,
+                     bomb_bomber, bomb_moving_direction):
+        '''Returns the hash of everything but the board, given as arrays'''
+        agent_ids = np.arange(self.num_agents)
+        ret = _xor(self.agent_alive[np.asarray(alive, dtype=bool)])
+        ret ^= _xor(self.agent_ammo[agent_ids, _count(ammo)])
+        ret ^= _xor(self.agent_blast_strength[agent_ids,
+                                              _count(blast_strength)])
+        ret ^= _xor(self.agent_can_kick[np.asarray(can_kick, dtype=bool)])
+
+        items = np.asarray(items).ravel()
+        cells = np.flatnonzero(items)
+        ret ^= _xor(self.items[cells, items[cells]])
+
+        # flames is a bitmask per cell, bit k for a flame with life k.
+        flames = np.asarray(flames).ravel()
+        cells, lives = np.nonzero(
+            (flames[:, None] >> np.arange(8, dtype=flames.dtype)) & 1)
+        ret ^= _xor(self.flames[cells, lives])
+
+        ret ^= _xor(self.bomb_life[bomb_cells, _count(bomb_life)])
+        ret ^= _xor(self.bomb_blast_strength[bomb_cells,
+                                             _count(bomb_blast_strength)])
+        ret ^= _xor(self.bomb_bomber[bomb_cells, bomb_bomber])
+        ret ^= _xor(self.bomb_moving_direction[bomb_cells,
+                                               bomb_moving_direction])
+        return ret
+
+    def hash_pieces(self, agents, bombs, items, flames):
+        """Returns the hash of everything but the board.
+
+        Args:
+          agents: The list of agents, ordered by agent_id.
+          bombs: The list of Bomb objects.
+          items: Dict of position to the Item value hidden there.
+          flames: The list of Flame objects.
+        """
+        size = self.board_size
+        item_layer = np.zeros(size**2, dtype=np.uint8)
+        for (row, col), value in items.items():
+            item_layer[row * size + col] = value
+        flame_layer = np.zeros(size**2, dtype=np.uint8)
+        for flame in flames:
+            row, col = flame.position
+            flame_layer[row * size + col] |= 1 << flame.life
+
+        bomb_cells = np.array(
+            [row * size + col for row, col in (b.position for b in bombs)],
+            dtype=np.int64)
+        return self._hash_arrays(
+            [agent.is_alive for agent in agents],
+            [agent.ammo for agent in agents],
+            [agent.blast_strength for agent in agents],
+            [agent.can_kick for agent in agents], item_layer, flame_layer,
+            bomb_cells, [bomb.life for bomb in bombs],
+            [bomb.blast_strength for bomb in bombs],
+            np.array([bomb.bomber.agent_id for bomb in bombs],
+                     dtype=np.int64),
+            np.array([
+                bomb.moving_direction.value if bomb.is_moving() else 0
+                for bomb in bombs
+            ],
+                     dtype=np.int64))
+
+    def hash_game(self, board, agents, bombs, items, flames):
+        '''Returns the hash of a game in the representation of ForwardModel'''
+        return self.hash_board(board) ^ self.hash_pieces(
+            agents, bombs, items, flames)
+
+    def hash_state(self, state):
+        '''Returns the hash of a GameState'''
+        count = state.bomb_count
+        bomb_cells = state.bomb_position[:count, 0] * self.board_size + \
+            state.bomb_position[:count, 1]
+        return self.hash_board(state.board) ^ self._hash_arrays(
+            state.agent_alive, state.agent_ammo, state.agent_blast_strength,
+            state.agent_can_kick, state.items, state.flames, bomb_cells,
+            state.bomb_life[:count], state.bomb_blast_strength[:count],
+            state.bomb_bomber[:count], state.bomb_moving_direction[:count])
+
+
+@functools.lru_cache(maxsize=None)
+def get_table(board_size, num_agents=4):
+    '''Returns the shared ZobristTable for a board size and number of agents'''
+    return ZobristTable(board_size, num_agents)
+
+
+class ZobristHash(object):
+    """The running hash of one game, updated by ForwardModel.step."""
+
+    def __init__(self, board, agents, bombs, items, flames, table=None):
+        self.table = table or get_table(len(board), len(agents))
+        self._board_hash = self.table.hash_board(board)
+        self._pieces_hash = self.table.hash_pieces(agents, bombs, items,
+                                                   flames)
+
+    @property
+    def value(self):
+        return self._board_hash ^ self._pieces_hash
+
+    def update(self, old_board, board, agents, bombs, items, flames):
+        """Moves the hash from the game before a step to the one after it.
+
+        Args:
+          old_board: A copy of the board from before the step.
+          board: The board after the step.
+          agents: The agents after the step.
+          bombs: The bombs after the step.
+          items: The items after the step.
+          flames: The flames after the step.
+        """
+        old_board = np.asarray(old_board).ravel()
+        board = np.asarray(board).ravel()
+        cells = np.flatnonzero(old_board != board)
+        self._board_hash ^= _xor(self.table.board[cells, old_board[cells]])
+        self._board_hash ^= _xor(self.table.board[cells, board[cells]])
+        self._pieces_hash = self.table.hash_pieces(agents, bombs, items,
+                                                   flames)
+
+
+class TranspositionTable(object):
+    """A bounded map from state hashes to search results.
+
+    When full, the least recently used entry is dropped.
+    """
+
+    def __init__(self, max_size=100000):
+        assert max_size > 0
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        '''Returns the entry for key and marks it as recently used'''
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''Stores an entry, dropping the least recently used one if full'''
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -44,6 +44,8 @@ setup(name='pommerman',
       entry_points={
         'console_scripts': [
             'pom_battle=pommerman.cli.run_battle:main',
+            'pom_dataset=pommerman.cli.build_dataset:main',
+            'pom_league=pommerman.cli.run_league:main',
             'pom_tf_battle=pommerman.cli.train_with_tensorforce:main',
             'ion_client=pommerman.network.client:init',
             'ion_server=pommerman.network.server:init'
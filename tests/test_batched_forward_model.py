@@ -0,0 +1,71 @@
+'''Checks that BatchedForwardModel steps games like ForwardModel does.'''
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import characters
+from pommerman import constants
+from pommerman.batched_forward_model import BatchedForwardModel
+from pommerman.forward_model import ForwardModel
+
+
+def _snapshot(board, curr_agents, bombs, items, flames):
+    '''Returns a game as plain values that compare equal across models'''
+    return (board.tolist(), [(agent.agent_id, tuple(map(int, agent.position)),
+                              agent.is_alive, agent.ammo,
+                              agent.blast_strength, agent.can_kick)
+                             for agent in curr_agents],
+            [(tuple(map(int, bomb.position)), bomb.life, bomb.blast_strength,
+              bomb.bomber.agent_id, bomb.moving_direction) for bomb in bombs],
+            sorted((tuple(map(int, position)), value)
+                   for position, value in items.items()),
+            sorted((tuple(map(int, flame.position)), flame.life)
+                   for flame in flames))
+
+
+def _check_games(config, seed, num_games=3):
+    '''Steps seeded SimpleAgent games with both models side by side'''
+    random.seed(seed)
+    np.random.seed(seed)
+    envs = []
+    for num in range(num_games):
+        env = pommerman.make(config,
+                             [agents.SimpleAgent() for _ in range(4)])
+        env.seed(seed + num)
+        env.reset()
+        envs.append(env)
+
+    model = BatchedForwardModel(num_games, envs[0]._board_size)
+    for num, env in enumerate(envs):
+        model.set_game(num, env._board, env._agents, env._bombs, env._items,
+                       env._flames)
+    bombers = [[
+        characters.Bomber(agent_id, constants.GameType.FFA)
+        for agent_id in range(4)
+    ] for _ in envs]
+
+    for _ in range(200):
+        actions = np.array([env.act(env.get_observations()) for env in envs])
+        for num, env in enumerate(envs):
+            env._board, env._agents, env._bombs, env._items, env._flames = \
+                ForwardModel.step(list(actions[num]), env._board,
+                                  env._agents, env._bombs, env._items,
+                                  env._flames)
+        model.step(actions)
+        for num, env in enumerate(envs):
+            assert _snapshot(*model.get_game(num, bombers[num])) == \
+                _snapshot(env._board, env._agents, env._bombs, env._items,
+                          env._flames)
+    for env in envs:
+        env.close()
+
+
+def test_ffa_games():
+    for seed in range(2):
+        _check_games('PommeFFACompetition-v0', seed)
+
+
+def test_team_games():
+    _check_games('PommeTeamCompetition-v0', 10)
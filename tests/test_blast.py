@@ -0,0 +1,69 @@
+'''Checks the ray table chain resolution against the explode/in_range loop.'''
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import blast
+from pommerman import constants
+
+
+def _legacy_resolve_chain(board, bombs, exploding):
+    '''The chain loop ForwardModel.step ran before the ray tables'''
+    board_size = len(board)
+    exploded_map = np.zeros_like(board)
+    exploded = list(exploding)
+    remaining = [num for num in range(len(bombs)) if not exploded[num]]
+    new_explosions = [num for num in range(len(bombs)) if exploded[num]]
+    while new_explosions:
+        for num in new_explosions:
+            for _, indices in bombs[num].explode().items():
+                for r, c in indices:
+                    if not all(
+                        [r >= 0, c >= 0, r < board_size, c < board_size]):
+                        break
+                    if board[r][c] == constants.Item.Rigid.value:
+                        break
+                    exploded_map[r][c] = 1
+                    if board[r][c] == constants.Item.Wood.value:
+                        break
+        new_explosions = [
+            num for num in remaining if bombs[num].in_range(exploded_map)
+        ]
+        remaining = [num for num in remaining if num not in new_explosions]
+        for num in new_explosions:
+            exploded[num] = True
+    return exploded, exploded_map == 1
+
+
+def test_seeded_games():
+    checked = 0
+    for seed in range(3):
+        random.seed(seed)
+        np.random.seed(seed)
+        env = pommerman.make('PommeFFACompetition-v0',
+                             [agents.SimpleAgent() for _ in range(4)])
+        env.seed(seed)
+        obs = env.reset()
+        done = False
+        while not done:
+            bombs = env._bombs
+            positions = [bomb.position for bomb in bombs]
+            strengths = [bomb.blast_strength for bomb in bombs]
+            # Set off each bomb on its own, as well as the ones due to.
+            for first in range(len(bombs)):
+                exploding = [
+                    num == first or bomb.life == 1
+                    for num, bomb in enumerate(bombs)
+                ]
+                exploded, exploded_map = blast.resolve_chain(
+                    env._board, positions, strengths, exploding)
+                legacy_exploded, legacy_map = _legacy_resolve_chain(
+                    env._board, bombs, exploding)
+                assert exploded.tolist() == legacy_exploded
+                assert (exploded_map == legacy_map).all()
+                checked += 1
+            obs, _, done, _ = env.step(env.act(obs))
+        env.close()
+    assert checked
@@ -0,0 +1,115 @@
+'''Checks SimpleAgent's BFS distance field against its old queue search.'''
+from collections import defaultdict
+import queue
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import board_analysis
+from pommerman import constants
+from pommerman import utility
+
+
+def _legacy_djikstra(board, my_position, bombs, enemies, depth):
+    '''The queue-based search SimpleAgent._djikstra used to run'''
+    exclude = [constants.Item.Fog, constants.Item.Rigid, constants.Item.Flames]
+
+    def out_of_range(p_1, p_2):
+        x_1, y_1 = p_1
+        x_2, y_2 = p_2
+        return abs(y_2 - y_1) + abs(x_2 - x_1) > depth
+
+    items = defaultdict(list)
+    dist = {}
+    prev = {}
+    Q = queue.Queue()
+
+    my_x, my_y = my_position
+    for r in range(max(0, my_x - depth), min(len(board), my_x + depth)):
+        for c in range(max(0, my_y - depth), min(len(board), my_y + depth)):
+            position = (r, c)
+            if any([
+                    out_of_range(my_position, position),
+                    utility.position_in_items(board, position, exclude),
+            ]):
+                continue
+
+            prev[position] = None
+            item = constants.Item(board[position])
+            items[item].append(position)
+
+            if position == my_position:
+                Q.put(position)
+                dist[position] = 0
+            else:
+                dist[position] = np.inf
+
+    for bomb in bombs:
+        if bomb['position'] == my_position:
+            items[constants.Item.Bomb].append(my_position)
+
+    while not Q.empty():
+        position = Q.get()
+
+        if utility.position_is_passable(board, position, enemies):
+            x, y = position
+            val = dist[(x, y)] + 1
+            for row, col in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                new_position = (row + x, col + y)
+                if new_position not in dist:
+                    continue
+
+                if val < dist[new_position]:
+                    dist[new_position] = val
+                    prev[new_position] = position
+                    Q.put(new_position)
+                elif (val == dist[new_position] and random.random() < .5):
+                    dist[new_position] = val
+                    prev[new_position] = position
+
+    return items, dist, prev
+
+
+def _check(obs, seed):
+    analysis = board_analysis.BoardAnalysis.get(obs)
+    my_position = tuple(obs['position'])
+    board = np.array(obs['board'])
+    enemies = [constants.Item(e) for e in obs['enemies']]
+
+    random.seed(seed)
+    items, dist, prev = agents.SimpleAgent._djikstra(
+        board, my_position, analysis.bombs, enemies, depth=10,
+        analysis=analysis)
+    random.seed(seed)
+    legacy_items, legacy_dist, legacy_prev = _legacy_djikstra(
+        board, my_position, analysis.bombs, enemies, depth=10)
+
+    assert {item: positions for item, positions in items.items()
+            if positions} == dict(legacy_items)
+    assert np.count_nonzero(~np.isnan(dist)) == len(legacy_dist)
+    size = len(board)
+    for position, distance in legacy_dist.items():
+        assert dist[position] == distance
+        expected = legacy_prev[position]
+        assert prev[position] == (
+            -1 if expected is None else expected[0] * size + expected[1])
+
+
+def test_seeded_games():
+    for seed in range(2):
+        random.seed(seed)
+        np.random.seed(seed)
+        env = pommerman.make('PommeFFACompetition-v0',
+                             [agents.SimpleAgent() for _ in range(4)])
+        env.set_board_analysis(True)
+        env.seed(seed)
+        obs = env.reset()
+        done = False
+        while not done:
+            for agent_obs in obs:
+                if agent_obs['step_count'] % 5 == 0:
+                    _check(agent_obs, seed)
+            obs, _, done, _ = env.step(env.act(obs))
+        env.close()
@@ -0,0 +1,61 @@
+'''Checks the flat and planar layouts of featurize_batch.'''
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+
+
+def _planar(flat, size):
+    '''Returns the planar layout of the flat features of featurize'''
+    bss = size**2
+    num_scalars = len(flat[0]) - 3 * bss - 2
+    ret = np.zeros((len(flat), 4 + num_scalars, size, size),
+                   dtype=np.float32)
+    for num in range(len(flat)):
+        for channel in range(3):
+            ret[num, channel] = flat[num, channel * bss:(channel + 1) *
+                                     bss].reshape(size, size)
+        row, col = flat[num, 3 * bss:3 * bss + 2].astype(int)
+        ret[num, 3, row, col] = 1
+        ret[num, 4:] = flat[num, 3 * bss + 2:, None, None]
+    return ret
+
+
+def _check_games(config, agent_class, seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    env = pommerman.make(config, [agent_class() for _ in range(4)])
+    env.seed(seed)
+    obs = env.reset()
+    size = env._board_size
+    done = False
+    while not done:
+        expected = np.stack([env.featurize(o) for o in obs])
+        features = env.featurize_batch(obs)
+        assert features.dtype == np.float32
+        assert (features == expected).all()
+
+        planar = env.featurize_batch(obs, planar=True)
+        assert planar.dtype == np.float32
+        assert (planar == _planar(expected, size)).all()
+
+        # The features are written into out, which is returned.
+        out = np.full(features.shape, np.nan, dtype=np.float32)
+        assert env.featurize_batch(obs, out=out) is out
+        assert (out == expected).all()
+        out = np.full(planar.shape, np.nan, dtype=np.float32)
+        assert env.featurize_batch(obs, out=out, planar=True) is out
+        assert (out == planar).all()
+
+        obs, _, done, _ = env.step(env.act(obs))
+    env.close()
+
+
+def test_ffa_games():
+    _check_games('PommeFFACompetition-v0', agents.SimpleAgent, 0)
+
+
+def test_radio_games():
+    _check_games('PommeRadioCompetition-v2', agents.RandomAgent, 1)
@@ -0,0 +1,50 @@
+'''Checks the flame_time danger map against stepping the forward model.'''
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import characters
+from pommerman import constants
+from pommerman.forward_model import ForwardModel
+
+
+def _simulated_flame_time(env, num_steps=20):
+    '''Returns when each cell first burns if every agent stops from now on'''
+    board, curr_agents, bombs, items, flames = env.get_game_state().to_game([
+        characters.Bomber(agent.agent_id, env._game_type)
+        for agent in env._agents
+    ])
+    ret = np.full(board.shape, np.inf)
+    ret[board == constants.Item.Flames.value] = 0
+    stop = [constants.Action.Stop.value] * len(curr_agents)
+    for step in range(1, num_steps + 1):
+        board, curr_agents, bombs, items, flames = ForwardModel.step(
+            stop, board, curr_agents, bombs, items, flames)
+        burning = (board == constants.Item.Flames.value) & np.isinf(ret)
+        ret[burning] = step
+    return ret
+
+
+def test_seeded_games():
+    checked = 0
+    for seed in range(3):
+        random.seed(seed)
+        np.random.seed(seed)
+        env = pommerman.make('PommeFFACompetition-v0',
+                             [agents.SimpleAgent() for _ in range(4)])
+        env.seed(seed)
+        obs = env.reset()
+        done = False
+        while not done:
+            # The map assumes that the bombs stay where they are.
+            if env._bombs and not any(
+                    bomb.is_moving() for bomb in env._bombs):
+                expected = _simulated_flame_time(env)
+                assert (ForwardModel.get_flame_time(
+                    env._board, env._bombs) == expected).all()
+                checked += 1
+            obs, _, done, _ = env.step(env.act(obs))
+        env.close()
+    assert checked
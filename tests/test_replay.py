@@ -0,0 +1,85 @@
+'''Checks that a Replay rebuilds the states of a recorded game.'''
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import constants
+from pommerman import replay
+
+
+class _StopAgent(agents.BaseAgent):
+    '''Stays put, so that the game lasts until the board collapses'''
+
+    def act(self, obs, action_space):
+        return constants.Action.Stop.value
+
+
+def _check_game(config, agent_list, seed, keyframe_interval=7):
+    """Records a game, then seeks its replay to every step.
+
+    Returns:
+      The env and how many steps the game lasted.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    env = pommerman.make(config, agent_list)
+    env.seed(seed)
+    obs = env.reset()
+    states = [env.get_game_state()]
+    messages = [[o.get('message') for o in obs]]
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'game.replay')
+        with replay.ReplayWriter(
+                path, ['simple::'] * 4, config,
+                keyframe_interval=keyframe_interval) as writer:
+            writer.start(env)
+            done = False
+            while not done:
+                actions = env.act(obs)
+                obs, _, done, info = env.step(actions)
+                writer.step(actions, env)
+                states.append(env.get_game_state())
+                messages.append([o.get('message') for o in obs])
+            writer.close(info, '')
+        env.close()
+
+        game_replay = replay.Replay.load(path)
+        assert game_replay.first_step == 0
+        assert game_replay.last_step == len(states) - 1
+        steps = list(range(len(states)))
+        # In order, which only steps forward, then in an order that also
+        # restores keyframes and goes back to the first step.
+        for step in steps + random.Random(seed).sample(steps, len(steps)):
+            assert game_replay.get_state(step) == states[step]
+            assert [
+                o.get('message')
+                for o in game_replay.get_observations(step)
+            ] == messages[step]
+        game_replay.close()
+    finally:
+        shutil.rmtree(directory)
+    return env, len(states) - 1
+
+
+def test_ffa_game():
+    _check_game('PommeFFACompetition-v0',
+                [agents.SimpleAgent() for _ in range(4)], 0)
+
+
+def test_collapse_game():
+    env, steps = _check_game('PommeTeamCompetition-v1',
+                             [_StopAgent() for _ in range(4)], 0,
+                             keyframe_interval=50)
+    assert steps > env.collapses[0]
+
+
+def test_radio_game():
+    _check_game('PommeRadioCompetition-v2',
+                [agents.SimpleAgent() for _ in range(4)], 1)
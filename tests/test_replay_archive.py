@@ -0,0 +1,117 @@
+'''Checks appending to and reading from a ReplayArchive.'''
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+
+from pommerman.replay_archive import ReplayArchive
+
+
+def _steps(match_id, num_steps):
+    return [[match_id, step, [step % 6] * 4] for step in range(num_steps)]
+
+
+def _append_matches(directory, writer, num_matches):
+    archive = ReplayArchive(directory)
+    for num in range(num_matches):
+        match_id = 'writer%d-%d' % (writer, num)
+        archive.append(match_id, {'writer': writer}, _steps(match_id, num))
+
+
+class _Directory(object):
+    '''A temporary directory for an archive'''
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self.path
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def test_concurrent_writers():
+    with _Directory() as directory:
+        processes = [
+            multiprocessing.Process(
+                target=_append_matches, args=(directory, writer, 20))
+            for writer in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        archive = ReplayArchive(directory)
+        assert len(archive) == 80
+        for writer in range(4):
+            for num in range(20):
+                match_id = 'writer%d-%d' % (writer, num)
+                assert archive.get(match_id) == ({
+                    'writer': writer
+                }, _steps(match_id, num))
+
+
+def test_index_recovery():
+    with _Directory() as directory:
+        _append_matches(directory, 0, 10)
+        index_path = ReplayArchive(directory).index_path
+
+        # A writer that died in the middle of indexing its match.
+        with open(index_path, 'rb') as f:
+            lines = f.readlines()
+        with open(index_path, 'wb') as f:
+            f.writelines(lines[:6])
+            f.write(lines[6][:5])
+        archive = ReplayArchive(directory)
+        assert sorted(archive.ids()) == sorted(
+            'writer0-%d' % num for num in range(10))
+        assert archive.get_steps('writer0-9') == _steps('writer0-9', 9)
+
+        # The next append replaces the cut line with the missing entries.
+        archive.append('late', {}, [])
+        with open(index_path) as f:
+            assert len(f.readlines()) == 11
+        archive = ReplayArchive(directory)
+        assert archive._indexed_end == os.path.getsize(archive.segment_path)
+        assert len(archive) == 11
+
+        os.remove(index_path)
+        archive = ReplayArchive(directory)
+        assert len(archive) == 11
+        assert archive.get_meta('writer0-3') == {'writer': 0}
+        assert archive.get_steps('writer0-7') == _steps('writer0-7', 7)
+
+
+def test_duplicate_id():
+    with _Directory() as directory:
+        archive = ReplayArchive(directory)
+        archive.append('match', {'num': 1}, [1, 2])
+        try:
+            ReplayArchive(directory).append('match', {'num': 2}, [3])
+        except KeyError:
+            pass
+        else:
+            assert False, 'A match id was archived twice'
+        assert ReplayArchive(directory).get('match') == ({'num': 1}, [1, 2])
+
+
+def test_step_ranges():
+    rng = random.Random(0)
+    with _Directory() as directory:
+        archive = ReplayArchive(directory)
+        matches = {}
+        for num_steps in [0, 1, 2, 17]:
+            match_id = 'match%d' % num_steps
+            matches[match_id] = _steps(match_id, num_steps)
+            archive.append(match_id, {}, matches[match_id])
+
+        for match_id, steps in matches.items():
+            assert archive.num_steps(match_id) == len(steps)
+            assert archive.get_steps(match_id) == steps
+            for _ in range(50):
+                start = rng.randint(-20, 20)
+                stop = rng.choice([None, rng.randint(-20, 20)])
+                assert archive.get_steps(match_id, start, stop) == \
+                    steps[start:stop]
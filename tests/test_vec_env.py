@@ -0,0 +1,48 @@
+'''Checks that the actions of act can be passed back to step.'''
+import unittest
+
+import numpy as np
+
+from pommerman import agents
+from pommerman import constants
+from pommerman import vec_env
+
+
+def _radio_agents():
+    # SimpleAgents act with plain actions and RandomAgents with words too.
+    return [
+        agents.SimpleAgent(),
+        agents.RandomAgent(),
+        agents.SimpleAgent(),
+        agents.RandomAgent()
+    ]
+
+
+def test_subproc_radio_act_step():
+    if vec_env.shared_memory is None:
+        raise unittest.SkipTest('SubprocVecEnv needs python 3.8')
+    envs = vec_env.SubprocVecEnv(
+        'PommeRadioCompetition-v2', 2, _radio_agents, num_workers=2)
+    try:
+        envs.seed(0)
+        obs = envs.reset()
+        for _ in range(20):
+            actions = envs.act()
+            obs, _, dones, _ = envs.step(actions)
+            for num_env, env_actions in enumerate(actions):
+                if dones[num_env]:
+                    continue
+                for agent_id, action in enumerate(env_actions):
+                    # Agents 0 and 2, and 1 and 3 are teammates.
+                    teammate = (agent_id + 2) % 4
+                    words = [0, 0] if isinstance(action, int) \
+                        else list(action[1:])
+                    assert obs['message'][num_env, teammate].tolist() == words
+    finally:
+        envs.close()
+
+
+def test_action_row():
+    assert vec_env._action_row(constants.Action.Up.value, 3) == [1, 0, 0]
+    assert vec_env._action_row(np.int64(4), 1) == [4]
+    assert vec_env._action_row((5, 2, 7), 3) == [5, 2, 7]
@@ -0,0 +1,122 @@
+'''Checks the incremental Zobrist hash and the transposition table.'''
+import random
+
+import numpy as np
+
+import pommerman
+from pommerman import agents
+from pommerman import constants
+from pommerman import zobrist
+
+
+class _StopAgent(agents.BaseAgent):
+    '''Stays put, so that the game lasts until the board collapses'''
+
+    def act(self, obs, action_space):
+        return constants.Action.Stop.value
+
+
+def _full_hash(env):
+    table = zobrist.get_table(env._board_size, len(env._agents))
+    return table.hash_game(env._board, env._agents, env._bombs, env._items,
+                           env._flames)
+
+
+def _check_game(config, agent_list, seed):
+    """Plays a game, comparing the kept hash with a full one every step.
+
+    Returns:
+      The env and how many steps the game lasted.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    env = pommerman.make(config, agent_list)
+    env.set_state_hashing(True)
+    env.seed(seed)
+    obs = env.reset()
+    saved = None
+    done = False
+    while not done:
+        state_hash = env.get_state_hash()
+        # The hash is kept, for step to update rather than made anew.
+        assert env._state_hash is not None
+        assert state_hash == _full_hash(env)
+        assert state_hash == zobrist.get_table(
+            env._board_size).hash_state(env.get_game_state())
+        if env._step_count == 20:
+            saved = env.get_game_state(), state_hash
+        obs, _, done, _ = env.step(env.act(obs))
+    steps = env._step_count
+
+    # Restoring a state gives its hash back, and stepping on from there
+    # keeps it up to date.
+    state, state_hash = saved
+    env.set_game_state(state)
+    assert env.get_state_hash() == state_hash
+    obs = env.get_observations()
+    for _ in range(10):
+        obs, _, done, _ = env.step(env.act(obs))
+        assert env.get_state_hash() == _full_hash(env)
+        if done:
+            break
+    env.close()
+    return env, steps
+
+
+def test_v0_games():
+    for seed in range(2):
+        _check_game('PommeFFACompetition-v0',
+                    [agents.SimpleAgent() for _ in range(4)], seed)
+
+
+def test_v1_collapse():
+    env, steps = _check_game('PommeTeamCompetition-v1',
+                             [_StopAgent() for _ in range(4)], 0)
+    assert steps > env.collapses[0]
+
+
+def test_v2_games():
+    _check_game('PommeRadioCompetition-v2',
+                [agents.SimpleAgent() for _ in range(4)], 1)
+
+
+def test_state_hashing_off():
+    env = pommerman.make('PommeFFACompetition-v0',
+                         [agents.SimpleAgent() for _ in range(4)])
+    env.seed(0)
+    obs = env.reset()
+    for _ in range(10):
+        obs, _, _, _ = env.step(env.act(obs))
+        assert env.get_state_hash() == _full_hash(env)
+    # Without set_state_hashing, step doesn't keep a hash.
+    assert env._state_hash is None
+    env.close()
+
+
+def test_transposition_table_lru():
+    table = zobrist.TranspositionTable(max_size=2)
+    table.put(1, 'a')
+    table.put(2, 'b')
+    # Using 1 makes 2 the least recently used entry.
+    assert table.get(1) == 'a'
+    table.put(3, 'c')
+    assert 2 not in table
+    assert 1 in table and 3 in table
+    assert len(table) == 2
+    table.put(1, 'd')
+    table.put(4, 'e')
+    assert 3 not in table
+    assert table.get(1) == 'd'
+
+
+def test_transposition_table_counts():
+    table = zobrist.TranspositionTable()
+    assert table.get(1) is None
+    table.put(1, 'a')
+    assert table.get(1) == 'a'
+    assert table.get(1) == 'a'
+    assert table.get(2, 'default') == 'default'
+    assert (table.hits, table.misses) == (2, 2)
+    table.clear()
+    assert len(table) == 0
+    assert (table.hits, table.misses) == (0, 0)